@@ -0,0 +1,300 @@
+"""
+Headless command line interface for scripts (login hooks, VPN hooks, ...). It talks to the proxy backends directly and
+never imports Tk or requests, so a call takes as long as the registry access or `networksetup` call behind it.
+
+    python cli.py status [--json]
+    python cli.py enable [--json]
+    python cli.py disable [--json]
+    python cli.py set <host>:<port> [--json]
+    python cli.py daemon
+    python cli.py forward [--upstream <host>:<port> ...] [--port <port>] [--apply]
+    python cli.py probe [<host>:<port> ...] [--timeout <seconds>] [--apply] [--json]
+    python cli.py pac [--port <port>] [--print] [--apply]
+    python cli.py bypass show|apply
+    python cli.py bypass import <file> [--replace] [--apply]
+    python cli.py bypass test <url> ...
+
+While the daemon runs (`cli.py daemon`), the commands are answered from its memory. `--direct` bypasses it.
+`forward` runs the local forwarding proxy (see `modules.forwarder`), `--apply` points the system proxy at it.
+`probe` measures the latency of candidate proxies (see `modules.latency`), `--apply` sets the fastest one.
+`pac` serves a PAC script generated from the `pac_rules` setting (see `modules.pac`), `--apply` registers it.
+`bypass` manages the destinations that skip the proxy (see `modules.bypass`), kept in the `bypass_list` setting.
+
+Exit code 0 means the command succeeded, 1 that the change could not be applied and 2 that the arguments were wrong.
+"""
+import argparse
+import platform
+import logging
+import json
+import sys
+from modules import daemon
+
+
+def load_backend(direct=False):
+    """
+    Connects to the daemon, or imports the proxy backend of the running operating system if none is running.
+
+    Args:
+        direct (bool, optional): Whether to skip the daemon. Defaults to False.
+
+    Returns:
+        `daemon.RemoteProxy`, `modules.proxy` on Windows, `modules.proxy_macOS` on macOS, None elsewhere.
+    """
+    if not direct:
+        client = daemon.connect()
+        if client is not None:
+            return daemon.RemoteProxy(client)
+    if platform.system() == "Darwin":
+        import modules.proxy_macOS as proxy
+    elif platform.system() == "Windows":
+        import modules.proxy as proxy
+    else:
+        return None
+    return proxy
+
+
+def address(value):
+    """Validates a `host:port` argument."""
+    host, _, port = value.rpartition(":")
+    if not host or not port.isdigit() or not 0 < int(port) < 65536:
+        raise argparse.ArgumentTypeError(f"expected host:port, got {value!r}")
+    return value
+
+
+def status(proxy):
+    """Reads the current proxy state."""
+    if isinstance(proxy, daemon.RemoteProxy):
+        return proxy.status()
+    return {"enabled": proxy.status_check(), "server": proxy.server_check()}
+
+
+def forward(parser, args):
+    """Runs the local forwarding proxy until interrupted."""
+    from modules import forwarder, settings
+    settings_data = settings.load_settings()
+    upstreams = args.upstream or settings_data["upstream_proxies"]
+    port = args.port or settings_data["forwarder_port"]
+    if not upstreams:
+        parser.exit(2, "No upstream proxies, pass --upstream or set upstream_proxies in the settings.\n")
+    if args.apply:
+        proxy = load_backend(args.direct)
+        if proxy is None:
+            parser.exit(1, f"{platform.system()} is not supported.\n")
+        if not (proxy.change_address(f"127.0.0.1:{port}") and proxy.activate()):
+            parser.exit(1, "Could not point the system proxy at the local proxy, run with -v for details.\n")
+    logging.getLogger().setLevel(logging.INFO)
+    forwarder.run(upstreams, port=port)
+    return 0
+
+
+def probe(parser, args):
+    """Measures the candidate proxies and prints their latency percentiles, fastest first."""
+    from modules import latency, settings
+    candidates = args.candidates or settings.load_settings()["proxy_candidates"]
+    if not candidates:
+        parser.exit(2, "No candidates, pass them as arguments or set proxy_candidates in the settings.\n")
+    if args.apply:
+        proxy = load_backend(args.direct)
+        if proxy is None:
+            parser.exit(1, f"{platform.system()} is not supported.\n")
+        applied, results = latency.apply_fastest(proxy, candidates, args.timeout)
+        ok = applied is not None
+    else:
+        results = latency.run_sweep(candidates, args.timeout)
+        applied, ok = None, any(result["ok"] for result in results)
+
+    if args.json:
+        print(json.dumps({"results": results, "applied": applied}))
+    else:
+        for result in results:
+            if result["ok"]:
+                print(f"{result['address']:<28} p50 {result['p50']:7.1f} ms  p90 {result['p90']:7.1f} ms  "
+                      f"p99 {result['p99']:7.1f} ms  ({len(result['handshake'])}/"
+                      f"{len(result['handshake']) + len(result['errors'])} answered)")
+            else:
+                print(f"{result['address']:<28} unreachable: {result['errors'][0]}")
+        if applied:
+            print(f"applied {applied}")
+    return 0 if ok else 1
+
+
+def serve_pac(parser, args):
+    """Generates the PAC script and serves it until interrupted."""
+    import time
+    from modules import pac, settings
+    settings_data = settings.load_settings()
+    try:
+        script = pac.generate(settings_data["pac_rules"], settings_data["pac_default"])
+    except (ValueError, KeyError, TypeError) as e:
+        parser.exit(2, f"The pac_rules setting is invalid: {e}\n")
+    if args.print:
+        print(script, end="")
+        return 0
+
+    server = pac.PacServer(script, port=args.port or settings_data["pac_port"])
+    server.start()
+    proxy = None
+    if args.apply:
+        proxy = load_backend(args.direct)
+        if proxy is None:
+            parser.exit(1, f"{platform.system()} is not supported.\n")
+        if not proxy.set_autoconfig_url(server.url):
+            parser.exit(1, "Could not register the PAC script, run with -v for details.\n")
+    print(server.url)
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        if proxy is not None:
+            # browsers would fail to fetch the script once the server is gone
+            proxy.set_autoconfig_url("")
+        server.stop()
+    return 0
+
+
+def manage_bypass(parser, args):
+    """Shows, imports, tests or applies the bypass list."""
+    import time
+    from modules import bypass, settings
+    entries = settings.load_settings()["bypass_list"]
+
+    if args.bypass_command == "import":
+        try:
+            imported = bypass.read_entries(args.file)
+        except OSError as e:
+            parser.exit(2, f"Can not read {args.file}: {e}\n")
+        before = 0 if args.replace else len(entries)
+        entries = bypass.normalize(imported + ([] if args.replace else entries))
+        settings.update_settings(bypass_list=entries)
+        result = {"imported": len(imported), "before": before, "entries": len(entries)}
+        text = f"read {len(imported)} entries, the list has {len(entries)} entries (before: {before})"
+        if not args.apply:
+            print(json.dumps(result) if args.json else text)
+            return 0
+
+    if args.bypass_command == "test":
+        matcher = bypass.BypassMatcher(entries)
+        results = []
+        for url in args.urls:
+            start = time.perf_counter()
+            bypasses = matcher.bypasses(url)
+            results.append({"url": url, "bypass": bypasses, "us": (time.perf_counter() - start) * 1e6})
+        if args.json:
+            print(json.dumps(results))
+        else:
+            for result in results:
+                print(f"{result['url']}: {'bypass' if result['bypass'] else 'proxy'} ({result['us']:.1f} µs)")
+        return 0
+
+    if args.bypass_command == "show":
+        print(json.dumps(entries) if args.json else "\n".join(entries))
+        return 0
+
+    # apply, or import --apply
+    proxy = load_backend(args.direct)
+    if proxy is None:
+        parser.exit(1, f"{platform.system()} is not supported.\n")
+    if platform.system() == "Windows" and len(";".join(bypass.windows_entries(entries))) > bypass.OVERRIDE_LIMIT:
+        logging.warning(f"The bypass list is longer than {bypass.OVERRIDE_LIMIT} characters, "
+                        "some applications may ignore its end.")
+    ok = proxy.set_bypass(entries)
+    print(json.dumps({"command": "bypass", "ok": ok, "entries": len(entries)}) if args.json
+          else ("done" if ok else "bypass failed, run with -v for details"))
+    return 0 if ok else 1
+
+
+def main(argv=None):
+    options = argparse.ArgumentParser(add_help=False)
+    options.add_argument("--json", action="store_true",
+                         help="print the result as JSON")
+    options.add_argument("-v", "--verbose", action="store_true",
+                         help="log what is done to stderr")
+    options.add_argument("--direct", action="store_true",
+                         help="change the system settings directly, even if the daemon is running")
+    parser = argparse.ArgumentParser(
+        prog="proxy-settings", description="Change the system proxy without opening the app.")
+    commands = parser.add_subparsers(dest="command", required=True)
+    commands.add_parser("status", parents=[options],
+                        help="show whether the proxy is enabled and which server is set")
+    commands.add_parser("enable", parents=[options], help="turn the proxy on")
+    commands.add_parser("disable", parents=[options], help="turn the proxy off")
+    set_parser = commands.add_parser("set", parents=[options], help="change the proxy server")
+    set_parser.add_argument("address", type=address, help="the new server as host:port")
+    commands.add_parser("daemon", help="keep the proxy and Wi-Fi state in memory and serve it to other calls")
+    forward_parser = commands.add_parser(
+        "forward", parents=[options], help="run a local proxy that fails over between upstream proxies")
+    forward_parser.add_argument("--upstream", type=address, action="append",
+                                help="an upstream proxy as host:port, repeat in the order of preference "
+                                     "(default: upstream_proxies from the settings)")
+    forward_parser.add_argument("--port", type=int, help="the local port (default: forwarder_port from the settings)")
+    forward_parser.add_argument("--apply", action="store_true",
+                                help="point the system proxy at the local proxy and turn it on")
+    probe_parser = commands.add_parser(
+        "probe", parents=[options], help="measure the latency of candidate proxies")
+    probe_parser.add_argument("candidates", type=address, nargs="*",
+                              help="the proxies as host:port (default: proxy_candidates from the settings)")
+    probe_parser.add_argument("--timeout", type=float, default=2.0,
+                              help="seconds a single measurement may take (default: 2)")
+    probe_parser.add_argument("--apply", action="store_true", help="set the fastest healthy proxy")
+    pac_parser = commands.add_parser(
+        "pac", parents=[options], help="serve a PAC script generated from the pac_rules setting")
+    pac_parser.add_argument("--port", type=int, help="the local port (default: pac_port from the settings)")
+    pac_parser.add_argument("--print", action="store_true", help="print the script instead of serving it")
+    pac_parser.add_argument("--apply", action="store_true",
+                            help="register the script with the system while it is served")
+    bypass_parser = commands.add_parser("bypass", help="manage the destinations that skip the proxy")
+    bypass_commands = bypass_parser.add_subparsers(dest="bypass_command", required=True)
+    bypass_commands.add_parser("show", parents=[options], help="print the bypass list")
+    bypass_commands.add_parser("apply", parents=[options], help="write the bypass list to the system")
+    import_parser = bypass_commands.add_parser(
+        "import", parents=[options], help="add the entries of a file, dropping duplicates and covered entries")
+    import_parser.add_argument("file", help="entries separated by new lines, commas or semicolons, # for comments")
+    import_parser.add_argument("--replace", action="store_true", help="replace the list instead of adding to it")
+    import_parser.add_argument("--apply", action="store_true", help="write the list to the system afterwards")
+    test_parser = bypass_commands.add_parser("test", parents=[options], help="check whether URLs skip the proxy")
+    test_parser.add_argument("urls", nargs="+", help="URLs, host names or addresses")
+    args = parser.parse_args(argv)
+
+    if args.command == "daemon":
+        logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s - %(message)s")
+        daemon.run()
+        return 0
+
+    logging.basicConfig(level=logging.INFO if args.verbose else logging.WARNING,
+                        format="%(levelname)s - %(message)s", stream=sys.stderr)
+
+    if args.command == "forward":
+        return forward(parser, args)
+    if args.command == "probe":
+        return probe(parser, args)
+    if args.command == "pac":
+        return serve_pac(parser, args)
+    if args.command == "bypass":
+        return manage_bypass(parser, args)
+
+    proxy = load_backend(args.direct)
+    if proxy is None:
+        parser.exit(1, f"{platform.system()} is not supported.\n")
+
+    if args.command == "status":
+        result = status(proxy)
+        ok = True
+        text = f"proxy {'enabled' if result['enabled'] else 'disabled'} ({result['server']})"
+    else:
+        if args.command == "enable":
+            ok = proxy.activate()
+        elif args.command == "disable":
+            ok = proxy.deactivate()
+        else:
+            ok = proxy.change_address(args.address)
+        result = {"command": args.command, "ok": ok}
+        text = "done" if ok else f"{args.command} failed, run with -v for details"
+
+    print(json.dumps(result) if args.json else text)
+    return 0 if ok else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,101 @@
+"""
+Starts the current install slot of Proxy Settings and rolls back to the previous slot if a freshly installed version
+does not start. Build it as a separate small executable next to the `slots` directory (see pyinstaller-config.md):
+
+    python launcher.pyw              start the current slot
+    python launcher.pyw --rollback   switch back to the previous slot and start it
+"""
+from modules import slots, updater
+import subprocess
+import time
+import sys
+import os
+
+name = "Proxy Settings"
+
+
+def launcher_command():
+    """Returns the command that starts this launcher, the app uses it to restart after an update."""
+    if getattr(sys, "frozen", False):
+        return [sys.executable]
+    return [sys.executable, os.path.abspath(__file__)]
+
+
+def start(root, slot):
+    """
+    Starts the app of a slot.
+
+    Returns:
+        subprocess.Popen: The started process, or None if the slot has no app.
+    """
+    path = slots.executable(root, slot, name)
+    if path is None:
+        return None
+    # `open -W` stays alive until the app quits, so that its exit can be noticed
+    command = ["open", "-W", "-n", path] if path.endswith(".app") else [path]
+    return subprocess.Popen(command, cwd=os.path.dirname(path))
+
+
+def roll_back(root, reason):
+    """Switches to the previous slot and reports why, the next app start logs it."""
+    failed = slots.load_state(root)["current"]
+    slot = slots.rollback(root)
+    if slot:
+        updater.write_status(
+            "health", False, f"{reason}, rolled back from {failed} to {slot}")
+    return slot
+
+
+def watch(root, process):
+    """
+    Waits for a pending slot to confirm its start. If the app exits before it confirmed, the previous slot is
+    restored and started instead. If it neither exits nor confirms in time, the next launch rolls back.
+    """
+    deadline = time.monotonic() + slots.HEALTH_TIMEOUT
+    while time.monotonic() < deadline:
+        try:
+            code = process.wait(timeout=0.5)
+        except subprocess.TimeoutExpired:
+            if not slots.load_state(root)["pending"]:
+                return
+            continue
+        if slots.load_state(root)["pending"]:
+            slot = roll_back(
+                root, f"The new version exited with code {code} before it started")
+            if slot:
+                start(root, slot)
+        return
+
+
+def main(argv):
+    root = os.path.join(os.path.dirname(launcher_command()[-1]), "slots")
+    state = slots.load_state(root)
+    if state["launcher"] != launcher_command():
+        state["launcher"] = launcher_command()
+        slots.save_state(root, state)
+
+    if "--rollback" in argv:
+        roll_back(root, "Rollback requested")
+    elif state["pending"] and state["attempts"] >= 1:
+        # the last start of this slot never confirmed
+        roll_back(root, "The new version did not start")
+
+    state = slots.load_state(root)
+    if state["current"] is None:
+        sys.exit(f"No version of {name} is installed in {root}.")
+    if state["pending"]:
+        state["attempts"] += 1
+        slots.save_state(root, state)
+
+    process = start(root, state["current"])
+    if process is None:
+        slot = roll_back(root, f"{state['current']} is missing its app")
+        process = start(root, slot) if slot else None
+        if process is None:
+            sys.exit(f"No version of {name} is installed in {root}.")
+    elif state["pending"]:
+        watch(root, process)
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
@@ -1,13 +1,17 @@
-from packaging.version import Version
-from modules.UpdateUi import UpdateUi
-from modules.ProxyUi import ProxyUi
-from modules.SettingsUi import SettingsUi
-import platform
-import customtkinter
-import requests
-import logging
-import json
-import os
+# start the profilers requested with --profile-startup/--profile before anything else is imported
+from modules import profiler
+profiler.setup()
+
+# requests, packaging and the update ui are only imported once they are needed, see test/import_time.py
+with profiler.span("imports"):
+    from modules.ProxyUi import ProxyUi
+    from modules.startup import StartupProbes
+    from modules import settings, slots, updater
+    import platform
+    import customtkinter
+    import logging
+    import time
+    import os
 
 version = "1.5"
 
@@ -29,25 +33,98 @@ class RootApp(customtkinter.CTk):
         self.wm_iconbitmap(os.path.join(image_path, "verbindung.ico"))
 
         # set theme
-        customtkinter.set_appearance_mode("dark")
-        customtkinter.set_default_color_theme(
-            os.path.join(theme_path, "lavender.json"))
+        with profiler.span("theme"):
+            customtkinter.set_appearance_mode("dark")
+            customtkinter.set_default_color_theme(
+                os.path.join(theme_path, "lavender.json"))
         self.geometry("350x330")
         self.resizable(False, False)
+        self.protocol("WM_DELETE_WINDOW", self.on_close)
 
-        # Create Tabview
-        self.tabview = customtkinter.CTkTabview(self, fg_color="transparent")
+        # Create Tabview, only the proxy tab is built right away, the others the first time they are selected
+        self.tabview = customtkinter.CTkTabview(
+            self, fg_color="transparent", command=self.on_tab_change)
         self.tabview.pack(fill="both", expand=True)
         self.tabview.add("Proxy Settings")
         self.tabview.add("Wifi Settings")
         self.tabview.add("Settings")
+        self.tab_builders = {"Wifi Settings": self.build_wifi_tab,
+                             "Settings": self.build_settings_tab}
+
+        # the startup probes run concurrently, each section shows a placeholder until its probe is done
+        self.probes = StartupProbes(self)
+        with profiler.span("tab: Proxy Settings"):
+            self.proxy_ui = ProxyUi(self.tabview.tab("Proxy Settings"), version, self.probes)
+            self.proxy_ui.pack(fill="both", expand=True)
+
+        self.wifi_scan = None
+        self.connection_watcher = None
+        if platform.system() == "Windows" and self.proxy_ui.daemon_client is None:
+            # without a daemon the first scan of the Wi-Fi tab is done now, while the tab is not shown yet
+            self.probes.submit("wifi scan", self.scan_wifi, self.keep_wifi_scan)
+            if self.proxy_ui.switcher is not None:
+                # the proxy profile follows the network, also when it is joined outside the app
+                self.probes.submit("wifi watcher", self.watch_connection, self.keep_connection_watcher)
+
+        # confirm a freshly installed slot once the ui is up, otherwise the launcher rolls it back
+        slot_root = slots.find_root()
+        if slot_root:
+            self.after(2000, slots.mark_healthy, slot_root)
+
+        # log the outcome of a previous update, then check for software update
+        updater.report_status()
+        self.check_update()
+        self.after_idle(profiler.mark, "interactive")
+
+    def on_tab_change(self):
+        """Builds the selected tab if it is shown for the first time."""
+
+        name = self.tabview.get()
+        builder = self.tab_builders.pop(name, None)
+        if builder is not None:
+            with profiler.span(f"tab: {name}"):
+                builder()
+
+    def scan_wifi(self):
+        """Scans for Wi-Fi networks, runs on the startup probe pool."""
+
+        from modules import wifi
+        return wifi.scan_wifi_networks(), wifi.get_connected_ssid()
+
+    def keep_wifi_scan(self, scan):
+        """Keeps the result of the startup scan for the Wifi Settings tab."""
+
+        self.wifi_scan = scan
+
+    def watch_connection(self):
+        """
+        Registers for the connection changes announced by the WLAN service and reads the current connection, runs on
+        the startup probe pool. Changes are handed to the proxy ui through its `network_events` queue.
+        """
+
+        from modules import wifi
+        try:
+            watcher = wifi.ConnectionWatcher(lambda ssid, bssid: self.proxy_ui.network_events.put((ssid, bssid)))
+        except OSError as e:
+            logging.warning(f"Wi-Fi connection changes can not be watched: {e}")
+            watcher = None
+        return watcher, wifi.get_connection()
+
+    def keep_connection_watcher(self, result):
+        """Keeps the connection watcher and applies the proxy profile of the current network."""
 
-        self.proxy_ui = ProxyUi(self.tabview.tab("Proxy Settings"), version)
-        self.proxy_ui.pack(fill="both", expand=True)
+        if result is None:
+            return
+        self.connection_watcher, connection = result
+        self.proxy_ui.network_changed(*connection)
+
+    def build_wifi_tab(self):
+        """Builds the Wifi Settings tab, which starts scanning for networks."""
 
         if platform.system() == "Windows":
             from modules.WifiUi import WifiUi
-            self.wifi_ui = WifiUi(self.tabview.tab("Wifi Settings"))
+            self.wifi_ui = WifiUi(self.tabview.tab("Wifi Settings"), scan=self.wifi_scan,
+                                  on_network=self.proxy_ui.network_changed)
             self.wifi_ui.pack(fill="both", expand=True)
         else:
             # display label if not on windows
@@ -55,33 +132,95 @@ class RootApp(customtkinter.CTk):
                 self.tabview.tab("Wifi Settings"), text="This feature is only available on Windows for now.")
             label.pack(fill="both", expand=True)
 
+    def build_settings_tab(self):
+        """Builds the Settings tab."""
+
+        from modules.SettingsUi import SettingsUi
         self.settings_ui = SettingsUi(self.tabview.tab("Settings"), version)
         self.settings_ui.pack(fill="both", expand=True)
 
-        # check for software update
-        self.check_update()
-
     def check_update(self, version=version):
-        """Checks for new releases on Github. If a new release is available, it downloads and 'installs' it.
+        """Checks for new releases on Github in the background. If a new release is available, it downloads and 'installs' it.
+        The check runs at most once per `update_check_interval` hours, in between the cached release information is used.
         Args:
             version (_type_, optional): The current version of the software. This parameter is used to check if a new version is available.
             Defaults to the version of the software that is currently running.
         """
 
-        url = "https://api.github.com/repos/infinitel8p/proxy-settings/releases"
         self.version = version
 
+        settings_data = settings.load_settings()
+        if settings_data["background_updates"]:
+            # a release staged by an earlier session is installed right away with a quick restart
+            from modules import staging
+            manifest = staging.staged_update(self.version)
+            if manifest and staging.apply_staged(platform.system(), "Proxy Settings", manifest, relaunch=True):
+                self.destroy()
+                import sys
+                sys.exit()
+
+        self.probes.submit("update check", lambda: self.fetch_update_info(settings_data), self.show_update)
+
+    def fetch_update_info(self, settings_data):
+        """Fetches the latest release on the startup probe pool, `show_update` receives the result on the Tk thread.
+        Importing `requests` happens on the pool as well, so it does not delay the window.
+        Args:
+            settings_data (dict): The settings, they decide whether the cached release information is recent enough.
+        Returns:
+            dict: The latest release, or None if it could not be fetched.
+        """
+
+        import requests
+        from modules import releases
+
+        interval = settings_data["update_check_interval"] * 3600
+        if time.time() - settings_data["last_update_check"] < interval:
+            logging.info("Skipping update check, using cached release information.")
+            return releases.load_cache().get("release")
+
         try:
-            # Send a get request to the GitHub releases api
-            releases_response = requests.get(url)
-            releases_data = json.loads(releases_response.text)
+            # Get the latest release from the GitHub releases api (or the cache)
+            release = releases.fetch_latest_release(timeout=(3.05, 5))
+            settings.update_settings(last_update_check=time.time())
+            return release
+        except requests.exceptions.HTTPError as errh:
+            logging.error(f"HTTP Error: {errh}")
+        except requests.exceptions.ConnectionError as errc:
+            logging.error(f"Error Connecting: {errc}")
+        except requests.exceptions.Timeout as errt:
+            logging.error(f"Timeout Error: {errt}")
+        except requests.exceptions.RequestException as err:
+            logging.error(f"Something Else: {err}")
+        except Exception as e:
+            logging.error(f"An unexpected error occurred: {e}")
+        return None
+
+    def show_update(self, release):
+        """Compares the latest release with the running version and shows the update dialog if it is newer.
+        Args:
+            release (dict): The latest release as returned by the GitHub releases api, or None if there is none.
+        """
+
+        if release is None:
+            return
+        from packaging.version import Version
+        from modules import staging
+        from modules.UpdateUi import UpdateUi
+
+        try:
+            self.latest_release = release
             # Get the latest release versions
             self.version = Version(self.version.replace("v", ""))
             self.latest_version = Version(
-                releases_data[0]["tag_name"].replace("v", ""))
+                self.latest_release["tag_name"].replace("v", ""))
             logging.info(
                 f"Current version: {self.version} | Latest release: {self.latest_version}")
-            if self.latest_version > self.version:
+            if self.latest_version > self.version and settings.load_settings()["background_updates"]:
+                # stage the update quietly, it is installed when the app is closed
+                if not staging.staged_update(self.version):
+                    staging.Prestager(self.latest_release, platform.system(),
+                                      settings.load_settings()["background_rate_limit"] * 1024).start()
+            elif self.latest_version > self.version:
                 # if update available show update gui
                 update = UpdateUi(self)
                 update.grab_set()
@@ -95,17 +234,23 @@ class RootApp(customtkinter.CTk):
             # If there is an error in the response, print an error message
             logging.error(
                 "Failed to retrieve version information from GitHub.")
-        except requests.exceptions.HTTPError as errh:
-            logging.error(f"HTTP Error: {errh}")
-        except requests.exceptions.ConnectionError as errc:
-            logging.error(f"Error Connecting: {errc}")
-        except requests.exceptions.Timeout as errt:
-            logging.error(f"Timeout Error: {errt}")
-        except requests.exceptions.RequestException as err:
-            logging.error(f"Something Else: {err}")
         except Exception as e:
             logging.error(f"An unexpected error occurred: {e}")
 
+    def on_close(self):
+        """Closes the app, handing a staged update to the update helper first."""
+
+        if settings.load_settings()["background_updates"]:
+            from modules import staging
+            manifest = staging.staged_update(version)
+            if manifest:
+                staging.apply_staged(platform.system(), "Proxy Settings",
+                                     manifest, relaunch=False)
+        self.probes.shutdown()
+        if self.connection_watcher is not None:
+            self.connection_watcher.close()
+        self.destroy()
+
 
 if __name__ == "__main__":
     root = RootApp()
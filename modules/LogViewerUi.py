@@ -0,0 +1,311 @@
+import os
+import mmap
+import bisect
+import logging
+import customtkinter
+
+logger = logging.getLogger(__name__)
+
+# bytes at the start of the file that are remembered to notice a file that was truncated and has grown again
+HEAD_BYTES = 256
+
+
+class LogIndex:
+    """
+    A sparse line-offset index over a memory-mapped log file.
+
+    Instead of remembering where every line starts, the index stores one checkpoint per `block_size` bytes
+    (the offset of the first line starting in that block and its line number). Looking up a line bisects the
+    checkpoints and scans forward inside a single block, so memory use stays constant no matter how big the file gets.
+
+    Attributes:
+        path (str): Path of the indexed log file.
+        line_count (int): Number of lines indexed so far (a trailing partial line counts as a line).
+    """
+
+    def __init__(self, path, block_size=1024 * 1024):
+        self.path = path
+        self.block_size = block_size
+        self.file = None
+        self.mm = None
+        self.size = 0
+        self.indexed_to = 0
+        self.newlines = 0
+        self.checkpoint_lines = []
+        self.checkpoint_offsets = []
+        self.line_count = 0
+        self.identity = None
+        self.head = b""
+        self.refresh()
+
+    def close(self):
+        """Unmaps and closes the underlying log file."""
+        if self.mm is not None:
+            self.mm.close()
+            self.mm = None
+        if self.file is not None:
+            self.file.close()
+            self.file = None
+
+    def _reset(self):
+        self.close()
+        self.size = 0
+        self.indexed_to = 0
+        self.newlines = 0
+        self.checkpoint_lines = [0]
+        self.checkpoint_offsets = [0]
+        self.line_count = 0
+        self.identity = None
+        self.head = b""
+
+    def _same_head(self):
+        """Whether the file still starts with the bytes that were indexed."""
+        self.file.seek(0)
+        return self.file.read(len(self.head)) == self.head
+
+    def refresh(self):
+        """
+        Remaps the file if it changed size and indexes any newly appended bytes. The index starts over if the file
+        was replaced (another inode), shrank, or no longer starts with the bytes it was indexed with, which catches a
+        truncation that the file has outgrown again since the last refresh.
+
+        Returns:
+            bool: True if new content was indexed, False if the file is unchanged.
+        """
+        try:
+            stat = os.stat(self.path)
+            size, identity = stat.st_size, (stat.st_dev, stat.st_ino)
+        except OSError:
+            size, identity = 0, None
+        previous_size = self.size
+
+        if self.file is None or size < self.size or identity != self.identity or not self._same_head():
+            # first open, truncation or log rotation: start over
+            self._reset()
+        if size == self.size and self.mm is not None:
+            return False
+
+        if self.mm is not None:
+            self.mm.close()
+            self.mm = None
+        if size == 0:
+            return previous_size != 0
+
+        if self.file is None:
+            self.file = open(self.path, "rb")
+            self.identity = identity
+        self.mm = mmap.mmap(self.file.fileno(), size, access=mmap.ACCESS_READ)
+        self.size = size
+        if len(self.head) < HEAD_BYTES:
+            self.head = self.mm[:HEAD_BYTES]
+
+        # count newlines block by block, placing a checkpoint at the first line start of each block
+        while self.indexed_to < size:
+            start = self.indexed_to
+            end = min(start + self.block_size, size)
+            if start - self.checkpoint_offsets[-1] >= self.block_size:
+                line_start = self.mm.find(b"\n", start - 1, end) + 1
+                if line_start:
+                    self.checkpoint_lines.append(
+                        self.newlines + self.mm[start:line_start].count(b"\n"))
+                    self.checkpoint_offsets.append(line_start)
+            self.newlines += self.mm[start:end].count(b"\n")
+            self.indexed_to = end
+
+        ends_with_newline = self.mm[size - 1:size] == b"\n"
+        self.line_count = self.newlines + (0 if ends_with_newline else 1)
+        return True
+
+    def line_offset(self, line_no):
+        """
+        Finds the byte offset at which a line starts.
+
+        Args:
+            line_no (int): Zero-based line number.
+
+        Returns:
+            int: Byte offset of the start of the line.
+        """
+        i = bisect.bisect_right(self.checkpoint_lines, line_no) - 1
+        offset = self.checkpoint_offsets[i]
+        for _ in range(line_no - self.checkpoint_lines[i]):
+            offset = self.mm.find(b"\n", offset, self.size) + 1
+            if offset == 0:
+                return self.size
+        return offset
+
+    def lines(self, first, count, max_length=1000):
+        """
+        Reads a window of lines from the mapped file.
+
+        Args:
+            first (int): Zero-based number of the first line to read.
+            count (int): Maximum number of lines to read.
+            max_length (int, optional): Lines longer than this are cut off. Defaults to 1000.
+
+        Returns:
+            list[str]: The decoded lines, without line endings.
+        """
+        if self.mm is None or count <= 0:
+            return []
+        offset = self.line_offset(first)
+        result = []
+        while len(result) < count and offset < self.size:
+            end = self.mm.find(b"\n", offset, self.size)
+            if end == -1:
+                end = self.size
+            line = self.mm[offset:min(end, offset + max_length)]
+            result.append(line.decode("utf-8", errors="replace").rstrip("\r"))
+            offset = end + 1
+        return result
+
+
+class LogViewerUi(customtkinter.CTkFrame):
+    """
+    A frame that displays the log files under a folder without loading them into memory.
+
+    Only the lines that fit into the textbox are rendered. Scrolling pages through the file lazily via `LogIndex`
+    and, while the view is scrolled to the bottom, new lines are tailed as they are written.
+    """
+
+    def __init__(self, parent, log_path, visible_lines=8, tail_interval=1000):
+        super().__init__(master=parent)
+        self.configure(fg_color="transparent")
+        self.root = parent
+        self.log_path = log_path
+        self.visible_lines = visible_lines
+        self.tail_interval = tail_interval
+        self.index = None
+        self.first_line = 0
+        self.following = True
+
+        # Log file selection
+        self.file_menu = customtkinter.CTkOptionMenu(
+            self, values=self.list_logs() or ["No logs found"], command=self.open_log, height=20, font=("Arial", 10))
+        self.file_menu.pack(fill=customtkinter.X, padx=5, pady=(0, 5))
+
+        self.view_frame = customtkinter.CTkFrame(self, fg_color="transparent")
+        self.view_frame.pack(fill=customtkinter.BOTH, expand=True)
+
+        # Textbox that only ever holds the visible window of lines
+        self.textbox = customtkinter.CTkTextbox(
+            self.view_frame, height=visible_lines * 14, fg_color="gray17", font=("Arial", 10), wrap="none",
+            activate_scrollbars=False)
+        self.textbox.pack(side=customtkinter.LEFT, fill=customtkinter.BOTH, expand=True, padx=(5, 0))
+        self.textbox.configure(state="disabled")
+
+        self.scrollbar = customtkinter.CTkScrollbar(self.view_frame, command=self.on_scroll)
+        self.scrollbar.pack(side=customtkinter.RIGHT, fill=customtkinter.Y)
+
+        self.textbox.bind("<MouseWheel>", self.on_mousewheel)
+        self.textbox.bind("<Button-4>", lambda event: self.scroll_to(self.first_line - 3))
+        self.textbox.bind("<Button-5>", lambda event: self.scroll_to(self.first_line + 3))
+
+        if "log.txt" in self.list_logs():
+            self.file_menu.set("log.txt")
+        if self.list_logs():
+            self.open_log(self.file_menu.get())
+        self.after(self.tail_interval, self.tail)
+
+    def list_logs(self):
+        """
+        Lists the log files in the log folder.
+
+        Returns:
+            list[str]: File names ending in `.txt` or `.log`, sorted alphabetically.
+        """
+        try:
+            return sorted(name for name in os.listdir(self.log_path) if name.endswith((".txt", ".log")))
+        except OSError:
+            return []
+
+    def open_log(self, name):
+        """
+        Maps the selected log file and shows its last lines.
+
+        Args:
+            name (str): File name of the log, relative to the log folder.
+        """
+        if self.index is not None:
+            self.index.close()
+            self.index = None
+
+        path = os.path.join(self.log_path, name)
+        if not os.path.isfile(path):
+            return
+        try:
+            self.index = LogIndex(path)
+        except (OSError, ValueError) as e:
+            logger.error(f"Could not open log file {path}: {e}")
+            return
+        self.following = True
+        self.scroll_to(self.index.line_count)
+
+    def scroll_to(self, line_no):
+        """
+        Moves the view so that it starts at the given line and renders the visible window.
+
+        Args:
+            line_no (int): Zero-based number of the first line to show. Clamped to the file's bounds.
+        """
+        if self.index is None:
+            return "break"
+        last_first = max(self.index.line_count - self.visible_lines, 0)
+        self.first_line = max(0, min(int(line_no), last_first))
+        self.following = self.first_line >= last_first
+        self.render()
+        return "break"
+
+    def render(self):
+        """Replaces the textbox content with the lines of the current window and updates the scrollbar."""
+        lines = self.index.lines(self.first_line, self.visible_lines)
+        self.textbox.configure(state="normal")
+        self.textbox.delete("1.0", customtkinter.END)
+        self.textbox.insert("1.0", "\n".join(lines))
+        self.textbox.configure(state="disabled")
+
+        total = max(self.index.line_count, 1)
+        self.scrollbar.set(self.first_line / total,
+                           min((self.first_line + self.visible_lines) / total, 1.0))
+
+    def on_scroll(self, action, *args):
+        """
+        Handles scrollbar events in the same format as a Tk `yscrollcommand`.
+
+        Args:
+            action (str): Either "moveto" followed by a fraction or "scroll" followed by an amount and a unit.
+        """
+        if self.index is None:
+            return
+        if action == "moveto":
+            self.scroll_to(float(args[0]) * self.index.line_count)
+        elif action == "scroll":
+            step = self.visible_lines if args[1] == "pages" else 1
+            self.scroll_to(self.first_line + int(args[0]) * step)
+
+    def on_mousewheel(self, event):
+        """Scrolls three lines per wheel notch."""
+        return self.scroll_to(self.first_line - 3 * (1 if event.delta > 0 else -1))
+
+    def tail(self):
+        """
+        Picks up lines appended to the open log file.
+
+        Only the newly written bytes are indexed. If the view was scrolled to the bottom it follows the new lines,
+        otherwise only the scrollbar is updated. Reschedules itself every `tail_interval` milliseconds.
+        """
+        if self.index is not None:
+            try:
+                if self.index.refresh():
+                    if self.following:
+                        self.scroll_to(self.index.line_count)
+                    else:
+                        self.render()
+            except (OSError, ValueError) as e:
+                logger.error(f"Could not read log file {self.index.path}: {e}")
+        self.after(self.tail_interval, self.tail)
+
+    def destroy(self):
+        if self.index is not None:
+            self.index.close()
+        super().destroy()
@@ -1,7 +1,13 @@
 import customtkinter
 import logging
 import platform
+import queue
+import threading
 from modules.loggingHandler import TkinterHandler
+from modules.commands import CommandQueue
+from modules.monitor import HealthMonitor, Histogram
+from modules.profiles import ProfileSwitcher, ProfileTable
+from modules import daemon, settings
 
 if platform.system() == "Darwin":
     import modules.proxy_macOS as proxy
@@ -10,7 +16,7 @@ elif platform.system() == "Windows":
 
 
 class ProxyUi(customtkinter.CTkFrame):
-    def __init__(self, parent, version):
+    def __init__(self, parent, version, probes):
 
         # Main Frame
         super().__init__(master=parent)
@@ -33,19 +39,17 @@ class ProxyUi(customtkinter.CTkFrame):
         self.entry_ip = customtkinter.CTkEntry(
             self.horizontal_frame, width=75, justify="center", placeholder_text="Proxy ip-address")
         self.entry_ip.grid(row=0, column=0, sticky="ew", padx=(0, 5))
-        self.entry_ip.insert(0, proxy.fill_in_ip())
         self.entry_ip.bind("<Return>", command=self.proxy_changer)
 
         # Proxy Port Entry
         self.entry_port = customtkinter.CTkEntry(
             self.horizontal_frame, width=50, justify="center", placeholder_text="Proxy port")
         self.entry_port.grid(row=0, column=1, sticky="ew", padx=(0, 5))
-        self.entry_port.insert(0, proxy.fill_in_port())
         self.entry_port.bind("<Return>", command=self.proxy_changer)
 
         # Apply Button
         self.button = customtkinter.CTkButton(
-            self.horizontal_frame, width=50, text="Apply", command=self.proxy_changer)
+            self.horizontal_frame, width=50, text="Apply", command=self.proxy_changer, state="disabled")
         self.button.grid(row=0, column=2, sticky="ew")
 
         # Configure horizontal frame's columns to distribute space
@@ -58,14 +62,20 @@ class ProxyUi(customtkinter.CTkFrame):
 
         # Proxy ON/OFF Switch
         self.switch = customtkinter.CTkSwitch(
-            master=self.frame, text="Turn Proxy ON/OFF", progress_color="green", command=self.proxy_toggle)
+            master=self.frame, text="Turn Proxy ON/OFF", progress_color="green", command=self.proxy_toggle,
+            state="disabled")
         self.switch.grid(row=1, column=0, sticky="w", padx=5, pady=(10, 0))
 
         # Status Label
         self.label = customtkinter.CTkLabel(
-            master=self.frame, text="Disabled", text_color="red")
+            master=self.frame, text="Checking...", text_color="grey")
         self.label.grid(row=1, column=0, sticky="e", padx=15, pady=(10, 0))
 
+        # Health Label, filled in by the health monitor while the proxy is enabled
+        self.health_label = customtkinter.CTkLabel(
+            master=self.frame, text="", text_color="grey", font=("Arial", 10), height=12)
+        self.health_label.grid(row=2, column=0, sticky="e", padx=15)
+
         # Version Label
         self.version_label = customtkinter.CTkLabel(
             self, text=f"version {version}", text_color="grey", font=("Arial", 10))
@@ -85,37 +95,197 @@ class ProxyUi(customtkinter.CTkFrame):
         self.handler = TkinterHandler(self.log_output)
         self.logger.addHandler(self.handler)
 
-        # check current settings and set switch/label
-        if proxy.status_check():
+        # with a running daemon, reads are answered from its memory and changes go through it
+        self.daemon_client = daemon.connect()
+        self.proxy = daemon.RemoteProxy(self.daemon_client) if self.daemon_client is not None else proxy
+
+        # read the current settings concurrently, the entries, switch and label are filled in as the reads finish
+        self.loading = {"ip", "port"}
+        probes.submit("proxy.fill_in_ip", self.proxy.fill_in_ip,
+                      lambda ip: self.fill_in_entry(self.entry_ip, "ip", ip), default="0.0.0.0")
+        probes.submit("proxy.fill_in_port", self.proxy.fill_in_port,
+                      lambda port: self.fill_in_entry(self.entry_port, "port", port), default="8080")
+        probes.submit("proxy.status_check", self.proxy.status_check, self.show_status, default=False)
+        # logs the current server
+        probes.submit("proxy.server_check", self.proxy.server_check)
+
+        # changes are applied one at a time off the Tk thread, the results come back through `commands.events`
+        self.commands = CommandQueue(self.proxy)
+        self.commands.start()
+        # probes the proxy while it is enabled, its events are shown by `poll_commands` as well
+        settings_data = settings.load_settings()
+        self.monitor = HealthMonitor(interval=settings_data["health_interval"],
+                                     disable_after=settings_data["auto_disable_after"])
+        self.monitor.start()
+        self.after(100, self.poll_commands)
+
+        # the proxy profile follows the connected Wi-Fi network, with a running daemon the daemon does this
+        self.applied_bypass = None
+        self.status_known = False
+        self.pending_network = None
+        self.profile_changes = {}
+        # (ssid, bssid) of connection changes, put by `wifi.ConnectionWatcher` from its threads
+        self.network_events = queue.Queue()
+        self.switcher = None
+        if self.daemon_client is None and (settings_data["network_rules"] or settings_data["default_profile"]):
+            self.switcher = ProfileSwitcher(ProfileTable.from_settings(settings_data),
+                                            self.apply_profile, self.proxy_state)
+
+    def fill_in_entry(self, entry, name, value):
+        """
+        Shows a value read from the system settings, unless something was typed in the meantime. The Apply button is
+        enabled once both entries are filled in.
+        """
+        if not entry.get():
+            entry.insert(0, value)
+        self.loading.discard(name)
+        if not self.loading:
+            self.button.configure(state="normal")
+            self.monitor.set_address(f"{self.entry_ip.get()}:{self.entry_port.get()}")
+            self.flush_network()
+
+    def show_status(self, enabled):
+        """Sets the switch and label to the state read from the system settings and enables the switch."""
+        if enabled:
             self.switch.select()
             self.label.configure(text="Enabled", text_color="green")
-        proxy.server_check()
+        else:
+            self.label.configure(text="Disabled", text_color="red")
+        self.switch.configure(state="normal")
+        self.monitor.set_enabled(enabled)
+        self.status_known = True
+        self.flush_network()
+
+    def proxy_state(self):
+        """Returns the proxy state shown in the ui, see `profiles.diff`."""
+        return {"address": f"{self.entry_ip.get()}:{self.entry_port.get()}",
+                "enabled": self.switch.get() == 1, "bypass": self.applied_bypass}
+
+    def network_changed(self, ssid, bssid=None):
+        """
+        Switches to the proxy profile of the connected Wi-Fi network. Called with the result of `wifi.get_connection`
+        at startup, on connection changes and after connecting in the app, until the current proxy state has been
+        read the network is kept for later.
+        """
+        if self.switcher is None:
+            return
+        self.pending_network = (ssid, bssid)
+        self.flush_network()
+
+    def apply_profile(self, changes):
+        """Queues the changes of a proxy profile as one batch, `poll_commands` resets the switcher if one fails."""
+        self.profile_changes = dict(changes)
+        self.commands.submit_batch(changes)
+        return True
+
+    def flush_network(self):
+        if self.switcher is None or self.pending_network is None or self.loading or not self.status_known:
+            return
+        ssid, bssid = self.pending_network
+        self.pending_network = None
+        self.switcher.network_changed(ssid, bssid)
 
     def proxy_changer(self, event=None):
         """
-        Changes the proxy address to the value entered in the Tkinter Entry widget.
+        Requests the proxy address entered in the Tkinter Entry widgets. Pressing Return repeatedly only writes the
+        last address.
 
         Args:
             event (Event, optional): The event that triggered this method. Defaults to None.
         """
-        proxy.change_address(f"{self.entry_ip.get()}:{self.entry_port.get()}")
+        if self.loading:
+            # the current address has not been read yet
+            return
+        self.commands.set_address(f"{self.entry_ip.get()}:{self.entry_port.get()}")
 
     def proxy_toggle(self):
         """
-        Toggles the proxy on or off based on the value of the switch.
-        If the switch is off, the proxy is deactivated and the label text changes to 'Disabled' in red.
-        If the switch is on, the proxy is activated and the label text changes to 'Enabled' in green.
+        Requests the proxy to be switched on or off based on the value of the switch. The label follows once the
+        change has been applied, see `poll_commands`.
+        """
+        self.commands.set_enabled(self.switch.get() == 1)
+
+    def check_address(self, address):
+        """Probes a newly applied proxy address on a worker thread and logs whether it answers."""
+        from modules import latency
+        result = latency.run_sweep([address], timeout=3.0, samples=3)[0]
+        if result["ok"]:
+            logging.info(f"{address} answers in {result['p50']:.0f} ms")
+        else:
+            logging.warning(f"{address} does not answer: {result['errors'][0]}")
+
+    def poll_commands(self):
+        """
+        Shows the results of applied changes and follows Wi-Fi connection changes without blocking the Tk thread.
+        If the proxy was switched on, the label text changes to 'Enabled' in green, if it was switched off to
+        'Disabled' in red. If a change failed, the switch is reset unless it has been toggled again since.
         """
-        is_on = self.switch.get() == 1
-        action = proxy.activate if is_on else proxy.deactivate
-        label_text = "Enabled" if is_on else "Disabled"
-        text_color = "green" if is_on else "red"
+        try:
+            while True:
+                kind, value, ok = self.commands.events.get_nowait()
+                if kind == "address" and ok:
+                    # tell the user right away if the new address does not work
+                    threading.Thread(target=self.check_address, args=(value,), daemon=True).start()
+                    self.monitor.set_address(value)
+                    # a profile may have changed the address
+                    ip, _, port = value.rpartition(":")
+                    for entry, text in ((self.entry_ip, ip), (self.entry_port, port)):
+                        if entry.get() != text:
+                            entry.delete(0, "end")
+                            entry.insert(0, text)
+                if kind == "bypass" and ok:
+                    self.applied_bypass = value
+                if kind in self.profile_changes and self.profile_changes[kind] == value:
+                    del self.profile_changes[kind]
+                    if not ok:
+                        # the next network event applies the profile again
+                        self.switcher.reset()
+                if kind != "enabled":
+                    continue
+                if ok:
+                    # a profile may have switched the proxy
+                    if value:
+                        self.switch.select()
+                    else:
+                        self.switch.deselect()
+                    self.label.configure(text="Enabled" if value else "Disabled",
+                                         text_color="green" if value else "red")
+                    self.monitor.set_enabled(value)
+                    if not value:
+                        self.health_label.configure(text="")
+                elif (self.switch.get() == 1) == value:
+                    # Reset the switch to its original state if the action fails
+                    if value:
+                        self.switch.deselect()
+                    else:
+                        self.switch.select()
+        except queue.Empty:
+            pass
+        try:
+            while True:
+                kind, value = self.monitor.events.get_nowait()
+                if kind == "health":
+                    self.show_health(value)
+                elif kind == "disable" and self.switch.get() == 1:
+                    logging.warning(f"Turning the proxy off, {value} does not answer.")
+                    self.switch.deselect()
+                    self.commands.set_enabled(False)
+        except queue.Empty:
+            pass
+        try:
+            while True:
+                self.network_changed(*self.network_events.get_nowait())
+        except queue.Empty:
+            pass
+        self.after(100, self.poll_commands)
 
-        if action():
-            self.label.configure(text=label_text, text_color=text_color)
+    def show_health(self, summary):
+        """Shows the result of the last health probe below the Enabled/Disabled label."""
+        if self.switch.get() != 1:
+            return
+        colors = {"healthy": "green", "degraded": "orange", "down": "red"}
+        if summary["latency"] is None:
+            text = f"{summary['state']}, no answer ({summary['failures']}x)"
         else:
-            # Reset the switch to its original state if the action fails
-            if is_on:
-                self.switch.deselect()
-            else:
-                self.switch.select()
+            text = f"{summary['state']}, {summary['latency']:.0f} ms (p90 {Histogram.label(summary['p90'])})"
+        self.health_label.configure(text=text, text_color=colors[summary["state"]])
@@ -1,8 +1,9 @@
 import os
-import json
 import logging
 import tempfile
 import customtkinter
+from modules.LogViewerUi import LogViewerUi
+from modules import settings, slots, updater
 
 
 class SettingsUi(customtkinter.CTkFrame):
@@ -23,26 +24,62 @@ class SettingsUi(customtkinter.CTkFrame):
         # default settings
         settings_json = {"log_path": ""}
 
-        # open the settings.json and if FileNotFoundError then create it
-        try:
-            with open(os.path.join(self.log_path, "settings.json"), "r") as infile:
-                json_object = json.load(infile)
-        except FileNotFoundError:
-            with open(os.path.join(self.log_path, "settings.json"), "w+") as outfile:
-                json.dump(settings_json, outfile)
-            with open(os.path.join(self.log_path, "settings.json"), "r") as infile:
-                json_object = json.load(infile)
+        # create the settings.json if it does not exist
+        if not os.path.exists(settings.settings_path):
+            settings.update_settings(**settings_json)
 
         # Save Button
         self.save_button = customtkinter.CTkButton(
             self, text="Save", command=lambda: self.save_settings("log_path"))
         self.save_button.pack()
 
+        # Background Updates Switch
+        self.background_switch = customtkinter.CTkSwitch(
+            self, text="Download updates in the background", command=self.toggle_background_updates)
+        self.background_switch.pack(pady=(10, 0))
+        if settings.load_settings()["background_updates"]:
+            self.background_switch.select()
+
+        # Rollback Button, only for installs with a previous slot
+        self.slot_root = slots.find_root()
+        previous = slots.load_state(self.slot_root)["previous"] if self.slot_root else None
+        if previous:
+            self.rollback_button = customtkinter.CTkButton(
+                self, text=f"Roll back to {previous}", command=self.rollback)
+            self.rollback_button.pack(pady=(10, 0))
+
+        # Log Viewer
+        self.log_viewer = LogViewerUi(self, self.log_path)
+        self.log_viewer.pack(fill="both", expand=True, pady=(10, 0))
+
         # Version Label
         self.version_label = customtkinter.CTkLabel(
             self, text=f"version {version}", text_color="grey", font=("Arial", 10))
         self.version_label.pack(side=customtkinter.BOTTOM)
 
+    def toggle_background_updates(self):
+        """
+        Saves whether new releases are downloaded in the background and installed when the app is closed.
+        """
+
+        enabled = self.background_switch.get() == 1
+        settings.update_settings(background_updates=enabled)
+        logging.info(f"Settings updated → background_updates = {enabled}")
+
+    def rollback(self):
+        """
+        Switches back to the previously installed version and restarts the app through the launcher.
+        """
+
+        slot = slots.rollback(self.slot_root)
+        launcher = slots.load_state(self.slot_root)["launcher"]
+        if slot is None or not launcher:
+            logging.error("There is no previous version to roll back to.")
+            return
+        logging.info(f"Rolling back to {slot}...")
+        updater.launch(launcher)
+        self.winfo_toplevel().destroy()
+
     def save_settings(self, new_value):
         """
         Dumps changes into the `settings.json` file, located in os.path.join(log_path, "settings.json").
@@ -56,13 +93,8 @@ class SettingsUi(customtkinter.CTkFrame):
             "log_path": f"{self.log_path}",
         }
 
-        # write settings to file
-        with open(os.path.join(self.log_path, "settings.json"), "r") as infile:
-            settings_data = json.load(infile)
-        # add missing key
-            settings_data[new_value] = settings_json[new_value]
-        with open(os.path.join(self.log_path, "settings.json"), "w") as outfile:
-            json.dump(settings_data, outfile)
+        # write settings to file, see `settings.update_settings`
+        settings.update_settings(**{new_value: settings_json[new_value]})
 
         logging.info(
             f"Settings updated → {new_value} = {settings_json[new_value]}")
@@ -1,12 +1,14 @@
 import customtkinter
-import subprocess
 import tempfile
 import requests
 import platform
-import json
-import time
+import threading
+import shutil
+import queue
 import sys
 import os
+from modules import delta, releases, staging, updater
+from modules.downloader import Downloader
 
 
 class UpdateUi(customtkinter.CTkToplevel):
@@ -23,8 +25,15 @@ class UpdateUi(customtkinter.CTkToplevel):
     Methods:
         __init__(self, parent): Initializes the class by creating the window, setting its properties, creating the UI elements and adding the
         "Yes" and "No" buttons.
+        close(self): Cancels a running download and closes the window
         add_output(self, text): Add text to the output textbox
-        update(self, event=None): The function that downloads and installs the update. Defaults to `None`.
+        update(self, event=None): The function that starts downloading the update. Defaults to `None`.
+        fetch_checksums(self): Looks up the published checksums of the release on a worker thread
+        start_download(self, checksums): Starts downloading the patch or the full release archive
+        download_full(self): Starts downloading the full release archive
+        apply_delta(self, patch_path): Rebuilds the new release from the installed executable and a downloaded patch
+        poll_download(self): Applies the download progress published by the download worker to the UI
+        install(self, os_name, download_path): Creates and launches the update handlers for the downloaded release
     """
 
     def __init__(self, parent: customtkinter.CTkToplevel):
@@ -39,8 +48,10 @@ class UpdateUi(customtkinter.CTkToplevel):
         self.attributes("-topmost", True)
         self.parent = parent
         self.updating = False
+        self.downloader = None
+        # closing the window stops the download, the segment threads would keep running otherwise
+        self.protocol("WM_DELETE_WINDOW", self.close)
 
-        self.url = "https://api.github.com/repos/infinitel8p/proxy-settings/releases"
         # TODO executable is expected to be named self.name or the code will fail, maybe recheck logic in future
         self.name = "Proxy Settings"
 
@@ -78,6 +89,13 @@ class UpdateUi(customtkinter.CTkToplevel):
             self.button_grid, text="Yes", command=self.update, width=90)
         self.button2.grid(row=0, column=1, padx=(5, 0))
 
+    def close(self):
+        """Cancels a running download and closes the window, `poll_download` stops once the window is gone."""
+
+        if self.downloader is not None:
+            self.downloader.cancel()
+        self.destroy()
+
     def add_output(self, text: str):
         """
         Add text to the output textbox
@@ -126,14 +144,13 @@ class UpdateUi(customtkinter.CTkToplevel):
 
     def update(self, event=None):
         """
-        The function that downloads and installs the update
+        The function that prepares the update and starts downloading it on a worker thread
 
         Parameters:
             event (_type_): The event that triggered the function call. This is usually an event such as a button press
             and is automatically passed by the function call. Defaults to `None`.
         """
 
-        self.updating = True
         self.button1.destroy()
         self.button2.destroy()
         self.button_grid.destroy()
@@ -144,7 +161,6 @@ class UpdateUi(customtkinter.CTkToplevel):
         self.output.configure(state='disabled')
 
         self.add_output("Prepairing update...\n\n")
-        time.sleep(0.5)
 
         # Detect OS (supports Windows and macOS)
         os_name = platform.system()
@@ -155,8 +171,17 @@ class UpdateUi(customtkinter.CTkToplevel):
         else:
             self.add_output(
                 f"Unsupported OS detected ({os_name}). Please update manually.\n\nClosing setup in 5 sec...")
-            time.sleep(5)
-            self.destroy()
+            self.after(5000, self.destroy)
+            return
+
+        # A release that has already been staged in the background only needs to be swapped in
+        manifest = staging.staged_update(self.parent.version)
+        if manifest and manifest["version"] == self.parent.latest_release["tag_name"]:
+            self.add_output("Installing the already downloaded update...\n\n")
+            if staging.apply_staged(os_name, self.name, manifest, relaunch=True):
+                self.updating = True
+                self.destroy()
+                return
 
         # Prepare download directory
         temp_dir = tempfile.gettempdir()
@@ -168,228 +193,221 @@ class UpdateUi(customtkinter.CTkToplevel):
         self.add_output(f"Download directory created at:\n{download_path}\n\n")
 
         try:
-            # Fetch release information
-            releases_response = requests.get(self.url)
-            releases_data = json.loads(releases_response.text)
-            assets_response = requests.get((releases_data[0]["assets_url"]))
-            assets_data = json.loads(assets_response.text)
+            # Reuse the release information of the update check, it already lists the assets
+            assets_data = self.parent.latest_release["assets"]
             # find asst with os_name in the name
-            for asset in assets_data:
-                if os_name in asset["name"]:
-                    download_url = asset["browser_download_url"]
-                    break
-            else:
+            asset = releases.find_asset(self.parent.latest_release, os_name)
+            if asset is None:
                 self.add_output(
                     f"Could not find a suitable download for {os_name}.\n\nClosing setup in 5 sec...")
-                time.sleep(5)
-                self.destroy()
+                self.after(5000, self.destroy)
+                return
+            download_url = asset["browser_download_url"]
+            asset_name = asset["name"]
+
+            # a patch from the installed version can only be applied to a onefile executable
+            delta_name = f"{os.path.splitext(asset_name)[0]}.from-{self.parent.version}.delta"
+            delta_url = None
+            if os_name == "Windows" and getattr(sys, "frozen", False):
+                for asset in assets_data:
+                    if asset["name"] == delta_name:
+                        delta_url = asset["browser_download_url"]
 
             # Prepare for downloading
-            response = requests.get(download_url, stream=True)
-            total_length = response.headers.get('content-length')
-
-            if total_length is None:  # No content length header
-                self.add_output(
-                    "Cannot determine file size for progress tracking.\n\n")
-                open(os.path.join(download_path, f"{self.name}.zip"),
-                     'wb').write(response.content)
-            else:
-                # Create and display the progress bar
-                total_length = int(total_length)
-                downloaded = 0
-
-                self.progress_bar = customtkinter.CTkProgressBar(
-                    self.background)
-                self.progress_bar.pack(padx=5, pady=(
-                    0, 5), fill=customtkinter.X, expand=True)
-                self.download_status_label = customtkinter.CTkLabel(
-                    self.background, text="Starting download...")
-                self.download_status_label.pack(padx=5, pady=(0, 5))
-                self.add_output("Downloading new release...\n\n")
-
-                # Download with progress update
-                with open(os.path.join(download_path, f"{self.name}.zip"), 'wb') as f:
-                    start_time = time.time()
-
-                    for data in response.iter_content(chunk_size=4096):
-                        downloaded += len(data)
-                        f.write(data)
-                        elapsed_time = time.time() - start_time
-                        download_speed = self.format_speed(
-                            downloaded, elapsed_time)
-                        self.progress_bar.set(downloaded / total_length)
-
-                        # Update the download status label
-                        downloaded_formatted = self.format_file_size(
-                            downloaded)
-                        total_length_formatted = self.format_file_size(
-                            total_length)
-                        download_status_text = f"{downloaded_formatted} of {total_length_formatted}, {downloaded / total_length * 100:.2f}% ({download_speed})"
-                        self.download_status_label.configure(
-                            text=download_status_text)
-
-                        # Update the UI to reflect progress
-                        self.background.update_idletasks()
-
-            # log successful download of new .zip
-            self.add_output(f"Downloaded update to:\n{download_path}\n\n")
-            time.sleep(0.5)
+            self.progress_bar = customtkinter.CTkProgressBar(
+                self.background)
+            self.progress_bar.pack(padx=5, pady=(
+                0, 5), fill=customtkinter.X, expand=True)
+            self.progress_bar.set(0)
+            self.download_status_label = customtkinter.CTkLabel(
+                self.background, text="Starting download...")
+            self.download_status_label.pack(padx=5, pady=(0, 5))
 
         except (KeyError, IndexError, requests.exceptions.RequestException) as e:
             self.add_output(
                 f"Error during download: {e}\n\nClosing setup in 5 sec...")
-            time.sleep(5)
-            self.destroy()
+            self.after(5000, self.destroy)
+            return
+
+        # Look up the checksums and download on worker threads, the progress is polled from the Tk thread
+        self.os_name = os_name
+        self.download_path = download_path
+        self.download_url = download_url
+        self.asset_name = asset_name
+        self.delta_url = delta_url
+        self.delta_name = delta_name
+        self.events = queue.Queue()
+        self.stage = "checksums"
+        threading.Thread(target=self.fetch_checksums, daemon=True).start()
+        self.after(100, self.poll_download)
+
+    def fetch_checksums(self):
+        """Looks up the published checksums of the release on a worker thread, reported as a "checksums" event."""
 
-        # log creation of updater files
-        self.add_output("Creating update handlers...\n\n")
-        time.sleep(0.5)
+        try:
+            self.events.put(("checksums", releases.fetch_checksums(self.parent.latest_release)))
+        except requests.exceptions.RequestException as e:
+            self.events.put(("error", e))
 
-        if os_name == "Windows":
-            # create updater.ps1
-            log_file_path = os.path.join(
-                download_path, "update_log.txt")
-            with open(os.path.join(download_path, "updater.ps1"), "w") as outfile:
-                outfile.write(f"""function Log-Output {{
-    Param ([string]$message)
-    echo $message
-    echo $message >> "{log_file_path}"
-}}
-
-$errorOccurred = $false
-
-echo "Logging update process to {log_file_path}..."
-
-Log-Output "Closing {self.name}.exe..."
-Start-Sleep -Seconds 2
-taskkill /F /IM "{self.name}.exe" /T >> "{log_file_path}" 2>&1
-
-Log-Output "Copying {self.name}.exe from {download_path} to {os.path.join(os.path.dirname(sys.executable), f'{self.name}.zip')}..."
-Start-Sleep -Seconds 1
-Copy-Item -Path "{os.path.join(download_path, self.name + '.zip')}" -Destination "{os.path.join(os.path.dirname(sys.executable), self.name + '.zip')}" -Force >> "{log_file_path}" 2>&1
-if (-not $?) {{ $errorOccurred = $true }}
-
-Log-Output "Deleting old executable..."
-Start-Sleep -Seconds 1
-Remove-Item "{sys.executable}" >> "{log_file_path}" 2>&1
-if (-not $?) {{ $errorOccurred = $true }}
-
-Log-Output "Extracting {self.name}.zip..."
-Start-Sleep -Seconds 1
-Expand-Archive -Path "{os.path.join(os.path.dirname(sys.executable), self.name + '.zip')}" -DestinationPath "{os.path.dirname(sys.executable)}" -Force >> "{log_file_path}" 2>&1
-if (-not $?) {{ $errorOccurred = $true }}
-
-Log-Output "Deleting {self.name}.zip..."s
-Start-Sleep -Seconds 1
-Remove-Item "{os.path.join(os.path.dirname(sys.executable), self.name + '.zip')}" >> "{log_file_path}" 2>&1
-if (-not $?) {{ $errorOccurred = $true }}
-
-Log-Output "Launching {self.name}.exe..."
-Start-Sleep -Seconds 3
-start "{sys.executable}" >> "{log_file_path}" 2>&1
-if (-not $?) {{ $errorOccurred = $true }}
-
-Log-Output "Update finished!"
-Log-Output "You can close this window now."
-
-if ($errorOccurred) {{
-    explorer.exe /select,"{log_file_path}"
-}}
-""")
-            outfile.close()
-
-            # log successful creation of updater.ps1
-            self.add_output("updater.ps1 successfully created!\n\n")
-            time.sleep(0.5)
-
-            # create updater.bat
-            with open(os.path.join(download_path, "updater.bat"), "w") as outfile:
-                outfile.write(
-                    f"""PowerShell -File "{os.path.join(download_path, "updater.ps1")}"\nexit""")
-                outfile.close()
-
-            # log successful creation of updater.bat
-            self.add_output("updater.bat successfully created!\n\n")
-            time.sleep(0.5)
-
-            # log update start in 5 sek
-            self.add_output("Starting update in 5 seconds!\n\n")
-            time.sleep(0.5)
-
-            # log estimated time
-            self.add_output("Estimated update time: 10-15 sec.\n\n")
-            time.sleep(2.5)
-
-            # launch update
-            subprocess.Popen(
-                f"""start cmd /k "{os.path.join(download_path, 'updater.bat')}" """, shell=True)
-            self.destroy()
+    def start_download(self, checksums):
+        """
+        Starts downloading the patch for the installed version if there is one, otherwise the full release.
 
-        elif os_name == "Darwin":
-            # create updater.sh
-            log_file_path = os.path.join(
-                download_path, "update_log.txt")  # Define log file path
-            with open(os.path.join(download_path, "updater.sh"), "w") as outfile:
-                outfile.write(f"""#!/bin/bash
-log_file="{log_file_path}"
-error_occurred=0
-
-echo "Logging update process to ${{log_file}}..." | tee -a "${{log_file}}"
-
-echo "Closing {self.name}..." | tee -a "${{log_file}}"
-sleep 2
-osascript -e 'quit app "{self.name}"' >> "${{log_file}}" 2>&1
-
-echo "Removing old version..." | tee -a "${{log_file}}"
-sleep 1
-rm -rf "{os.path.join(os.path.dirname(os.path.dirname(os.path.dirname(os.path.dirname(sys.executable)))), f'{self.name}.app')}" >> "${{log_file}}" 2>&1
-if [ $? -ne 0 ]; then error_occurred=1; fi
-
-echo "Extracting new version from {self.name}.zip to {os.path.dirname(os.path.dirname(os.path.dirname(os.path.dirname(sys.executable))))}..." | tee -a "${{log_file}}"
-sleep 1
-unzip -o "{os.path.join(download_path, f'{self.name}.zip')}" -d "{os.path.dirname(os.path.dirname(os.path.dirname(os.path.dirname(sys.executable))))}" >> "${{log_file}}" 2>&1
-if [ $? -ne 0 ]; then error_occurred=1; fi
-
-echo "Deleting {self.name}.zip..." | tee -a "${{log_file}}"
-sleep 1
-rm "{os.path.join(download_path, f'{self.name}.zip')}" >> "${{log_file}}" 2>&1
-if [ $? -ne 0 ]; then error_occurred=1; fi
-
-echo "Launching {self.name}.app..." | tee -a "${{log_file}}"
-sleep 3
-open "{os.path.join(os.path.dirname(os.path.dirname(os.path.dirname(os.path.dirname(sys.executable)))), f'{self.name}.app')}" >> "${{log_file}}" 2>&1
-if [ $? -ne 0 ]; then error_occurred=1; fi
-
-if [ $error_occurred -ne 0 ]; then
-    echo "An error occurred during the update process. Please check the log file for more details." | tee -a "${{log_file}}"
-    open -R "{log_file_path}"
-fi
-
-echo "" | tee -a "${{log_file}}"
-echo "Update finished!" | tee -a "${{log_file}}"
-echo "You can close this window now." | tee -a "${{log_file}}"
-exit""")
-                outfile.close()
-
-            # log successful creation of updater.sh
-            self.add_output("updater.sh successfully created!\n\n")
-            time.sleep(0.5)
-
-            # log update start in 5 sek
-            self.add_output("Starting update in 5 seconds!\n\n")
-            time.sleep(0.5)
-
-            # log estimated time
-            self.add_output("Estimated update time: 10-15 sec.\n\n")
-            time.sleep(2.5)
-
-            # launch update
-            subprocess.Popen(["sh", os.path.join(download_path, "updater.sh")])
-
-            self.destroy()
+        Parameters:
+            checksums (dict): The published SHA-256 of every asset by name, see `releases.fetch_checksums`.
+        """
 
+        self.sha256 = checksums.get(self.asset_name)
+        if self.sha256 is None:
+            self.add_output(
+                "No checksum published for this release, the download can not be verified.\n\n")
+        # the hash in the patch header only proves that the patch is consistent with itself, a patch is only used if
+        # the patch or the rebuilt executable can be checked against a published checksum
+        self.target_sha256 = checksums.get(f"{self.name}.exe")
+        delta_sha256 = checksums.get(self.delta_name)
+        if self.delta_url and (delta_sha256 or self.target_sha256):
+            self.add_output("Downloading patch for the installed version...\n\n")
+            self.stage = "delta"
+            self.downloader = Downloader(
+                self.delta_url, os.path.join(self.download_path, self.delta_name), events=self.events,
+                sha256=delta_sha256)
+            self.downloader.start()
         else:
+            if self.delta_url:
+                self.add_output("No checksum published for the patch, downloading the full release instead.\n\n")
+            self.download_full()
+
+    def download_full(self):
+        """Starts downloading the full release archive on a worker thread."""
+
+        self.add_output("Downloading new release...\n\n")
+        self.stage = "full"
+        self.downloader = Downloader(
+            self.download_url, os.path.join(self.download_path, f"{self.name}.zip"), events=self.events,
+            sha256=self.sha256, extract_to=os.path.join(self.download_path, "files"))
+        self.downloader.start()
+
+    def apply_delta(self, patch_path):
+        """
+        Rebuilds the new executable from the installed one and the downloaded patch, straight into the `files`
+        directory the full release would be extracted to, so that the update handlers can treat it the same way.
+        Runs on a worker thread and reports a "patched" or "delta_failed" event through the event queue. If the
+        executable's checksum is published, the rebuilt file has to match it.
+
+        Parameters:
+            patch_path (str): The downloaded patch file.
+        """
+
+        files_path = os.path.join(self.download_path, "files")
+        try:
+            shutil.rmtree(files_path, ignore_errors=True)
+            os.makedirs(files_path)
+            digest = delta.apply_patch(
+                sys.executable, patch_path, os.path.join(files_path, f"{self.name}.exe"))
+            if self.target_sha256 and digest != self.target_sha256:
+                raise delta.PatchError(
+                    f"The rebuilt executable does not match the published checksum {self.target_sha256}.")
+            self.events.put(("patched", files_path, digest))
+        except (OSError, ValueError, delta.PatchError) as e:
+            shutil.rmtree(files_path, ignore_errors=True)
+            self.events.put(("delta_failed", str(e)))
+        finally:
+            os.remove(patch_path)
+
+    def poll_download(self):
+        """
+        Starts the download once the checksums have been looked up, then applies the progress events published by
+        the download worker to the progress bar and status label.
+        A downloaded patch is applied on a worker thread, if that fails the full release is downloaded instead.
+        Once the release is ready the update handlers are created, on errors the setup is closed.
+        Reschedules itself every 100ms until the download has finished or the window was closed.
+        """
+
+        if not self.winfo_exists():
+            return
+
+        while True:
+            try:
+                event = self.events.get_nowait()
+            except queue.Empty:
+                break
+
+            if event[0] == "checksums":
+                self.start_download(event[1])
+            elif event[0] == "progress":
+                _, downloaded, total_length, elapsed_time = event
+                download_speed = self.format_speed(downloaded, elapsed_time)
+                downloaded_formatted = self.format_file_size(downloaded)
+                if total_length is None:  # No content length header
+                    download_status_text = f"{downloaded_formatted} ({download_speed})"
+                else:
+                    self.progress_bar.set(downloaded / total_length)
+                    total_length_formatted = self.format_file_size(
+                        total_length)
+                    download_status_text = f"{downloaded_formatted} of {total_length_formatted}, {downloaded / total_length * 100:.2f}% ({download_speed})"
+                self.download_status_label.configure(
+                    text=download_status_text)
+            elif event[0] == "done" and self.stage == "delta":
+                self.add_output("Applying patch...\n\n")
+                self.stage = "patching"
+                threading.Thread(target=self.apply_delta,
+                                 args=(event[1],), daemon=True).start()
+            elif event[0] in ("delta_failed", "error") and self.stage in ("delta", "patching"):
+                self.add_output(
+                    f"Patch could not be used ({event[1]}), downloading the full release instead.\n\n")
+                self.progress_bar.set(0)
+                self.download_full()
+            elif event[0] in ("done", "patched"):
+                # log successful download of new .zip
+                self.add_output(
+                    f"Downloaded update to:\n{self.download_path}\n\n")
+                if event[0] == "patched":
+                    self.add_output(f"Rebuilt and verified SHA-256: {event[2]}\n\n")
+                elif self.downloader.sha256:
+                    self.add_output(f"Verified SHA-256: {event[2]}\n\n")
+                self.install(self.os_name, self.download_path,
+                             os.path.join(self.download_path, "files"))
+                return
+            elif event[0] == "error":
+                self.add_output(
+                    f"Error during download: {event[1]}\n\nClosing setup in 5 sec...")
+                self.after(5000, self.destroy)
+                return
+
+        if self.winfo_exists():
+            self.after(100, self.poll_download)
+
+    def install(self, os_name, download_path, source_path=None):
+        """
+        Installs the downloaded release, see `updater.install`.
+        Either way the new version is started and this process has to exit.
+
+        Parameters:
+            os_name (str): The name of the operating system as returned by `platform.system()`.
+            download_path (str): The directory the release has been downloaded to.
+            source_path (str, optional): The release archive or a directory with the extracted release.
+            Defaults to `<name>.zip` in `download_path`.
+        """
+
+        self.add_output("Creating update handler...\n\n")
+        if source_path is None:
+            source_path = os.path.join(download_path, f"{self.name}.zip")
+
+        # installs into a new slot, or launches the helper that takes over as soon as this process has exited
+        try:
+            installed = updater.install(os_name, download_path, source_path, self.name,
+                                        self.parent.latest_release["tag_name"])
+        except ValueError as e:
+            # the release is the version running from its install slot
+            self.add_output(
+                f"Could not install the update: {e}\n\nClosing setup in 5 sec...")
+            self.after(5000, self.destroy)
+            return
+        if not installed:
             self.add_output(
                 f"Unsupported OS detected ({os_name}). Please update manually.\n\nClosing setup in 5 sec...")
-            time.sleep(5)
-            self.destroy()
+            self.after(5000, self.destroy)
+            return
+        self.updating = True
+        self.add_output("Restarting...\n\n")
+        self.destroy()
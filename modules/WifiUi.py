@@ -1,15 +1,18 @@
 import customtkinter
-from modules import wifi
+from modules import daemon, wifi
 
 
 class WifiUi(customtkinter.CTkFrame):
-    def __init__(self, parent):
+    def __init__(self, parent, scan=None, on_network=None):
         super().__init__(master=parent)
         self.configure(fg_color="transparent")
         self.root = parent
         self.refresh_interval = 10000
 
         self.network_frames = []  # Keep track of the network frames
+        self.daemon = daemon.connect()  # the daemon scans in the background, if it runs
+        self.scan = scan  # (networks, connected ssid) of the startup scan, used for the first list
+        self.on_network = on_network  # called with the ssid and bssid of the network after connecting or disconnecting
 
         self.wifi_list_label = customtkinter.CTkLabel(
             master=self, text="Available WiFi Networks", font=("Arial", 12))
@@ -74,9 +77,21 @@ class WifiUi(customtkinter.CTkFrame):
             frame.destroy()
         self.network_frames.clear()
 
-        # Scan for WiFi networks and get real data
-        wifi_networks = wifi.scan_wifi_networks()
-        connected_ssid = wifi.get_connected_ssid()
+        # Scan for WiFi networks and get real data, or take the last scan of the daemon
+        wifi_networks = None
+        if self.scan is not None:
+            wifi_networks, connected_ssid = self.scan
+            self.scan = None
+        elif self.daemon is not None:
+            try:
+                wifi_networks = self.daemon.call("wifi")["networks"]
+                connected_ssid = next(
+                    (network["ssid"] for network in wifi_networks if network["connected"]), None)
+            except (OSError, EOFError, daemon.RpcError):
+                self.daemon = None
+        if wifi_networks is None:
+            wifi_networks = wifi.scan_wifi_networks()
+            connected_ssid = wifi.get_connected_ssid()
 
         # Create frames and widgets for each network
         for network in wifi_networks:
@@ -95,9 +110,9 @@ class WifiUi(customtkinter.CTkFrame):
             # Display a "Disconnect" button for the connected network, "Connect" button for others
             button_text = "Disconnect" if is_connected else "Connect"
             if is_connected:
-                button_command = lambda ssid=connected_ssid: wifi.disconnect_from_wifi(ssid, self)
+                button_command = lambda ssid=connected_ssid: self.disconnect(ssid)
             else:
-                button_command = lambda ssid=network['ssid']: wifi.connect_to_wifi(ssid, self)
+                button_command = lambda ssid=network['ssid']: self.connect(ssid)
             button = customtkinter.CTkButton(
                 master=frame, text=button_text, width=50, height=20, command=button_command)
             button.pack(side=customtkinter.RIGHT, padx=(0, 5))
@@ -106,3 +121,19 @@ class WifiUi(customtkinter.CTkFrame):
 
         # Schedule the next update
         self.after(self.refresh_interval, self.start_wifi_scanning)
+
+    def connect(self, ssid):
+        """Connects to a network and reports the new connection right away, without waiting for the next scan."""
+
+        wifi.connect_to_wifi(ssid, self)
+        self.report_connection()
+
+    def disconnect(self, ssid):
+        """Disconnects from a network and reports it right away."""
+
+        wifi.disconnect_from_wifi(ssid, self)
+        self.report_connection()
+
+    def report_connection(self):
+        if self.on_network is not None:
+            self.on_network(*wifi.get_connection())
@@ -0,0 +1,92 @@
+import os
+import shutil
+import hashlib
+import logging
+import tempfile
+
+logger = logging.getLogger(__name__)
+
+# downloaded release artifacts, stored under their SHA-256, so that reinstalls and rollbacks need no download
+cache_path = os.path.join(os.path.join(os.path.join(os.path.dirname(
+    tempfile.gettempdir()), 'Proxy Settings'), "Updates"), "cache", "sha256")
+# number of artifacts kept, the least recently used ones are removed first
+MAX_ENTRIES = 5
+BUFFER_SIZE = 1024 * 1024
+
+
+def _link_or_copy(source, destination):
+    """Hard links `source` to `destination`, copying it where links are not possible (other drive, FAT, ...)."""
+    if os.path.exists(destination):
+        os.remove(destination)
+    try:
+        os.link(source, destination)
+    except OSError:
+        shutil.copyfile(source, destination)
+
+
+def entry_path(sha256):
+    """Returns the cache location of the artifact with the given SHA-256."""
+    return os.path.join(cache_path, sha256.lower())
+
+
+def store(path, sha256):
+    """
+    Adds a verified file to the cache.
+
+    Args:
+        path (str): The file, its content has to match `sha256`.
+        sha256 (str): The SHA-256 of the file.
+    """
+    try:
+        os.makedirs(cache_path, exist_ok=True)
+        temp_path = entry_path(sha256) + ".tmp"
+        _link_or_copy(path, temp_path)
+        os.replace(temp_path, entry_path(sha256))
+        prune()
+    except OSError as e:
+        logger.warning(f"Could not cache {path}: {e}")
+
+
+def restore(sha256, destination):
+    """
+    Places a cached artifact at `destination`. The cached file is hashed again first, a damaged entry is dropped.
+
+    Args:
+        sha256 (str): The SHA-256 of the wanted file.
+        destination (str): Where to put the file.
+
+    Returns:
+        bool: True if the file has been restored, False if it is not cached.
+    """
+    path = entry_path(sha256)
+    if not os.path.isfile(path):
+        return False
+    digest = hashlib.sha256()
+    try:
+        with open(path, "rb") as f:
+            for block in iter(lambda: f.read(BUFFER_SIZE), b""):
+                digest.update(block)
+        if digest.hexdigest() != sha256.lower():
+            logger.warning(f"Cached artifact {sha256} is damaged, removing it.")
+            os.remove(path)
+            return False
+        _link_or_copy(path, destination)
+        # mark as recently used
+        os.utime(path)
+    except OSError as e:
+        logger.warning(f"Could not restore cached artifact {sha256}: {e}")
+        return False
+    logger.info(f"Using cached artifact {sha256}")
+    return True
+
+
+def prune(max_entries=MAX_ENTRIES):
+    """Removes the least recently used artifacts until at most `max_entries` are left."""
+    entries = [os.path.join(cache_path, name) for name in os.listdir(cache_path)
+               if not name.endswith(".tmp")]
+    entries.sort(key=os.path.getmtime, reverse=True)
+    for path in entries[max_entries:]:
+        try:
+            os.remove(path)
+        except OSError:
+            pass
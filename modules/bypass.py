@@ -0,0 +1,193 @@
+import bisect
+import fnmatch
+import logging
+import ipaddress
+from urllib.parse import urlsplit
+
+logger = logging.getLogger(__name__)
+
+# A bypass list names the destinations that skip the proxy. Entries are
+#   corp.example      exactly this host
+#   *.corp.example    every subdomain of corp.example
+#   10.0.0.0/8        an IPv4 or IPv6 network, a single address is a network of one
+#   <local>           host names without a dot
+#   10.1.*, *corp*    other shell patterns, kept as they are
+LOCAL = "<local>"
+# WinINet is reported to cut off longer ProxyOverride values, `cli.py bypass apply` warns above it
+OVERRIDE_LIMIT = 2048
+
+
+def read_entries(path):
+    """
+    Reads a bypass list from a file: entries separated by new lines, commas, semicolons or spaces, `#` starts a
+    comment.
+
+    Returns:
+        list[str]: The entries in the order of the file.
+    """
+    entries = []
+    with open(path, "r", encoding="utf-8") as infile:
+        for line in infile:
+            line = line.split("#", 1)[0]
+            entries += line.replace(",", " ").replace(";", " ").split()
+    return entries
+
+
+def _network(entry):
+    try:
+        return ipaddress.ip_network(entry, strict=False)
+    except ValueError:
+        return None
+
+
+def normalize(entries):
+    """
+    Removes duplicates and entries that are covered by others: `a.corp.example` and `*.a.corp.example` when
+    `*.corp.example` is present, networks inside other networks. Adjacent networks are merged.
+
+    Args:
+        entries (list[str]): The entries, see the module comment.
+
+    Returns:
+        list[str]: The remaining entries, domains sorted from the top level down, then networks, then patterns.
+    """
+    exact, wildcards, networks, patterns = set(), set(), [], set()
+    local = False
+    for entry in entries:
+        entry = entry.strip().lower().rstrip(".")
+        if not entry:
+            continue
+        if entry == LOCAL:
+            local = True
+        elif (network := _network(entry)) is not None:
+            networks.append(network)
+        elif entry.startswith("*.") and not any(character in entry[2:] for character in "*?["):
+            wildcards.add(entry[2:])
+        elif any(character in entry for character in "*?["):
+            patterns.add(entry)
+        else:
+            exact.add(entry)
+
+    def covered(domain):
+        labels = domain.split(".")
+        return any(".".join(labels[index:]) in wildcards for index in range(1, len(labels)))
+
+    # `*.corp.example` covers `a.corp.example` and `*.a.corp.example`, but not `corp.example` itself
+    wildcards = {domain for domain in wildcards if not covered(domain)}
+    exact = {domain for domain in exact if not covered(domain)}
+
+    def by_labels(domain):
+        return list(reversed(domain.split(".")))
+
+    result = [LOCAL] if local else []
+    result += sorted([f"*.{domain}" for domain in wildcards] + list(exact),
+                     key=lambda entry: by_labels(entry.removeprefix("*.")))
+    for version in (4, 6):
+        collapsed = ipaddress.collapse_addresses(network for network in networks if network.version == version)
+        result += [str(network.network_address) if network.num_addresses == 1 else str(network)
+                   for network in collapsed]
+    result += sorted(patterns)
+    return result
+
+
+class BypassMatcher:
+    """
+    Answers whether a host would skip the proxy, in time that does not grow with the size of the list.
+
+    Domains are kept in a trie of their labels from the top level down (`corp.example` → `example`, `corp`), a lookup
+    walks the labels of the host once. Networks are merged into sorted, non-overlapping address intervals that are
+    searched with `bisect`. Only the few entries that are general shell patterns are checked one by one.
+    """
+
+    def __init__(self, entries):
+        self.trie = {}
+        self.local = False
+        self.patterns = []
+        networks = []
+        for entry in normalize(entries):
+            if entry == LOCAL:
+                self.local = True
+            elif (network := _network(entry)) is not None:
+                networks.append(network)
+            elif entry.startswith("*.") and not any(character in entry[2:] for character in "*?["):
+                self.node(entry[2:])["*"] = True
+            elif any(character in entry for character in "*?["):
+                self.patterns.append(entry)
+            else:
+                self.node(entry)[""] = True
+        # per IP version: interval starts and ends, sorted and disjoint after `normalize`
+        self.intervals = {4: ([], []), 6: ([], [])}
+        for network in networks:
+            starts, ends = self.intervals[network.version]
+            starts.append(int(network.network_address))
+            ends.append(int(network.broadcast_address))
+
+    def node(self, domain):
+        node = self.trie
+        for label in reversed(domain.split(".")):
+            node = node.setdefault(label, {})
+        return node
+
+    def match_domain(self, host):
+        node = self.trie
+        labels = host.split(".")
+        for index in range(len(labels) - 1, -1, -1):
+            node = node.get(labels[index])
+            if node is None:
+                return False
+            # a wildcard matches if at least one label is left
+            if index and node.get("*"):
+                return True
+        return node.get("", False)
+
+    def match_address(self, address):
+        starts, ends = self.intervals[address.version]
+        index = bisect.bisect_right(starts, int(address)) - 1
+        return index >= 0 and int(address) <= ends[index]
+
+    def bypasses(self, url):
+        """
+        Args:
+            url (str): A URL, or a host name or address.
+
+        Returns:
+            bool: Whether requests to the host skip the proxy.
+        """
+        host = (urlsplit(url).hostname if "://" in url else url.strip("[]")) or ""
+        host = host.lower().rstrip(".")
+        try:
+            address = ipaddress.ip_address(host)
+        except ValueError:
+            address = None
+        if address is not None:
+            if self.match_address(address):
+                return True
+        elif (self.local and "." not in host) or self.match_domain(host):
+            return True
+        return any(fnmatch.fnmatchcase(host, pattern) for pattern in self.patterns)
+
+
+def windows_entries(entries):
+    """
+    Translates entries into the ProxyOverride syntax, which knows wildcards but no networks: networks become
+    octet-aligned wildcard patterns (`10.1.0.0/16` → `10.1.*`), IPv6 networks other than single addresses are left out.
+    """
+    result = []
+    for entry in entries:
+        network = _network(entry)
+        if network is None or network.num_addresses == 1:
+            result.append(entry)
+            continue
+        if network.version == 6:
+            logger.warning(f"ProxyOverride can not express the IPv6 network {entry}, leaving it out.")
+            continue
+        prefix = -(-network.prefixlen // 8) * 8
+        for subnet in network.subnets(new_prefix=prefix) if prefix != network.prefixlen else [network]:
+            octets = str(subnet.network_address).split(".")[:prefix // 8]
+            result.append(".".join(octets + ["*"]) if prefix < 32 else str(subnet.network_address))
+    return result
+
+
+def macos_entries(entries):
+    """Translates entries for `networksetup -setproxybypassdomains`, which has no `<local>` (see ExcludeSimpleHostnames)."""
+    return [entry for entry in entries if entry != LOCAL]
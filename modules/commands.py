@@ -0,0 +1,91 @@
+import queue
+import logging
+import threading
+
+logger = logging.getLogger(__name__)
+
+
+class CommandQueue(threading.Thread):
+    """
+    Applies proxy changes one at a time on a worker thread, so that the Tk thread never waits for the registry or
+    `networksetup` and two changes never run at the same time.
+
+    There are three kinds of commands, "enabled" (True or False), "address" ("ip:port") and "bypass" (a list of
+    entries, see `modules.bypass`). Commands that have not been started yet are merged: a newer command replaces a
+    pending one of the same kind, so ON → OFF → ON while another change is running turns into a single ON and only
+    the last address is written. A pending command that requests what the running command of the same kind is
+    already applying is dropped.
+
+    Events put on `events` are tuples:
+        ("enabled", value, ok): The proxy was switched on or off, `ok` is False if the backend failed.
+        ("address", value, ok): The proxy address was changed.
+        ("bypass", value, ok): The bypass list was written.
+
+    Attributes:
+        proxy (module): The proxy backend, `modules.proxy`, `modules.proxy_macOS` or a `daemon.RemoteProxy`.
+        events (queue.Queue): The queue the results are published to.
+    """
+
+    def __init__(self, proxy, events=None):
+        super().__init__(daemon=True)
+        self.proxy = proxy
+        self.events = events if events is not None else queue.Queue()
+        # kind -> value, ordered by the time of the last request
+        self.pending = {}
+        self.running = None
+        self.condition = threading.Condition()
+
+    def set_enabled(self, enabled):
+        """Requests the proxy to be switched on or off."""
+        self.submit("enabled", bool(enabled))
+
+    def set_address(self, address):
+        """Requests a new proxy address."""
+        self.submit("address", address)
+
+    def set_bypass(self, entries):
+        """Requests a new bypass list."""
+        self.submit("bypass", list(entries))
+
+    def submit(self, kind, value):
+        self.submit_batch({kind: value})
+
+    def submit_batch(self, changes):
+        """
+        Requests several changes at once, they are queued together and applied one after another in the order of
+        `changes`.
+
+        Args:
+            changes (dict): Values by kind, e.g. {"address": "10.0.0.1:8080", "enabled": True}.
+        """
+        with self.condition:
+            for kind, value in changes.items():
+                # re-inserting keeps the pending commands in the order they were last requested
+                self.pending.pop(kind, None)
+                if self.running != (kind, value):
+                    self.pending[kind] = value
+            self.condition.notify()
+
+    def apply(self, kind, value):
+        """Runs one command through the backend, returns whether it succeeded."""
+        if kind == "enabled":
+            return bool(self.proxy.activate() if value else self.proxy.deactivate())
+        if kind == "bypass":
+            return bool(self.proxy.set_bypass(value))
+        return bool(self.proxy.change_address(value))
+
+    def run(self):
+        while True:
+            with self.condition:
+                while not self.pending:
+                    self.condition.wait()
+                kind = next(iter(self.pending))
+                self.running = (kind, self.pending.pop(kind))
+            try:
+                ok = self.apply(*self.running)
+            except Exception as e:
+                logger.error(f"Changing the proxy {kind} failed: {e}")
+                ok = False
+            self.events.put((*self.running, ok))
+            with self.condition:
+                self.running = None
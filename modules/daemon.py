@@ -0,0 +1,418 @@
+import os
+import json
+import time
+import getpass
+import logging
+import platform
+import secrets
+import tempfile
+import threading
+from multiprocessing.connection import Client, Listener, AuthenticationError
+
+logger = logging.getLogger(__name__)
+
+# The daemon keeps the proxy state and the last Wi-Fi scan in memory and serves them over a Unix domain socket
+# (a named pipe on Windows). Messages are JSON-RPC 2.0 objects, one per `send_bytes` frame:
+#   {"jsonrpc": "2.0", "id": 1, "method": "status", "params": {}}
+#   {"jsonrpc": "2.0", "id": 1, "result": {"enabled": true, "server": "10.0.0.1:8080", "updated": 1700000000.0}}
+# Connections are authenticated with a random key that only the current user can read.
+base_path = os.path.join(os.path.dirname(tempfile.gettempdir()), 'Proxy Settings')
+key_path = os.path.join(base_path, "daemon.key")
+# seconds between two reads of the proxy state where changes can not be watched
+POLL_INTERVAL = 10
+# seconds between two Wi-Fi scans
+SCAN_INTERVAL = 30
+
+PARSE_ERROR = -32700
+METHOD_NOT_FOUND = -32601
+INVALID_PARAMS = -32602
+INTERNAL_ERROR = -32603
+
+
+def address():
+    """Returns the address the daemon listens on, one per user."""
+    if os.name == "nt":
+        return rf"\\.\pipe\proxy-settings-{getpass.getuser()}"
+    return os.path.join(base_path, "daemon.sock")
+
+
+class RpcError(Exception):
+    """Raised by `DaemonClient.call` when the daemon answers with an error."""
+
+    def __init__(self, code, message):
+        super().__init__(message)
+        self.code = code
+
+
+class Daemon:
+    """
+    Serves the proxy state and the last Wi-Fi scan from memory and applies proxy changes.
+
+    Watchers keep the state fresh: on Windows a thread blocks in `RegNotifyChangeKeyValue` until the Internet Settings
+    key changes, elsewhere the state is read every `POLL_INTERVAL` seconds. Wi-Fi networks are scanned every
+    `SCAN_INTERVAL` seconds where a scanner is available. The proxy profile of the connected network is applied
+    whenever the WLAN service announces a connection change, or after each scan if it can not be watched.
+
+    Attributes:
+        proxy (module): The proxy backend, `modules.proxy` or `modules.proxy_macOS`.
+        wifi (module): The Wi-Fi backend with `scan_wifi_networks`, or None.
+        profiles (profiles.ProfileTable): The proxy profiles by network, or None.
+    """
+
+    def __init__(self, proxy, wifi=None, profiles=None):
+        self.proxy = proxy
+        self.wifi = wifi
+        self.switcher = None
+        if profiles is not None:
+            from modules.profiles import ProfileSwitcher
+            self.switcher = ProfileSwitcher(profiles, self.apply_profile, self.profile_state)
+        self.switch_lock = threading.Lock()
+        self.connection_watcher = None
+        self.state = {"proxy": {"enabled": False, "server": None, "updated": 0},
+                      "wifi": {"networks": [], "updated": 0}}
+        self.lock = threading.Lock()
+        self.write_lock = threading.Lock()
+        self.stopped = threading.Event()
+        self.methods = {
+            "status": self.status,
+            "enable": lambda: self.mutate(self.proxy.activate, enabled=True),
+            "disable": lambda: self.mutate(self.proxy.deactivate, enabled=False),
+            "set_address": lambda address: self.mutate(lambda: self.proxy.change_address(address), server=address),
+            "set_autoconfig_url": lambda url: self.mutate(lambda: self.proxy.set_autoconfig_url(url)),
+            "set_bypass": lambda entries: self.mutate(lambda: self.proxy.set_bypass(entries)),
+            "wifi": self.wifi_networks,
+            "refresh": self.refresh,
+        }
+
+    def refresh_proxy(self):
+        """Reads the proxy state from the system."""
+        with self.write_lock:
+            enabled = self.proxy.status_check()
+            server = self.proxy.server_check()
+        with self.lock:
+            self.state["proxy"] = {"enabled": enabled, "server": server, "updated": time.time()}
+
+    def refresh_wifi(self):
+        """Scans for Wi-Fi networks."""
+        networks = self.wifi.scan_wifi_networks()
+        with self.lock:
+            self.state["wifi"] = {"networks": networks, "updated": time.time()}
+        if self.switcher is not None and self.connection_watcher is None:
+            # connection changes can not be watched, the scans are the next best source
+            self.connection_changed(*self.wifi.get_connection())
+
+    def connection_changed(self, ssid, bssid):
+        """Applies the proxy profile of the connected network, called from the watcher threads and the scans."""
+        with self.switch_lock:
+            self.switcher.network_changed(ssid, bssid)
+
+    def watch_connection(self):
+        """Registers for the connection changes of the WLAN service and applies the profile of the current network."""
+        try:
+            self.connection_watcher = self.wifi.ConnectionWatcher(self.connection_changed)
+        except OSError as e:
+            logger.warning(f"Wi-Fi connection changes can not be watched, checking after each scan instead: {e}")
+        self.connection_changed(*self.wifi.get_connection())
+
+    def profile_state(self):
+        with self.lock:
+            proxy = self.state["proxy"]
+            # the bypass list is not read back, a profile always writes its own
+            return {"address": proxy["server"], "enabled": proxy["enabled"], "bypass": None}
+
+    def apply_profile(self, changes):
+        """
+        Applies the changes of a proxy profile one after another, in the order of `profiles.diff`.
+
+        Returns:
+            bool: Whether all changes were applied.
+        """
+        ok = True
+        for kind, value in changes.items():
+            if kind == "enabled":
+                result = self.methods["enable" if value else "disable"]()
+            else:
+                result = self.methods["set_" + kind](value)
+            if not result["ok"]:
+                logger.error(f"Applying the proxy {kind} of the profile failed.")
+                ok = False
+        return ok
+
+    def status(self):
+        """Returns the proxy state."""
+        with self.lock:
+            return dict(self.state["proxy"])
+
+    def wifi_networks(self):
+        """Returns the networks found by the last Wi-Fi scan."""
+        with self.lock:
+            return dict(self.state["wifi"])
+
+    def refresh(self):
+        """Reads the proxy state from the system right away and returns it."""
+        self.refresh_proxy()
+        return self.status()
+
+    def mutate(self, action, **changes):
+        """Applies a change through the backend and updates the state in memory if it succeeded."""
+        with self.write_lock:
+            ok = bool(action())
+        with self.lock:
+            if ok:
+                self.state["proxy"].update(changes, updated=time.time())
+            return {"ok": ok, **self.state["proxy"]}
+
+    def handle(self, message):
+        """
+        Answers one JSON-RPC request.
+
+        Args:
+            message (bytes): The encoded request.
+
+        Returns:
+            dict: The response object.
+        """
+        try:
+            request = json.loads(message)
+            method = self.methods[request["method"]]
+        except (ValueError, TypeError, KeyError) as e:
+            code = METHOD_NOT_FOUND if isinstance(e, KeyError) else PARSE_ERROR
+            return {"jsonrpc": "2.0", "id": None, "error": {"code": code, "message": str(e)}}
+        try:
+            result = method(**request.get("params", {}))
+        except TypeError as e:
+            return {"jsonrpc": "2.0", "id": request.get("id"),
+                    "error": {"code": INVALID_PARAMS, "message": str(e)}}
+        except Exception as e:
+            logger.error(f"{request['method']} failed: {e}")
+            return {"jsonrpc": "2.0", "id": request.get("id"),
+                    "error": {"code": INTERNAL_ERROR, "message": str(e)}}
+        return {"jsonrpc": "2.0", "id": request.get("id"), "result": result}
+
+    def serve_client(self, connection):
+        """Answers the requests of one client until it disconnects."""
+        with connection:
+            while not self.stopped.is_set():
+                try:
+                    message = connection.recv_bytes()
+                except (EOFError, OSError):
+                    return
+                response = json.dumps(self.handle(message)).encode()
+                try:
+                    connection.send_bytes(response)
+                except (EOFError, OSError):
+                    # the client went away before it got the answer
+                    return
+
+    def watch_registry(self):
+        """Refreshes the proxy state whenever a value of the Internet Settings key changes (Windows)."""
+        import ctypes
+        import winreg
+        REG_NOTIFY_CHANGE_LAST_SET = 0x4
+        key = winreg.OpenKey(winreg.HKEY_CURRENT_USER, r"Software\Microsoft\Windows\CurrentVersion\Internet Settings",
+                             0, winreg.KEY_NOTIFY | winreg.KEY_READ)
+        with key:
+            while not self.stopped.is_set():
+                # blocks until something changes
+                result = ctypes.windll.advapi32.RegNotifyChangeKeyValue(
+                    key.handle, False, REG_NOTIFY_CHANGE_LAST_SET, None, False)
+                if result != 0:
+                    raise OSError(result, "RegNotifyChangeKeyValue failed")
+                self.refresh_proxy()
+
+    def poll_proxy(self):
+        """Refreshes the proxy state every `POLL_INTERVAL` seconds."""
+        while not self.stopped.wait(POLL_INTERVAL):
+            self.refresh_proxy()
+
+    def scan_wifi(self):
+        """Refreshes the Wi-Fi scan every `SCAN_INTERVAL` seconds."""
+        while True:
+            try:
+                self.refresh_wifi()
+            except Exception as e:
+                logger.error(f"Wi-Fi scan failed: {e}")
+            if self.stopped.wait(SCAN_INTERVAL):
+                return
+
+    def watch(self):
+        """Runs the watcher that fits the system, falling back to polling."""
+        if os.name == "nt":
+            try:
+                self.watch_registry()
+                return
+            except OSError as e:
+                logger.warning(f"Can not watch the registry ({e}), polling instead.")
+        self.poll_proxy()
+
+    def serve_forever(self):
+        """
+        Listens for clients until `stopped` is set. Every client is served on its own thread.
+
+        Raises:
+            RuntimeError: If another daemon is already serving.
+        """
+        # taking over the socket and the key would leave the other daemon running without clients
+        client = connect()
+        if client is not None:
+            client.connection.close()
+            raise RuntimeError(f"A daemon is already listening on {address()}.")
+
+        os.makedirs(base_path, exist_ok=True)
+        authkey = secrets.token_bytes(32)
+        # only the current user may read the key
+        descriptor = os.open(key_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+        with os.fdopen(descriptor, "wb") as outfile:
+            outfile.write(authkey)
+
+        if os.name != "nt" and os.path.exists(address()):
+            # left behind by a daemon that did not shut down cleanly
+            os.remove(address())
+
+        self.refresh_proxy()
+        threading.Thread(target=self.watch, daemon=True).start()
+        if self.wifi is not None:
+            if self.switcher is not None:
+                self.watch_connection()
+            threading.Thread(target=self.scan_wifi, daemon=True).start()
+
+        with Listener(address(), authkey=authkey) as listener:
+            logger.info(f"Daemon listening on {address()}")
+            while not self.stopped.is_set():
+                try:
+                    connection = listener.accept()
+                except (AuthenticationError, OSError) as e:
+                    logger.warning(f"Rejected client: {e}")
+                    continue
+                threading.Thread(target=self.serve_client, args=(connection,), daemon=True).start()
+
+
+class DaemonClient:
+    """A connection to the daemon. Calls are serialized, so a client can be shared between threads."""
+
+    def __init__(self, connection):
+        self.connection = connection
+        self.lock = threading.Lock()
+        self.next_id = 0
+
+    def call(self, method, **params):
+        """
+        Calls a daemon method.
+
+        Args:
+            method (str): "status", "enable", "disable", "set_address" (with `address`), "set_autoconfig_url" (with
+                `url`), "set_bypass" (with `entries`), "wifi" or "refresh".
+            **params: The parameters of the method.
+
+        Returns:
+            The result of the method.
+
+        Raises:
+            RpcError: If the daemon answered with an error.
+            OSError, EOFError: If the connection broke.
+        """
+        with self.lock:
+            self.next_id += 1
+            self.connection.send_bytes(json.dumps(
+                {"jsonrpc": "2.0", "id": self.next_id, "method": method, "params": params}).encode())
+            response = json.loads(self.connection.recv_bytes())
+        if "error" in response:
+            raise RpcError(response["error"]["code"], response["error"]["message"])
+        return response["result"]
+
+    def close(self):
+        self.connection.close()
+
+
+def connect():
+    """
+    Connects to a running daemon.
+
+    Returns:
+        DaemonClient: The client, or None if no daemon is running.
+    """
+    try:
+        with open(key_path, "rb") as infile:
+            authkey = infile.read()
+        return DaemonClient(Client(address(), authkey=authkey))
+    except (OSError, EOFError, AuthenticationError):
+        return None
+
+
+class RemoteProxy:
+    """
+    Has the interface of the proxy backend modules, but reads the state from the daemon's memory and hands changes
+    to it. Lets the ui and the command line use the daemon without further changes. Like the backends, it logs
+    failures and returns False or a default value instead of raising.
+    """
+
+    def __init__(self, client):
+        self.client = client
+
+    def call(self, method, default, **params):
+        try:
+            return self.client.call(method, **params)
+        except (OSError, EOFError, RpcError) as e:
+            logger.error(f"The daemon did not answer {method}: {e}")
+            return default
+
+    def status(self):
+        """Returns the proxy state kept by the daemon in one call."""
+        return self.call("status", {"enabled": False, "server": None})
+
+    def activate(self):
+        return self.call("enable", {"ok": False})["ok"]
+
+    def deactivate(self):
+        return self.call("disable", {"ok": False})["ok"]
+
+    def change_address(self, new_address):
+        return self.call("set_address", {"ok": False}, address=new_address)["ok"]
+
+    def set_autoconfig_url(self, url):
+        return self.call("set_autoconfig_url", {"ok": False}, url=url)["ok"]
+
+    def set_bypass(self, entries):
+        return self.call("set_bypass", {"ok": False}, entries=entries)["ok"]
+
+    def status_check(self):
+        return self.status()["enabled"]
+
+    def server_check(self):
+        return self.status()["server"]
+
+    def fill_in_ip(self):
+        server = self.server_check()
+        return server.rpartition(":")[0] if server and ":" in server else "0.0.0.0"
+
+    def fill_in_port(self):
+        server = self.server_check()
+        return server.rpartition(":")[2] if server and ":" in server else "8080"
+
+
+def run():
+    """Runs the daemon in the foreground with the backends of the running system."""
+    if platform.system() == "Darwin":
+        import modules.proxy_macOS as proxy
+        wifi = None
+    elif platform.system() == "Windows":
+        import modules.proxy as proxy
+        import modules.wifi as wifi
+    else:
+        raise SystemExit(f"{platform.system()} is not supported.")
+    from modules import settings
+    from modules.profiles import ProfileTable
+    settings_data = settings.load_settings()
+    profiles = None
+    if settings_data["network_rules"] or settings_data["default_profile"]:
+        profiles = ProfileTable.from_settings(settings_data)
+    try:
+        Daemon(proxy, wifi, profiles).serve_forever()
+    except RuntimeError as e:
+        raise SystemExit(str(e))
+
+
+if __name__ == "__main__":
+    # python -m modules.daemon
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s - %(message)s")
+    run()
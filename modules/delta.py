@@ -0,0 +1,211 @@
+import json
+import lzma
+import contextlib
+import struct
+import hashlib
+import logging
+
+logger = logging.getLogger(__name__)
+
+MAGIC = b"PSDELTA1"
+COPY = b"C"
+INSERT = b"I"
+END = b"E"
+BUFFER_SIZE = 1024 * 1024
+
+
+class PatchError(Exception):
+    """Raised when a patch does not fit the installed file or does not rebuild the expected file."""
+
+
+def file_sha256(path):
+    """
+    Computes the SHA-256 of a file.
+
+    Args:
+        path (str): The file to hash.
+
+    Returns:
+        str: The lowercase hex digest.
+    """
+    sha256 = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(BUFFER_SIZE), b""):
+            sha256.update(block)
+    return sha256.hexdigest()
+
+
+def make_patch(old_path, new_path, patch_path, block_size=64):
+    """
+    Creates a binary patch that rebuilds `new_path` from `old_path`. Used when publishing a release.
+
+    The patch is a header with the SHA-256 of both files followed by an LZMA compressed stream of
+    "copy `length` bytes from `offset` of the old file" and "insert these bytes" instructions. Matches are found by
+    indexing every aligned `block_size` block of the old file and looking up the block at each offset of the new file.
+
+    Args:
+        old_path (str): The artifact of the previous release.
+        new_path (str): The artifact of the new release.
+        patch_path (str): Where to write the patch.
+        block_size (int, optional): Minimum length of a copied run. Defaults to 64.
+    """
+    with open(old_path, "rb") as f:
+        old = f.read()
+    with open(new_path, "rb") as f:
+        new = f.read()
+
+    index = {}
+    for offset in range(0, len(old) - block_size + 1, block_size):
+        index.setdefault(old[offset:offset + block_size], offset)
+
+    header = json.dumps({
+        "source_sha256": hashlib.sha256(old).hexdigest(),
+        "target_sha256": hashlib.sha256(new).hexdigest(),
+        "target_size": len(new),
+    }).encode()
+
+    with open(patch_path, "wb") as f:
+        f.write(MAGIC)
+        f.write(struct.pack("<I", len(header)))
+        f.write(header)
+        compressor = lzma.LZMACompressor()
+
+        def emit_insert(data):
+            if data:
+                f.write(compressor.compress(
+                    INSERT + struct.pack("<I", len(data)) + data))
+
+        literal_start = position = 0
+        while position <= len(new) - block_size:
+            source = index.get(new[position:position + block_size])
+            if source is None:
+                position += 1
+                continue
+
+            # extend the match backwards into the pending literal and forwards as far as the files agree
+            start, source_start = position, source
+            while start > literal_start and source_start > 0 and new[start - 1] == old[source_start - 1]:
+                start -= 1
+                source_start -= 1
+            end, source_end = position + block_size, source + block_size
+            while end < len(new) and source_end < len(old):
+                step = min(4096, len(new) - end, len(old) - source_end)
+                if new[end:end + step] == old[source_end:source_end + step]:
+                    end += step
+                    source_end += step
+                elif step > 1:
+                    # finish byte by byte inside the last differing step
+                    while end < len(new) and source_end < len(old) and new[end] == old[source_end]:
+                        end += 1
+                        source_end += 1
+                    break
+                else:
+                    break
+
+            emit_insert(new[literal_start:start])
+            f.write(compressor.compress(
+                COPY + struct.pack("<QI", source_start, end - start)))
+            literal_start = position = end
+
+        emit_insert(new[literal_start:])
+        f.write(compressor.compress(END))
+        f.write(compressor.flush())
+
+
+class _PatchReader:
+    """Reads the decompressed instruction stream of a patch file in small pieces."""
+
+    def __init__(self, f):
+        self.f = f
+        self.decompressor = lzma.LZMADecompressor()
+        self.buffer = bytearray()
+
+    def read(self, size):
+        while len(self.buffer) < size:
+            if self.decompressor.eof:
+                raise PatchError("Patch ended unexpectedly.")
+            data = self.f.read(BUFFER_SIZE) if self.decompressor.needs_input else b""
+            if not data and self.decompressor.needs_input:
+                raise PatchError("Patch ended unexpectedly.")
+            self.buffer += self.decompressor.decompress(
+                data, max_length=BUFFER_SIZE)
+        result = bytes(self.buffer[:size])
+        del self.buffer[:size]
+        return result
+
+
+def _read_header(f):
+    if f.read(len(MAGIC)) != MAGIC:
+        raise PatchError("Not a patch file.")
+    length, = struct.unpack("<I", f.read(4))
+    return json.loads(f.read(length))
+
+
+def apply_patch(source_path, patch_path, target):
+    """
+    Rebuilds a file from the installed artifact and a patch, streaming both and verifying the result.
+
+    The source is checked against the SHA-256 recorded in the patch before anything is written, and the target is
+    hashed while it is written. Only a bounded amount of data is held in memory at any time.
+
+    Args:
+        source_path (str): The installed artifact the patch was made against.
+        patch_path (str): The patch file.
+        target (str | file object): Where to write the rebuilt file, either a path or a binary file opened for writing.
+
+    Returns:
+        str: The SHA-256 of the rebuilt file.
+
+    Raises:
+        PatchError: If the source does not match, the patch is damaged or the result has the wrong hash.
+    """
+    with open(patch_path, "rb") as patch:
+        header = _read_header(patch)
+        if file_sha256(source_path) != header["source_sha256"]:
+            raise PatchError(
+                "The installed version does not match the patch source.")
+
+        sha256 = hashlib.sha256()
+        reader = _PatchReader(patch)
+        written = 0
+        target_context = open(target, "wb") if isinstance(
+            target, str) else contextlib.nullcontext(target)
+        with open(source_path, "rb") as source, target_context as target:
+            while True:
+                op = reader.read(1)
+                if op == END:
+                    break
+                elif op == COPY:
+                    offset, length = struct.unpack("<QI", reader.read(12))
+                    source.seek(offset)
+                    while length:
+                        block = source.read(min(length, BUFFER_SIZE))
+                        if not block:
+                            raise PatchError("Patch copies past the end of the source.")
+                        target.write(block)
+                        sha256.update(block)
+                        length -= len(block)
+                        written += len(block)
+                elif op == INSERT:
+                    length, = struct.unpack("<I", reader.read(4))
+                    while length:
+                        block = reader.read(min(length, BUFFER_SIZE))
+                        target.write(block)
+                        sha256.update(block)
+                        length -= len(block)
+                        written += len(block)
+                else:
+                    raise PatchError(f"Unknown patch instruction {op!r}.")
+
+    digest = sha256.hexdigest()
+    if written != header["target_size"] or digest != header["target_sha256"]:
+        raise PatchError(
+            f"Rebuilt file does not match: expected {header['target_sha256']}, got {digest}")
+    logger.info(f"Rebuilt {written} bytes from patch {patch_path}")
+    return digest
+
+
+if __name__ == "__main__":
+    # python -m modules.delta <old artifact> <new artifact> <patch>
+    import sys
+    make_patch(sys.argv[1], sys.argv[2], sys.argv[3])
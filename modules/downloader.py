@@ -0,0 +1,538 @@
+import os
+import json
+import time
+import hashlib
+import queue
+import logging
+import threading
+import requests
+import urllib3
+from urllib.parse import urlparse
+from urllib.request import url2pathname
+from requests.adapters import BaseAdapter, HTTPAdapter
+from requests.structures import CaseInsensitiveDict
+from concurrent.futures import ThreadPoolExecutor
+from modules import artifacts
+from modules.extract import ExtractError, StreamExtractor
+
+logger = logging.getLogger(__name__)
+
+MIN_CHUNK_SIZE = 64 * 1024
+MAX_CHUNK_SIZE = 4 * 1024 * 1024
+
+
+class LocalFileAdapter(BaseAdapter):
+    """
+    Answers `file://` requests from the file system, so that an update source can be a local directory or a network
+    share (`file://server/share/...`). Only whole-file GET requests are supported, which is all the updater sends
+    without an ETag.
+    """
+
+    def send(self, request, **kwargs):
+        url = urlparse(request.url)
+        path = url2pathname(f"//{url.netloc}{url.path}" if url.netloc else url.path)
+        response = requests.Response()
+        response.request = request
+        response.url = request.url
+        response.headers = CaseInsensitiveDict()
+        try:
+            if request.method != "GET":
+                raise PermissionError(f"{request.method} is not supported for local files")
+            response.raw = open(path, "rb")
+            response.status_code, response.reason = 200, "OK"
+            response.headers["Content-Length"] = str(os.fstat(response.raw.fileno()).st_size)
+        except FileNotFoundError:
+            response.status_code, response.reason = 404, "Not Found"
+        except OSError:
+            response.status_code, response.reason = 403, "Forbidden"
+        return response
+
+    def close(self):
+        pass
+
+
+# One pooled session for every request of the updater, so connections (and TLS sessions) are reused
+session = requests.Session()
+session.mount("https://", HTTPAdapter(pool_connections=4, pool_maxsize=8))
+session.mount("http://", HTTPAdapter(pool_connections=4, pool_maxsize=8))
+session.mount("file://", LocalFileAdapter())
+
+
+class DownloadInterrupted(Exception):
+    """Raised when the connection ends before the full body has been received."""
+
+
+class ReleaseChanged(Exception):
+    """Raised when the server no longer serves the file a partial download belongs to."""
+
+
+class ChecksumMismatch(Exception):
+    """Raised when the downloaded file does not match its published SHA-256 checksum."""
+
+
+def parse_checksums(text):
+    """
+    Parses a `SHA256SUMS` file as written by `sha256sum`.
+
+    Args:
+        text (str): The content of the checksum file.
+
+    Returns:
+        dict: The lowercase hex digest for every file name listed.
+    """
+    checksums = {}
+    for line in text.splitlines():
+        parts = line.strip().split(None, 1)
+        if len(parts) == 2:
+            # binary mode entries are prefixed with an asterisk
+            checksums[parts[1].lstrip("*")] = parts[0].lower()
+    return checksums
+
+
+class StreamHasher:
+    """
+    Computes the SHA-256 of a file in a single pass while its bytes arrive, fed from the download buffers.
+
+    SHA-256 has to see the bytes in file order. Data that continues the hashed prefix is hashed right away, data of
+    segments further ahead is copied into a reorder buffer and hashed as soon as the prefix reaches it. Once `limit`
+    bytes are buffered, segments that are ahead wait in `feed` until the prefix has caught up, so memory stays bounded
+    while the segment at the prefix never waits. Only bytes written by an earlier run that is being resumed are read
+    from the file, when the prefix reaches them.
+
+    Attributes:
+        path (str): The file the download is written to.
+        limit (int): Maximum number of bytes held in the reorder buffer.
+    """
+
+    def __init__(self, path, resumed=(), limit=64 * 1024 * 1024):
+        """
+        Args:
+            path (str): The file the download is written to.
+            resumed (list[tuple[int, int]]): The `(start, end)` ranges that an earlier run has already written.
+            limit (int, optional): Maximum number of bytes held in the reorder buffer. Defaults to 64 MiB.
+        """
+        self.path = path
+        self.limit = limit
+        self.sha256 = hashlib.sha256()
+        self.position = 0
+        self.resumed = {start: end for start, end in resumed if end > start}
+        self.pending = {}
+        self.buffered = 0
+        self.aborted = False
+        self.condition = threading.Condition()
+
+    def advance(self):
+        """Hashes buffered and resumed data that continues the prefix. Must be called with `condition` held."""
+        while True:
+            if self.position in self.pending:
+                chunk = self.pending.pop(self.position)
+                self.buffered -= len(chunk)
+                self.sha256.update(chunk)
+                self.position += len(chunk)
+            elif self.position in self.resumed:
+                end = self.resumed.pop(self.position)
+                with open(self.path, "rb") as f:
+                    f.seek(self.position)
+                    while self.position < end:
+                        block = f.read(min(MAX_CHUNK_SIZE, end - self.position))
+                        if not block:
+                            raise OSError(f"{self.path} ends before its journaled data")
+                        self.sha256.update(block)
+                        self.position += len(block)
+            else:
+                return
+
+    def feed(self, offset, data):
+        """
+        Hashes `data`, or keeps a copy until the prefix reaches it. Blocks while the reorder buffer is full and `data`
+        is ahead of the prefix.
+
+        Args:
+            offset (int): File offset of the first byte of `data`.
+            data (bytes-like): The bytes that have just been written at `offset`.
+        """
+        with self.condition:
+            self.advance()
+            while offset != self.position and self.buffered + len(data) > self.limit and not self.aborted:
+                self.condition.wait()
+            if self.aborted:
+                return
+            if offset != self.position:
+                self.pending[offset] = bytes(data)
+                self.buffered += len(data)
+                return
+            self.sha256.update(data)
+            self.position += len(data)
+            self.advance()
+            self.condition.notify_all()
+
+    def abort(self):
+        """Releases the segments waiting in `feed`, the hash is incomplete afterwards."""
+        with self.condition:
+            self.aborted = True
+            self.pending.clear()
+            self.condition.notify_all()
+
+    def finish(self, size):
+        """
+        Hashes what is left, which is only data of an earlier run at the end of the file.
+
+        Args:
+            size (int): Size of the file in bytes.
+
+        Returns:
+            str: The lowercase hex digest of the whole file.
+
+        Raises:
+            OSError: If not all of the file could be hashed.
+        """
+        with self.condition:
+            self.advance()
+            if self.position != size:
+                raise OSError(f"Only {self.position} of {size} bytes could be hashed")
+            return self.sha256.hexdigest()
+
+
+def lower_thread_priority():
+    """Lowers the scheduling priority of the calling thread, where the operating system allows it."""
+    try:
+        if os.name == "nt":
+            import ctypes
+            THREAD_PRIORITY_LOWEST = -2
+            kernel32 = ctypes.windll.kernel32
+            kernel32.SetThreadPriority(kernel32.GetCurrentThread(), THREAD_PRIORITY_LOWEST)
+        else:
+            # Linux schedules threads individually, elsewhere this fails and the priority stays unchanged
+            os.setpriority(os.PRIO_PROCESS, threading.get_native_id(), 10)
+    except (OSError, AttributeError) as e:
+        logger.debug(f"Could not lower thread priority: {e}")
+
+
+class Downloader(threading.Thread):
+    """
+    Downloads a file on a worker thread and publishes throttled progress events through a queue.
+
+    The response body is read straight into a reusable buffer. The read size adapts to the link speed: it grows while
+    reads return quickly and shrinks again when a single read takes too long, so that progress keeps flowing on slow links
+    and fast links are not throttled by per-chunk overhead.
+
+    Large files on servers that accept `Range` requests are split into `segments` byte ranges which are fetched
+    concurrently over the pooled `session` and written straight into a preallocated file at their offsets. Otherwise
+    the file is fetched as a single stream.
+
+    Downloads are resumable. Data is written to `<path>.part` and a small journal `<path>.part.json` records, per
+    segment, the offset that has been written together with the ETag of the download. Retries, and later runs for the
+    same path, continue from those offsets with `Range` requests. If the ETag changed in the meantime the download
+    starts over.
+
+    The SHA-256 of the file is computed from the same buffers while the data arrives. If `sha256` is given and the
+    result differs, the partial file is deleted and an error is published instead of "done". Finished downloads are
+    kept in the content-addressed artifact cache (see `modules.artifacts`), a file with a known `sha256` that is
+    already cached is not downloaded again.
+
+    With `extract_to`, the file is a zip archive that is extracted from the same buffers while it arrives (see
+    `extract.StreamExtractor`). The extracted directory is only moved into place once the checksum matched.
+
+    Events put on `events` are tuples:
+        ("progress", downloaded, total, elapsed): `total` is None if the server sent no Content-Length.
+        ("done", path, sha256): The download finished, the file is complete and has the given SHA-256.
+        ("error", message): The download failed.
+
+    Attributes:
+        url (str): The URL to download.
+        path (str): The file the download is written to once it is complete.
+        events (queue.Queue): The queue progress events are published to.
+        progress_interval (float): Minimum number of seconds between two progress events.
+        retries (int): How often an interrupted download is resumed before giving up.
+        segments (int): Maximum number of byte ranges fetched concurrently.
+        segment_threshold (int): Files smaller than this many bytes are always fetched as a single stream.
+        sha256 (str): The expected lowercase hex SHA-256 of the file, or None to skip verification.
+        rate_limit (int): Maximum average download speed in bytes per second, or None for no limit.
+        low_priority (bool): Whether the download threads run at a lowered scheduling priority.
+        cache (bool): Whether to use the artifact cache.
+        extract_to (str): Directory to extract the downloaded zip archive to, or None to keep the archive only.
+    """
+
+    def __init__(self, url, path, events=None, progress_interval=0.1, timeout=(5, 30), retries=5,
+                 journal_interval=1.0, segments=4, segment_threshold=8 * 1024 * 1024, sha256=None,
+                 rate_limit=None, low_priority=False, cache=True, extract_to=None):
+        super().__init__(daemon=True)
+        self.url = url
+        self.path = path
+        self.part_path = path + ".part"
+        self.journal_path = path + ".part.json"
+        self.events = events if events is not None else queue.Queue()
+        self.progress_interval = progress_interval
+        self.journal_interval = journal_interval
+        self.timeout = timeout
+        self.retries = retries
+        self.segments = segments
+        self.segment_threshold = segment_threshold
+        self.sha256 = sha256.lower() if sha256 else None
+        self.rate_limit = rate_limit
+        self.low_priority = low_priority
+        self.cache = cache
+        self.extract_to = extract_to
+        self.extractor = None
+        self.hasher = None
+        self.cancelled = threading.Event()
+        self.lock = threading.Lock()
+
+    def cancel(self):
+        """Asks the worker to stop at the next chunk boundary."""
+        self.cancelled.set()
+        if self.hasher is not None:
+            self.hasher.abort()
+
+    def run(self):
+        if self.cache and self.sha256 and artifacts.restore(self.sha256, self.path):
+            try:
+                if self.extract_to:
+                    StreamExtractor(self.extract_to).finish(self.path, os.path.getsize(self.path))
+            except (OSError, ExtractError) as e:
+                logger.error(f"Extracting {self.path} failed: {e}")
+                self.events.put(("error", str(e)))
+                return
+            self.events.put(("done", self.path, self.sha256))
+            return
+
+        for attempt in range(self.retries + 1):
+            try:
+                self.download()
+                return
+            except ReleaseChanged as e:
+                # throw the partial data away and start over on the next attempt
+                logger.info(f"{e}, restarting download")
+                if os.path.exists(self.journal_path):
+                    os.remove(self.journal_path)
+                error = e
+            except (DownloadInterrupted, requests.exceptions.ConnectionError,
+                    requests.exceptions.ChunkedEncodingError, requests.exceptions.Timeout) as e:
+                if attempt == self.retries or self.cancelled.is_set():
+                    error = e
+                    break
+                logger.warning(
+                    f"Download interrupted ({e}), resuming (attempt {attempt + 1} of {self.retries})...")
+                time.sleep(min(2 ** attempt, 10))
+            except ChecksumMismatch as e:
+                for path in (self.part_path, self.journal_path):
+                    if os.path.exists(path):
+                        os.remove(path)
+                error = e
+                break
+            except (OSError, ExtractError, requests.exceptions.RequestException) as e:
+                error = e
+                break
+        if self.extractor is not None:
+            self.extractor.discard()
+        logger.error(f"Download of {self.url} failed: {error}")
+        self.events.put(("error", str(error)))
+
+    def load_journal(self):
+        """
+        Reads the journal of a previous partial download of the same URL.
+
+        Returns:
+            dict: The journal with the keys "url", "etag", "total" and "segments" (a list of `[start, end, written]`
+            byte offsets), or None if there is nothing to resume.
+        """
+        try:
+            with open(self.journal_path, "r") as infile:
+                journal = json.load(infile)
+            if journal.get("url") != self.url or not journal.get("etag"):
+                return None
+            if not os.path.exists(self.part_path):
+                return None
+            return journal
+        except (OSError, ValueError):
+            return None
+
+    def save_journal(self):
+        """Atomically replaces the journal with the current segment offsets. Must be called with `lock` held."""
+        if not self.etag:
+            # without an ETag there is no way to tell whether a later resume would still match
+            return
+        temp_path = self.journal_path + ".tmp"
+        with open(temp_path, "w") as outfile:
+            json.dump({"url": self.url, "etag": self.etag, "total": self.total,
+                       "segments": self.segment_state}, outfile)
+        os.replace(temp_path, self.journal_path)
+
+    def split(self, total):
+        """
+        Splits a file into the byte ranges that are fetched concurrently.
+
+        Args:
+            total (int): Size of the file in bytes.
+
+        Returns:
+            list[list[int]]: One `[start, end, written]` entry per segment, `end` being exclusive.
+        """
+        count = max(1, min(self.segments, total // (self.segment_threshold // 2)))
+        size = -(-total // count)
+        return [[start, min(start + size, total), start] for start in range(0, total, size)]
+
+    def download(self):
+        """Performs (or resumes) the download, publishing progress and a final "done" or "cancelled" error event."""
+        journal = self.load_journal()
+        first_response = None
+
+        if journal is not None:
+            self.etag = journal["etag"]
+            self.total = journal["total"]
+            self.segment_state = journal["segments"]
+            logger.info(
+                f"Resuming download at {sum(s[2] - s[0] for s in self.segment_state)} bytes")
+        else:
+            # ask for the raw bytes so that reads can go straight into the buffer
+            first_response = session.get(self.url, headers={"Accept-Encoding": "identity"},
+                                         stream=True, timeout=self.timeout)
+            first_response.raise_for_status()
+            self.etag = first_response.headers.get("etag")
+            length = first_response.headers.get("content-length")
+            self.total = int(length) if length is not None else None
+
+            ranges = first_response.headers.get("accept-ranges") == "bytes"
+            if ranges and self.etag and self.total and self.total >= self.segment_threshold:
+                self.segment_state = self.split(self.total)
+            else:
+                self.segment_state = [[0, self.total, 0]]
+
+            # preallocate the file so every segment can write at its own offset
+            with open(self.part_path, "wb") as f:
+                if self.total:
+                    f.truncate(self.total)
+
+        self.hasher = StreamHasher(self.part_path, [(start, written) for start, end, written in self.segment_state])
+        if self.extract_to:
+            self.extractor = StreamExtractor(self.extract_to)
+        self.transferred = 0
+        self.start_time = self.last_published = self.last_journaled = time.monotonic()
+        pending = [i for i, (start, end, written) in enumerate(self.segment_state)
+                   if end is None or written < end]
+
+        with ThreadPoolExecutor(max_workers=max(len(pending), 1)) as pool:
+            futures = [pool.submit(self.run_segment, i, first_response if i == 0 else None)
+                       for i in pending]
+        if first_response is not None:
+            first_response.close()
+        for future in futures:
+            future.result()
+
+        if self.cancelled.is_set():
+            self.events.put(("error", "Download cancelled."))
+            return
+
+        downloaded = sum(s[2] - s[0] for s in self.segment_state)
+        digest = self.hasher.finish(downloaded)
+        if self.sha256 and digest != self.sha256:
+            raise ChecksumMismatch(
+                f"Checksum mismatch: expected {self.sha256}, got {digest}")
+
+        os.replace(self.part_path, self.path)
+        if os.path.exists(self.journal_path):
+            os.remove(self.journal_path)
+        if self.cache:
+            artifacts.store(self.path, digest)
+        if self.extractor is not None:
+            self.extractor.finish(self.path, downloaded)
+        self.events.put(("progress", downloaded, self.total, time.monotonic() - self.start_time))
+        self.events.put(("done", self.path, digest))
+
+    def run_segment(self, index, response=None):
+        """Runs `fetch_segment`, if it fails the other segments may be waiting for it in `StreamHasher.feed`."""
+        try:
+            self.fetch_segment(index, response)
+        except BaseException:
+            self.hasher.abort()
+            raise
+
+    def fetch_segment(self, index, response=None):
+        """
+        Downloads one byte range into the part file.
+
+        Args:
+            index (int): Index of the segment in `segment_state`.
+            response (requests.Response, optional): An already open response whose body starts at the segment's
+                current offset. If omitted, a `Range` request for the rest of the segment is sent.
+        """
+        start, end, written = self.segment_state[index]
+        if self.low_priority:
+            lower_thread_priority()
+
+        if response is None:
+            headers = {"Accept-Encoding": "identity", "If-Range": self.etag,
+                       "Range": f"bytes={written}-{end - 1 if end is not None else ''}"}
+            response = session.get(self.url, headers=headers, stream=True, timeout=self.timeout)
+            response.raise_for_status()
+            if response.status_code != 206 or response.headers.get("etag") != self.etag:
+                response.close()
+                raise ReleaseChanged("Release changed on the server")
+
+        # with a rate limit, keep reads small so that the limit is enforced smoothly
+        max_chunk_size = MAX_CHUNK_SIZE
+        if self.rate_limit:
+            max_chunk_size = max(MIN_CHUNK_SIZE, min(MAX_CHUNK_SIZE, self.rate_limit // 4))
+        buffer = bytearray(max_chunk_size)
+        view = memoryview(buffer)
+        chunk_size = MIN_CHUNK_SIZE
+
+        # unbuffered, so that everything counted in the journal has been handed to the OS
+        with response, open(self.part_path, "r+b", buffering=0) as f:
+            f.seek(written)
+            try:
+                while not self.cancelled.is_set() and (end is None or written < end):
+                    read_start = time.monotonic()
+                    wanted = chunk_size if end is None else min(chunk_size, end - written)
+                    read = response.raw.readinto(view[:wanted])
+                    if not read:
+                        break
+                    position = 0
+                    while position < read:
+                        position += f.write(view[position:read])
+                    self.hasher.feed(written, view[:read])
+                    if self.extractor is not None:
+                        self.extractor.feed(written, view[:read])
+                    written += read
+                    self.advance(index, written, read)
+
+                    # grow the read size while reads fill up fast, shrink it when a read stalls
+                    elapsed = time.monotonic() - read_start
+                    if read == chunk_size and elapsed < 0.05:
+                        chunk_size = min(chunk_size * 2, max_chunk_size)
+                    elif elapsed > 0.25:
+                        chunk_size = max(chunk_size // 2, MIN_CHUNK_SIZE)
+            except (requests.exceptions.RequestException, urllib3.exceptions.HTTPError, OSError) as e:
+                # whatever reached the file is still valid, keep it for the next attempt
+                # (reads from `response.raw` raise the errors of urllib3, which requests only wraps for `iter_content`)
+                with self.lock:
+                    self.save_journal()
+                raise DownloadInterrupted(str(e)) from e
+
+        with self.lock:
+            self.save_journal()
+        if not self.cancelled.is_set() and end is not None and written != end:
+            raise DownloadInterrupted(
+                f"Connection closed after {written - start} of {end - start} bytes.")
+
+    def advance(self, index, written, read):
+        """
+        Records the progress of a segment and publishes progress and the journal when they are due.
+        With a `rate_limit`, blocks the calling segment until the average speed is back under the limit.
+        """
+        with self.lock:
+            self.segment_state[index][2] = written
+            self.transferred += read
+            now = time.monotonic()
+            if now - self.last_published >= self.progress_interval:
+                downloaded = sum(s[2] - s[0] for s in self.segment_state)
+                self.events.put(
+                    ("progress", downloaded, self.total, now - self.start_time))
+                self.last_published = now
+            if now - self.last_journaled >= self.journal_interval:
+                self.save_journal()
+                self.last_journaled = now
+            delay = self.transferred / self.rate_limit - \
+                (now - self.start_time) if self.rate_limit else 0
+        if delay > 0:
+            time.sleep(delay)
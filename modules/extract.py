@@ -0,0 +1,312 @@
+import os
+import stat
+import zlib
+import shutil
+import struct
+import logging
+import zipfile
+import threading
+
+logger = logging.getLogger(__name__)
+
+LOCAL_HEADER = struct.Struct("<IHHHHHIIIHH")
+LOCAL_HEADER_SIGNATURE = 0x04034b50
+CENTRAL_DIRECTORY_SIGNATURE = 0x02014b50
+END_OF_CENTRAL_DIRECTORY_SIGNATURE = 0x06054b50
+DATA_DESCRIPTOR_SIGNATURE = 0x08074b50
+# upper bound for the output of a single decompression step
+OUTPUT_SIZE = 4 * 1024 * 1024
+BUFFER_SIZE = 1024 * 1024
+
+
+class ExtractError(Exception):
+    """Raised when an archive is damaged or contains entries that can not be extracted safely."""
+
+
+class _Unsupported(Exception):
+    """The stream uses a zip feature that can only be read through the central directory."""
+
+
+def _safe_path(root, name):
+    """Maps an entry name to a path inside `root`, refusing names that would escape it."""
+    parts = [part for part in name.replace("\\", "/").split("/")
+             if part not in ("", ".")]
+    if not parts or ".." in parts or ":" in parts[0]:
+        raise ExtractError(f"Refusing to extract {name!r}.")
+    return os.path.join(root, *parts)
+
+
+class StreamExtractor:
+    """
+    Extracts a zip archive into a directory while it is being downloaded, fed from the download buffers.
+
+    Like `downloader.StreamHasher`, only bytes that continue the already consumed prefix are accepted. Entries are
+    parsed from their local headers, inflated and written straight to `<destination>.tmp`, checking the CRC-32 of
+    every entry. `finish` reads whatever could not be consumed in-stream from the downloaded file, applies the unix
+    permissions and symlinks from the central directory and moves the directory into place. Archives the stream
+    parser can not handle (encrypted entries, unknown compression, stored entries without sizes) are extracted from
+    the downloaded file with `zipfile` instead, still in one pass.
+
+    Attributes:
+        destination (str): The directory the archive is extracted to.
+        streaming (bool): False once the stream parser gave up and `finish` falls back to `zipfile`.
+    """
+
+    def __init__(self, destination):
+        self.destination = destination
+        self.temp_path = destination + ".tmp"
+        shutil.rmtree(self.temp_path, ignore_errors=True)
+        os.makedirs(self.temp_path)
+        self.position = 0
+        self.streaming = True
+        self.buffer = bytearray()
+        self.entry = None
+        self.done = False
+        self.extracted = {}
+        self.lock = threading.Lock()
+
+    def feed(self, offset, data):
+        """
+        Extracts `data` if it starts exactly where the consumed prefix ends. Never raises, problems with the stream
+        only disable streaming.
+
+        Args:
+            offset (int): Offset of the first byte of `data` in the archive.
+            data (bytes-like): The bytes that have just been written at `offset`.
+        """
+        # cheap check first, so that out of order segments do not wait for the lock
+        if offset != self.position or not self.streaming:
+            return
+        with self.lock:
+            if offset != self.position or not self.streaming:
+                return
+            self.position += len(data)
+            if self.done:
+                return
+            try:
+                self.buffer += data
+                self.parse()
+            except (_Unsupported, ExtractError, OSError, zlib.error, struct.error, ValueError) as e:
+                logger.info(f"Extracting from the downloaded file instead of the stream: {e}")
+                self.stop_streaming()
+
+    def stop_streaming(self):
+        """Gives up on the stream, `finish` extracts from the downloaded file."""
+        self.streaming = False
+        self.buffer = bytearray()
+        if self.entry is not None:
+            self.entry["file"].close()
+            self.entry = None
+
+    def parse(self):
+        """Consumes as much of the buffer as possible."""
+        while not self.done:
+            if self.entry is None:
+                if not self.read_header():
+                    return
+            elif self.entry.get("descriptor"):
+                if not self.read_descriptor():
+                    return
+            elif not self.read_data():
+                return
+
+    def read_header(self):
+        """Parses the next local file header and opens its output, returns False if more data is needed."""
+        if len(self.buffer) < 4:
+            return False
+        signature, = struct.unpack_from("<I", self.buffer)
+        if signature in (CENTRAL_DIRECTORY_SIGNATURE, END_OF_CENTRAL_DIRECTORY_SIGNATURE):
+            # all entries have been read, the rest is metadata that `finish` reads from the file
+            self.done = True
+            self.buffer = bytearray()
+            return False
+        if signature != LOCAL_HEADER_SIGNATURE:
+            raise _Unsupported(f"unexpected signature {signature:#x}")
+        if len(self.buffer) < LOCAL_HEADER.size:
+            return False
+        (_, _, flags, method, _, _, crc, compressed_size, size,
+         name_length, extra_length) = LOCAL_HEADER.unpack_from(self.buffer)
+        header_size = LOCAL_HEADER.size + name_length + extra_length
+        if len(self.buffer) < header_size:
+            return False
+
+        name = bytes(self.buffer[LOCAL_HEADER.size:LOCAL_HEADER.size + name_length]).decode(
+            "utf-8" if flags & 0x800 else "cp437")
+        extra = bytes(self.buffer[LOCAL_HEADER.size + name_length:header_size])
+        del self.buffer[:header_size]
+
+        zip64 = False
+        position = 0
+        while position + 4 <= len(extra):
+            header_id, length = struct.unpack_from("<HH", extra, position)
+            if header_id == 0x0001:
+                zip64 = True
+                values = iter(struct.unpack_from(f"<{length // 8}Q", extra, position + 4))
+                if size == 0xFFFFFFFF:
+                    size = next(values)
+                if compressed_size == 0xFFFFFFFF:
+                    compressed_size = next(values)
+            position += 4 + length
+
+        if flags & 0x1:
+            raise _Unsupported(f"{name} is encrypted")
+        if method not in (zipfile.ZIP_STORED, zipfile.ZIP_DEFLATED):
+            raise _Unsupported(f"{name} uses compression method {method}")
+        if flags & 0x8 and method == zipfile.ZIP_STORED:
+            raise _Unsupported(f"the size of {name} is only known from the central directory")
+
+        path = _safe_path(self.temp_path, name)
+        if name.endswith("/"):
+            os.makedirs(path, exist_ok=True)
+            return True
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        self.entry = {
+            "name": name, "path": path, "file": open(path, "wb"), "method": method,
+            "crc": crc, "size": size, "zip64": zip64, "has_descriptor": bool(flags & 0x8),
+            "remaining": None if flags & 0x8 else compressed_size, "actual_crc": 0, "written": 0,
+            "decompressor": zlib.decompressobj(-15) if method == zipfile.ZIP_DEFLATED else None,
+        }
+        return True
+
+    def write(self, data):
+        """Writes inflated bytes of the current entry, updating its CRC-32."""
+        entry = self.entry
+        entry["file"].write(data)
+        entry["actual_crc"] = zlib.crc32(data, entry["actual_crc"])
+        entry["written"] += len(data)
+
+    def read_data(self):
+        """Consumes compressed data of the current entry, returns False if more data is needed."""
+        entry = self.entry
+        if not self.buffer:
+            return False
+        take = len(self.buffer) if entry["remaining"] is None else min(
+            len(self.buffer), entry["remaining"])
+        chunk = bytes(self.buffer[:take])
+        del self.buffer[:take]
+        if entry["remaining"] is not None:
+            entry["remaining"] -= take
+
+        decompressor = entry["decompressor"]
+        if decompressor is None:
+            self.write(chunk)
+        else:
+            while chunk and not decompressor.eof:
+                self.write(decompressor.decompress(chunk, OUTPUT_SIZE))
+                chunk = decompressor.unconsumed_tail
+            if decompressor.eof:
+                # whatever follows the deflate stream belongs to the next record
+                self.buffer[:0] = decompressor.unused_data
+                if entry["remaining"] is not None:
+                    entry["remaining"] = 0
+
+        finished = entry["remaining"] == 0 if decompressor is None else decompressor.eof
+        if not finished:
+            return False
+        if entry["has_descriptor"]:
+            entry["descriptor"] = True
+        else:
+            self.close_entry(entry["crc"], entry["size"])
+        return True
+
+    def read_descriptor(self):
+        """Reads the data descriptor that follows entries written without sizes, returns False if more data is needed."""
+        entry = self.entry
+        size_format = "<IQQ" if entry["zip64"] else "<III"
+        length = struct.calcsize(size_format)
+        if len(self.buffer) < 4 + length:
+            return False
+        offset = 4 if struct.unpack_from("<I", self.buffer)[0] == DATA_DESCRIPTOR_SIGNATURE else 0
+        crc, _, size = struct.unpack_from(size_format, self.buffer, offset)
+        del self.buffer[:offset + length]
+        self.close_entry(crc, size)
+        return True
+
+    def close_entry(self, crc, size):
+        """Closes the current entry and checks it against the recorded CRC-32 and size."""
+        entry = self.entry
+        entry["file"].close()
+        self.entry = None
+        if entry["actual_crc"] != crc or entry["written"] != size:
+            raise ExtractError(f"Bad CRC-32 for {entry['name']}.")
+        self.extracted[entry["name"]] = size
+
+    def finish(self, path, size):
+        """
+        Completes the extraction and moves the result to `destination`.
+
+        Args:
+            path (str): The complete archive.
+            size (int): Size of the archive in bytes.
+
+        Raises:
+            ExtractError: If the archive is damaged or an entry fails its CRC check.
+        """
+        with self.lock:
+            if self.streaming and not self.done:
+                try:
+                    with open(path, "rb") as f:
+                        f.seek(self.position)
+                        while self.position < size and not self.done:
+                            block = f.read(min(BUFFER_SIZE, size - self.position))
+                            if not block:
+                                break
+                            self.position += len(block)
+                            self.buffer += block
+                            self.parse()
+                except (_Unsupported, ExtractError, OSError, zlib.error, struct.error, ValueError) as e:
+                    logger.info(f"Extracting from the downloaded file instead of the stream: {e}")
+                    self.stop_streaming()
+
+            try:
+                with zipfile.ZipFile(path) as archive:
+                    infos = archive.infolist()
+                    if not self.streaming or not self.done or any(
+                            not info.is_dir() and self.extracted.get(info.filename) != info.file_size for info in infos):
+                        shutil.rmtree(self.temp_path, ignore_errors=True)
+                        os.makedirs(self.temp_path)
+                        for info in infos:
+                            # `zipfile` checks the CRC-32 while reading
+                            archive.extract(info, self.temp_path)
+                    for info in infos:
+                        self.apply_attributes(info)
+            except ExtractError:
+                self.discard()
+                raise
+            except (zipfile.BadZipFile, zlib.error, EOFError) as e:
+                self.discard()
+                raise ExtractError(f"Damaged archive: {e}") from e
+
+        shutil.rmtree(self.destination, ignore_errors=True)
+        os.replace(self.temp_path, self.destination)
+
+    def apply_attributes(self, info):
+        """Restores the unix permissions and symlinks of an entry, `.app` bundles need both."""
+        mode = info.external_attr >> 16
+        path = _safe_path(self.temp_path, info.filename)
+        if stat.S_ISLNK(mode):
+            # the entry content is the link target
+            with open(path, "r") as infile:
+                link_target = infile.read()
+            os.remove(path)
+            os.symlink(link_target, path)
+        elif mode and not info.is_dir():
+            os.chmod(path, stat.S_IMODE(mode))
+
+    def discard(self):
+        """Removes everything extracted so far."""
+        if self.entry is not None:
+            self.entry["file"].close()
+            self.entry = None
+        shutil.rmtree(self.temp_path, ignore_errors=True)
+
+
+def extract_archive(archive_path, destination):
+    """
+    Extracts a zip archive in one pass, checking the CRC-32 of every entry.
+
+    Args:
+        archive_path (str): The zip archive.
+        destination (str): The directory to extract into, replaced if it exists.
+    """
+    StreamExtractor(destination).finish(archive_path, os.path.getsize(archive_path))
@@ -0,0 +1,461 @@
+import time
+import socket
+import asyncio
+import logging
+import collections
+
+logger = logging.getLogger(__name__)
+
+# The forwarder is a small HTTP proxy on localhost that the system proxy points at. It passes every request on to the
+# first healthy upstream proxy of a configured list:
+#   - CONNECT requests are tunnelled, plain HTTP requests are forwarded in absolute form.
+#   - A connection to an upstream that fails is marked down at once and the request is retried on the next upstream,
+#     so traffic moves to the backup within the time it takes to see the refused (or timed out) connection.
+#   - Down upstreams are probed in the background and used again as soon as they accept connections.
+#   - Every upstream keeps a pool of idle keep-alive connections, plain HTTP requests reuse them.
+# Data is moved with `loop.sock_recv_into`/`loop.sock_sendall` through one preallocated buffer per direction, so
+# relaying does not allocate per chunk. (`loop.sock_sendfile` only sends from files, not between sockets.)
+
+HEAD_LIMIT = 64 * 1024
+BUFFER_SIZE = 64 * 1024
+# seconds between two health probes of the upstreams that are down
+CHECK_INTERVAL = 2
+# statuses that never have a body
+NO_BODY_STATUSES = {204, 304}
+
+
+class ProxyError(Exception):
+    """Raised when a request can not be parsed or no upstream accepts it."""
+
+
+class Upstream:
+    """
+    An upstream proxy with its pool of idle connections.
+
+    Attributes:
+        host (str): Host name or address of the proxy.
+        port (int): Port of the proxy.
+        up (bool): False after a connection failed, until a health probe or a request succeeds again.
+        idle (collections.deque): Idle keep-alive connections as (socket, time it was returned) tuples.
+    """
+
+    def __init__(self, host, port):
+        self.host = host
+        self.port = int(port)
+        self.up = True
+        self.failures = 0
+        self.idle = collections.deque()
+
+    @classmethod
+    def parse(cls, address):
+        """Creates an upstream from a `host:port` string."""
+        host, _, port = address.rpartition(":")
+        if not host or not port.isdigit():
+            raise ValueError(f"expected host:port, got {address!r}")
+        return cls(host.strip("[]"), port)
+
+    def __str__(self):
+        return f"{self.host}:{self.port}"
+
+    def mark_down(self, error):
+        if self.up:
+            logger.warning(f"Upstream {self} is down: {error}")
+        self.up = False
+        self.failures += 1
+        while self.idle:
+            self.idle.popleft()[0].close()
+
+    def mark_up(self):
+        if not self.up:
+            logger.info(f"Upstream {self} is up again")
+        self.up = True
+        self.failures = 0
+
+
+def _is_alive(sock):
+    """Checks without blocking that an idle connection has not been closed by the other side."""
+    try:
+        return sock.recv(1, socket.MSG_PEEK) != b""
+    except BlockingIOError:
+        return True
+    except OSError:
+        return False
+
+
+def parse_head(head):
+    """
+    Splits a request or response head.
+
+    Args:
+        head (bytes): The head including the final empty line.
+
+    Returns:
+        tuple: The start line split into its three parts and a dict of the lowercased header names and values.
+    """
+    lines = head.decode("latin-1").split("\r\n")
+    start = lines[0].split(" ", 2)
+    if len(start) < 3 and not start[0].startswith("HTTP/"):
+        raise ProxyError(f"Malformed start line {lines[0]!r}")
+    headers = {}
+    for line in lines[1:]:
+        name, colon, value = line.partition(":")
+        if colon:
+            headers[name.strip().lower()] = value.strip()
+    return start + [""] * (3 - len(start)), headers
+
+
+def _keep_alive(version, headers):
+    connection = (headers.get("connection", "") + "," + headers.get("proxy-connection", "")).lower()
+    if "close" in connection:
+        return False
+    return version == "HTTP/1.1" or "keep-alive" in connection
+
+
+class Forwarder:
+    """
+    Local forwarding proxy with upstream failover and per-upstream connection pooling, see the module comment.
+
+    Attributes:
+        upstreams (list[Upstream]): The upstream proxies in the order of preference.
+        host (str): The address to listen on.
+        port (int): The port to listen on, 0 picks a free one (see `address` once `start` returned).
+        connect_timeout (float): Seconds to wait for an upstream to accept a connection before failing over.
+        pool_size (int): Maximum number of idle connections kept per upstream.
+        idle_timeout (float): Seconds after which an idle connection is closed instead of reused.
+    """
+
+    def __init__(self, upstreams, host="127.0.0.1", port=3128, connect_timeout=2.0, pool_size=8, idle_timeout=30):
+        if not upstreams:
+            raise ValueError("at least one upstream proxy is needed")
+        self.upstreams = [upstream if isinstance(upstream, Upstream) else Upstream.parse(upstream)
+                          for upstream in upstreams]
+        self.host = host
+        self.port = port
+        self.connect_timeout = connect_timeout
+        self.pool_size = pool_size
+        self.idle_timeout = idle_timeout
+        self.address = None
+        self.server = None
+        self.tasks = set()
+
+    async def start(self):
+        """Starts listening and probing, returns once the socket is bound."""
+        loop = asyncio.get_running_loop()
+        self.server = socket.create_server((self.host, self.port), backlog=128)
+        self.server.setblocking(False)
+        self.address = self.server.getsockname()[:2]
+        logger.info(f"Forwarding proxy listening on {self.address[0]}:{self.address[1]}, "
+                    f"upstreams: {', '.join(map(str, self.upstreams))}")
+        self.spawn(self.accept_loop(loop))
+        self.spawn(self.check_loop())
+
+    def spawn(self, coroutine):
+        task = asyncio.ensure_future(coroutine)
+        self.tasks.add(task)
+        task.add_done_callback(self.tasks.discard)
+
+    async def stop(self):
+        for task in list(self.tasks):
+            task.cancel()
+        await asyncio.gather(*self.tasks, return_exceptions=True)
+        self.server.close()
+        for upstream in self.upstreams:
+            while upstream.idle:
+                upstream.idle.popleft()[0].close()
+
+    async def serve_forever(self):
+        await self.start()
+        try:
+            await asyncio.Event().wait()
+        finally:
+            await self.stop()
+
+    async def accept_loop(self, loop):
+        while True:
+            client, _ = await loop.sock_accept(self.server)
+            client.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+            self.spawn(self.handle_client(loop, client))
+
+    async def check_loop(self):
+        """Probes the upstreams that are down, so that requests do not wait for them."""
+        loop = asyncio.get_running_loop()
+        while True:
+            await asyncio.sleep(CHECK_INTERVAL)
+            for upstream in self.upstreams:
+                if upstream.up:
+                    continue
+                try:
+                    sock = await self.connect(loop, upstream)
+                except OSError:
+                    continue
+                upstream.mark_up()
+                self.release(upstream, sock)
+
+    async def connect(self, loop, upstream):
+        sock = socket.socket(socket.AF_INET6 if ":" in upstream.host else socket.AF_INET, socket.SOCK_STREAM)
+        sock.setblocking(False)
+        sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        try:
+            await asyncio.wait_for(loop.sock_connect(sock, (upstream.host, upstream.port)), self.connect_timeout)
+        except (OSError, asyncio.TimeoutError) as e:
+            sock.close()
+            raise OSError(f"connecting to {upstream} failed: {e!r}") from e
+        return sock
+
+    async def acquire(self, loop, pooled=True):
+        """
+        Returns a connection to the first upstream that accepts one, failing over down the list.
+
+        Returns:
+            tuple: The upstream, the socket and whether the socket came from the pool.
+        """
+        candidates = [upstream for upstream in self.upstreams if upstream.up]
+        # if everything is down, try everything anyway
+        candidates += [upstream for upstream in self.upstreams if not upstream.up]
+        for upstream in candidates:
+            while pooled and upstream.idle:
+                sock, since = upstream.idle.pop()
+                if time.monotonic() - since < self.idle_timeout and _is_alive(sock):
+                    return upstream, sock, True
+                sock.close()
+            try:
+                sock = await self.connect(loop, upstream)
+            except OSError as e:
+                upstream.mark_down(e)
+                continue
+            upstream.mark_up()
+            return upstream, sock, False
+        raise ProxyError("no upstream proxy accepted the connection")
+
+    def release(self, upstream, sock):
+        """Returns a connection to the pool of its upstream."""
+        if len(upstream.idle) < self.pool_size:
+            upstream.idle.append((sock, time.monotonic()))
+        else:
+            sock.close()
+
+    async def read_head(self, loop, sock, buffer):
+        """
+        Reads up to the end of a head.
+
+        Args:
+            buffer (bytearray): Bytes that were read past the previous message, the rest is appended to it.
+
+        Returns:
+            tuple: The head and the bytes read past it, the head is None if the connection closed before a new head.
+        """
+        while True:
+            end = buffer.find(b"\r\n\r\n")
+            if end >= 0:
+                return bytes(buffer[:end + 4]), buffer[end + 4:]
+            if len(buffer) > HEAD_LIMIT:
+                raise ProxyError("head too large")
+            data = await loop.sock_recv(sock, BUFFER_SIZE)
+            if not data:
+                if buffer:
+                    raise ProxyError("connection closed in the middle of a head")
+                return None, buffer
+            buffer += data
+
+    async def relay_exact(self, loop, source, destination, buffer, length, scratch):
+        """Relays `length` bytes, starting with the already read `buffer`. Returns the bytes read past them."""
+        if len(buffer) >= length:
+            await loop.sock_sendall(destination, buffer[:length])
+            return buffer[length:]
+        await loop.sock_sendall(destination, buffer)
+        length -= len(buffer)
+        view = memoryview(scratch)
+        while length:
+            count = await loop.sock_recv_into(source, view[:min(length, len(scratch))])
+            if not count:
+                raise ConnectionError("connection closed in the middle of a body")
+            await loop.sock_sendall(destination, view[:count])
+            length -= count
+        return bytearray()
+
+    async def relay_line(self, loop, source, destination, buffer):
+        """Relays one CRLF terminated line of a chunked body, returns it and the bytes read past it."""
+        while b"\r\n" not in buffer:
+            if len(buffer) > HEAD_LIMIT:
+                raise ProxyError("chunk header too large")
+            data = await loop.sock_recv(source, BUFFER_SIZE)
+            if not data:
+                raise ConnectionError("connection closed in the middle of a chunked body")
+            buffer += data
+        end = buffer.index(b"\r\n") + 2
+        await loop.sock_sendall(destination, buffer[:end])
+        return bytes(buffer[:end]), buffer[end:]
+
+    async def relay_body(self, loop, source, destination, buffer, headers, scratch, until_close=False):
+        """
+        Relays a message body framed by `Transfer-Encoding: chunked` or `Content-Length`, or by the end of the
+        connection if `until_close` is set and neither is present.
+
+        Returns:
+            tuple: The bytes read past the body and whether the body ended with the connection.
+        """
+        if "chunked" in headers.get("transfer-encoding", "").lower():
+            while True:
+                line, buffer = await self.relay_line(loop, source, destination, buffer)
+                size = int(line.split(b";", 1)[0].strip() or b"0", 16)
+                if size == 0:
+                    # trailers up to the empty line
+                    while line != b"\r\n":
+                        line, buffer = await self.relay_line(loop, source, destination, buffer)
+                    return buffer, False
+                buffer = await self.relay_exact(loop, source, destination, buffer, size + 2, scratch)
+        if "content-length" in headers:
+            length = int(headers["content-length"])
+            return await self.relay_exact(loop, source, destination, buffer, length, scratch), False
+        if not until_close:
+            return buffer, False
+        if buffer:
+            await loop.sock_sendall(destination, buffer)
+        await self.pipe(loop, source, destination, scratch)
+        return bytearray(), True
+
+    async def pipe(self, loop, source, destination, scratch):
+        """Copies from `source` to `destination` until `source` closes, reusing `scratch` for every chunk."""
+        view = memoryview(scratch)
+        try:
+            while True:
+                count = await loop.sock_recv_into(source, view)
+                if not count:
+                    break
+                await loop.sock_sendall(destination, view[:count])
+        except OSError:
+            pass
+        finally:
+            try:
+                destination.shutdown(socket.SHUT_WR)
+            except OSError:
+                pass
+
+    async def handle_client(self, loop, client):
+        buffer = bytearray()
+        # one buffer per direction, reused for every chunk of this connection
+        request_scratch = bytearray(BUFFER_SIZE)
+        response_scratch = bytearray(BUFFER_SIZE)
+        try:
+            while True:
+                head, buffer = await self.read_head(loop, client, buffer)
+                if head is None:
+                    return
+                (method, target, version), headers = parse_head(head)
+                if method == "CONNECT":
+                    await self.tunnel(loop, client, head, buffer, request_scratch, response_scratch)
+                    return
+                buffer, keep_alive = await self.forward(
+                    loop, client, head, method, version, headers, buffer, request_scratch, response_scratch)
+                if not keep_alive:
+                    return
+        except ProxyError as e:
+            logger.info(f"Request failed: {e}")
+            try:
+                await loop.sock_sendall(client, b"HTTP/1.1 502 Bad Gateway\r\nContent-Length: 0\r\n"
+                                                b"Connection: close\r\n\r\n")
+            except OSError:
+                pass
+        except (OSError, ValueError) as e:
+            logger.debug(f"Client connection ended: {e!r}")
+        finally:
+            client.close()
+
+    async def tunnel(self, loop, client, head, buffer, request_scratch, response_scratch):
+        """Opens a CONNECT tunnel through an upstream and pipes both directions until they close."""
+        upstream, sock, _ = await self.acquire(loop, pooled=False)
+        try:
+            await loop.sock_sendall(sock, head)
+            response, rest = await self.read_head(loop, sock, bytearray())
+            if response is None:
+                upstream.mark_down("closed the connection")
+                raise ProxyError(f"{upstream} closed the connection")
+            await loop.sock_sendall(client, response)
+            (_, status, _), _ = parse_head(response)
+            if status != "200":
+                return
+            if rest:
+                await loop.sock_sendall(client, rest)
+            if buffer:
+                await loop.sock_sendall(sock, buffer)
+            await asyncio.gather(self.pipe(loop, client, sock, request_scratch),
+                                 self.pipe(loop, sock, client, response_scratch))
+        finally:
+            sock.close()
+
+    async def forward(self, loop, client, head, method, version, headers, buffer, request_scratch,
+                      response_scratch):
+        """
+        Forwards one plain HTTP request and its response. A request without a body that fails on a pooled connection
+        (the upstream may have closed it in the meantime) is retried once on a new connection.
+
+        Returns:
+            tuple: The bytes read past the request and whether the client connection can be kept.
+        """
+        has_body = "content-length" in headers or "transfer-encoding" in headers
+        pooled = True
+        while True:
+            upstream, sock, reused = await self.acquire(loop, pooled)
+            response = None
+            try:
+                await loop.sock_sendall(sock, head)
+                rest, _ = await self.relay_body(loop, client, sock, buffer, headers, request_scratch)
+                response, upstream_buffer = await self.read_head(loop, sock, bytearray())
+                while response is not None:
+                    (response_version, status, _), response_headers = parse_head(response)
+                    if not status.startswith("1") or status == "101":
+                        break
+                    # interim responses like 100 Continue are passed on, the final one follows
+                    await loop.sock_sendall(client, response)
+                    response, upstream_buffer = await self.read_head(loop, sock, upstream_buffer)
+                if response is None:
+                    raise ConnectionError(f"{upstream} closed the connection without a response")
+            except (OSError, ProxyError) as e:
+                sock.close()
+                if reused and not has_body:
+                    pooled = False
+                    continue
+                if response is None and not reused:
+                    upstream.mark_down(e)
+                raise ProxyError(f"{upstream} failed: {e}") from e
+            break
+
+        await loop.sock_sendall(client, response)
+        if status == "101":
+            # protocol switch (WebSocket), the connection becomes a tunnel
+            if upstream_buffer:
+                await loop.sock_sendall(client, upstream_buffer)
+            await asyncio.gather(self.pipe(loop, client, sock, request_scratch),
+                                 self.pipe(loop, sock, client, response_scratch))
+            sock.close()
+            return bytearray(), False
+
+        try:
+            if method == "HEAD" or int(status) in NO_BODY_STATUSES:
+                closed = False
+            else:
+                upstream_buffer, closed = await self.relay_body(
+                    loop, sock, client, upstream_buffer, response_headers, response_scratch, until_close=True)
+        except BaseException:
+            sock.close()
+            raise
+        if closed or upstream_buffer or not _keep_alive(response_version, response_headers):
+            sock.close()
+        else:
+            self.release(upstream, sock)
+        return rest, not closed and _keep_alive(version, headers)
+
+
+def run(upstreams, host="127.0.0.1", port=3128):
+    """
+    Runs the forwarding proxy in the foreground until interrupted.
+
+    Args:
+        upstreams (list[str]): The upstream proxies as `host:port`, in the order of preference.
+        host (str, optional): The address to listen on. Defaults to "127.0.0.1".
+        port (int, optional): The port to listen on. Defaults to 3128.
+    """
+    try:
+        asyncio.run(Forwarder(upstreams, host, port).serve_forever())
+    except KeyboardInterrupt:
+        pass
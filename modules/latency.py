@@ -0,0 +1,141 @@
+import time
+import asyncio
+import logging
+
+logger = logging.getLogger(__name__)
+
+# where the CONNECT handshake of a probe asks the proxy to connect to
+PROBE_TARGET = "www.github.com:443"
+
+
+def connect_request(target=PROBE_TARGET):
+    """Returns the HTTP CONNECT request a probe sends, asking the proxy to connect to `target`."""
+    return f"CONNECT {target} HTTP/1.1\r\nHost: {target}\r\n\r\n".encode()
+
+
+def check_status(address, status):
+    """
+    Checks the status line a proxy answered a probe with.
+
+    Raises:
+        ValueError: If the proxy did not answer like an HTTP proxy or can not reach the target.
+    """
+    if not status.startswith(b"HTTP/"):
+        raise ValueError(f"{address} did not answer like an HTTP proxy")
+    # 407: the proxy works but wants credentials, which the browser asks for
+    if status.split()[1:2] not in ([b"200"], [b"407"]):
+        raise ValueError(f"{address} answered {status.decode('latin-1').splitlines()[0].strip()}")
+
+
+def percentile(values, q):
+    """
+    Returns the q-th percentile of `values` with the nearest-rank method.
+
+    Args:
+        values (list[float]): The measurements, need not be sorted.
+        q (float): The percentile, between 0 and 100.
+
+    Returns:
+        float: The percentile, or None if there are no values.
+    """
+    if not values:
+        return None
+    ordered = sorted(values)
+    rank = max(1, -(-len(ordered) * q // 100))
+    return ordered[int(rank) - 1]
+
+
+async def measure(address, timeout, target=PROBE_TARGET):
+    """
+    Measures one TCP connect and one HTTP CONNECT handshake through a proxy.
+
+    Args:
+        address (str): The proxy as `host:port`.
+        timeout (float): Seconds the connect and the handshake may take together.
+        target (str, optional): The `host:port` the proxy is asked to connect to. Defaults to `PROBE_TARGET`.
+
+    Returns:
+        tuple: The connect and handshake times in milliseconds.
+
+    Raises:
+        OSError, asyncio.TimeoutError, ValueError: If the proxy can not be reached or can not reach the target.
+    """
+    host, _, port = address.rpartition(":")
+    deadline = time.perf_counter() + timeout
+    start = time.perf_counter()
+    reader, writer = await asyncio.wait_for(asyncio.open_connection(host.strip("[]"), int(port)), timeout)
+    connected = time.perf_counter()
+    try:
+        writer.write(connect_request(target))
+        status = await asyncio.wait_for(reader.readline(), max(0.0, deadline - time.perf_counter()))
+        answered = time.perf_counter()
+    finally:
+        writer.close()
+    check_status(address, status)
+    return (connected - start) * 1000, (answered - start) * 1000
+
+
+async def probe(address, timeout=2.0, samples=5, target=PROBE_TARGET):
+    """
+    Probes a proxy with `samples` concurrent measurements.
+
+    Returns:
+        dict: "address", "ok" (at least one measurement succeeded), "connect" and "handshake" (lists of milliseconds),
+        "p50", "p90" and "p99" (of the handshakes, None if there are none) and "errors" (the failures as text).
+    """
+    measurements = await asyncio.gather(*(measure(address, timeout, target) for _ in range(samples)),
+                                        return_exceptions=True)
+    connect = [m[0] for m in measurements if isinstance(m, tuple)]
+    handshake = [m[1] for m in measurements if isinstance(m, tuple)]
+    errors = [repr(m) for m in measurements if not isinstance(m, tuple)]
+    return {"address": address, "ok": bool(handshake), "connect": connect, "handshake": handshake,
+            "p50": percentile(handshake, 50), "p90": percentile(handshake, 90), "p99": percentile(handshake, 99),
+            "errors": errors}
+
+
+async def sweep(candidates, timeout=2.0, samples=5, target=PROBE_TARGET):
+    """
+    Probes all candidates at the same time, so a sweep takes about as long as one `timeout`.
+
+    Args:
+        candidates (list[str]): The proxies as `host:port`.
+        timeout (float, optional): Seconds a single measurement may take. Defaults to 2.0.
+        samples (int, optional): Measurements per candidate. Defaults to 5.
+        target (str, optional): See `measure`.
+
+    Returns:
+        list[dict]: The results of `probe`, healthy candidates first, ordered by their median handshake.
+    """
+    results = await asyncio.gather(*(probe(candidate, timeout, samples, target) for candidate in candidates))
+    return sorted(results, key=lambda result: (not result["ok"], result["p50"] or 0))
+
+
+def run_sweep(candidates, timeout=2.0, samples=5, target=PROBE_TARGET):
+    """Runs `sweep` from synchronous code, e.g. a worker thread."""
+    return asyncio.run(sweep(candidates, timeout, samples, target))
+
+
+def fastest(results):
+    """Returns the healthy candidate with the lowest median handshake of a sweep, or None if none is healthy."""
+    healthy = [result for result in results if result["ok"]]
+    return healthy[0]["address"] if healthy else None
+
+
+def apply_fastest(proxy, candidates, timeout=2.0, samples=5):
+    """
+    Sweeps the candidates and sets the fastest healthy one as the proxy address.
+
+    Args:
+        proxy (module): The proxy backend.
+        candidates (list[str]): The proxies as `host:port`.
+
+    Returns:
+        tuple: The address that was applied (None if no candidate was healthy or the change failed) and the results.
+    """
+    results = run_sweep(candidates, timeout, samples)
+    address = fastest(results)
+    if address is None:
+        logger.warning("None of the candidate proxies answered.")
+        return None, results
+    logger.info(f"Fastest proxy: {address} ({results[0]['p50']:.1f} ms median)")
+    return (address if proxy.change_address(address) else None), results
@@ -1,12 +1,15 @@
 import os
+import queue
 import logging
 import tempfile
+import threading
 import customtkinter
 
 
 class TkinterHandler(logging.Handler):
     """
     A logging handler that outputs logs to a Tkinter Text widget.
+    Records emitted from worker threads are queued and written to the widget from the Tk thread.
 
     Args:
         text_widget (customtkinter.CTkTextbox): The Text widget to output logs to.
@@ -17,6 +20,8 @@ class TkinterHandler(logging.Handler):
         self.text_widget = text_widget
         self.text_widget.configure(state='disabled')
         self.log_format = logging.Formatter('%(levelname)s: %(message)s\n')
+        self.pending = queue.Queue()
+        self.text_widget.after(100, self.drain)
 
         # Ensure log directory exists
         log_file = os.path.join(os.path.join(os.path.join(os.path.dirname(
@@ -33,9 +38,21 @@ class TkinterHandler(logging.Handler):
         logging.getLogger().addHandler(self.file_handler)
 
     def emit(self, record):
+        if threading.current_thread() is not threading.main_thread():
+            # Tk widgets must only be touched from the Tk thread
+            self.pending.put(self.log_format.format(record))
+            return
+        self.write(self.log_format.format(record))
+        self.text_widget.update()
+
+    def write(self, text):
         self.text_widget.configure(state='normal')
-        self.text_widget.insert(
-            customtkinter.END, self.log_format.format(record))
+        self.text_widget.insert(customtkinter.END, text)
         self.text_widget.see(customtkinter.END)
         self.text_widget.configure(state='disabled')
-        self.text_widget.update()
+
+    def drain(self):
+        """Writes the records queued by worker threads to the widget and reschedules itself."""
+        while not self.pending.empty():
+            self.write(self.pending.get_nowait())
+        self.text_widget.after(100, self.drain)
@@ -0,0 +1,174 @@
+import math
+import time
+import queue
+import bisect
+import random
+import socket
+import logging
+import threading
+import collections
+from modules.latency import check_status, connect_request
+
+logger = logging.getLogger(__name__)
+
+# a probe slower than this counts as degraded
+SLOW_MS = 1000
+
+
+class Histogram:
+    """
+    Latency histogram with fixed buckets, so its memory does not grow with the number of probes. Once `limit`
+    probes are counted, all counts are halved, which keeps the percentiles close to the recent latency.
+    """
+
+    # upper bounds of the buckets in milliseconds, the last bucket has no upper bound
+    BOUNDS = (1, 2, 5, 10, 20, 50, 100, 200, 500, 1000, 2000, 5000)
+
+    def __init__(self, limit=1000):
+        self.counts = [0] * (len(self.BOUNDS) + 1)
+        self.total = 0
+        self.limit = limit
+
+    def add(self, milliseconds):
+        self.counts[bisect.bisect_left(self.BOUNDS, milliseconds)] += 1
+        self.total += 1
+        if self.total >= self.limit:
+            self.counts = [count // 2 for count in self.counts]
+            self.total = sum(self.counts)
+
+    def percentile(self, q):
+        """
+        Returns the upper bound of the bucket that holds the q-th percentile, `math.inf` if that is the open-ended
+        bucket above the last bound, None if nothing was counted.
+        """
+        if not self.total:
+            return None
+        rank = self.total * q / 100
+        seen = 0
+        for index, count in enumerate(self.counts):
+            seen += count
+            if seen >= rank and count:
+                return self.BOUNDS[index] if index < len(self.BOUNDS) else math.inf
+        return math.inf
+
+    @classmethod
+    def label(cls, bound):
+        """Describes a bucket returned by `percentile`, e.g. "<= 200 ms" or "> 5000 ms"."""
+        return f"> {cls.BOUNDS[-1]} ms" if bound == math.inf else f"<= {bound} ms"
+
+
+def probe(address, timeout):
+    """
+    Connects to the proxy and sends the CONNECT request of `latency.measure`, blocking for at most about `timeout`
+    seconds.
+
+    Returns:
+        float: The time until the proxy answered in milliseconds.
+
+    Raises:
+        OSError, ValueError: If the proxy did not answer or can not reach the target.
+    """
+    host, _, port = address.rpartition(":")
+    start = time.perf_counter()
+    with socket.create_connection((host.strip("[]"), int(port)), timeout=timeout) as connection:
+        connection.sendall(connect_request())
+        status = connection.recv(64)
+    elapsed = (time.perf_counter() - start) * 1000
+    check_status(address, status)
+    return elapsed
+
+
+class HealthMonitor(threading.Thread):
+    """
+    Probes the configured proxy in the background while it is enabled, on an interval with a random jitter so that
+    many clients do not probe in step. Keeps a latency `Histogram` and the outcome of the last `window` probes.
+
+    Events put on `events` are tuples:
+        ("health", summary): After every probe. `summary` has the keys "state" ("healthy", "degraded" or "down"),
+            "address", "latency" (ms of the probe, None if it failed), "p50", "p90" (see `Histogram.percentile`),
+            "error_rate" and "failures" (consecutive failed probes).
+        ("disable", address): `disable_after` probes in a row failed, the proxy should be turned off.
+
+    Attributes:
+        events (queue.Queue): The queue the events are published to.
+        interval (float): Mean seconds between two probes.
+        jitter (float): Fraction of `interval` by which a wait may be shorter or longer.
+        timeout (float): Seconds a probe may take.
+        disable_after (int): Consecutive failures after which "disable" is published, 0 to never publish it.
+    """
+
+    def __init__(self, events=None, interval=15, jitter=0.2, timeout=3.0, window=20, disable_after=0):
+        super().__init__(daemon=True)
+        self.events = events if events is not None else queue.Queue()
+        self.interval = interval
+        self.jitter = jitter
+        self.timeout = timeout
+        self.disable_after = disable_after
+        self.histogram = Histogram()
+        self.outcomes = collections.deque(maxlen=window)
+        self.failures = 0
+        self.address = None
+        self.enabled = False
+        self.wake = threading.Event()
+        self.stopped = threading.Event()
+
+    def set_address(self, address):
+        """Starts over with a new address and probes it right away."""
+        if address != self.address:
+            self.address = address
+            self.histogram = Histogram()
+            self.outcomes.clear()
+            self.failures = 0
+            self.wake.set()
+
+    def set_enabled(self, enabled):
+        """Probes only run while the proxy is enabled."""
+        self.enabled = enabled
+        if enabled:
+            self.failures = 0
+            self.wake.set()
+
+    def stop(self):
+        self.stopped.set()
+        self.wake.set()
+
+    def run(self):
+        while not self.stopped.is_set():
+            self.wake.wait(self.interval * random.uniform(1 - self.jitter, 1 + self.jitter))
+            self.wake.clear()
+            address = self.address
+            if self.stopped.is_set() or not self.enabled or not address:
+                continue
+            self.check(address)
+
+    def check(self, address):
+        """Runs one probe and publishes the result."""
+        try:
+            latency = probe(address, self.timeout)
+        except (OSError, ValueError) as e:
+            latency = None
+            logger.debug(f"Health probe of {address} failed: {e}")
+        if address != self.address:
+            # the address changed while probing
+            return
+        self.outcomes.append(latency is not None)
+        if latency is None:
+            self.failures += 1
+        else:
+            self.failures = 0
+            self.histogram.add(latency)
+
+        error_rate = self.outcomes.count(False) / len(self.outcomes)
+        p90 = self.histogram.percentile(90)
+        if self.failures >= 3 or error_rate >= 0.5:
+            state = "down"
+        elif self.failures or error_rate > 0.1 or (p90 or 0) > SLOW_MS:
+            state = "degraded"
+        else:
+            state = "healthy"
+        self.events.put(("health", {"state": state, "address": address, "latency": latency,
+                                    "p50": self.histogram.percentile(50), "p90": p90,
+                                    "error_rate": error_rate, "failures": self.failures}))
+        if self.disable_after and self.failures == self.disable_after:
+            logger.warning(f"{address} failed {self.failures} health probes in a row.")
+            self.events.put(("disable", address))
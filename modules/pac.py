@@ -0,0 +1,159 @@
+import json
+import hashlib
+import logging
+import ipaddress
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+logger = logging.getLogger(__name__)
+
+# A rule set routes destinations to proxies. Rules are checked in order, the first match wins:
+#   {"match": "*.corp.example", "proxy": "DIRECT"}         subdomains of corp.example
+#   {"match": "intranet", "proxy": "DIRECT"}               exactly this host
+#   {"match": "*.example.??", "proxy": "10.0.0.1:8080"}    other shell patterns (* and ?)
+#   {"match": "10.0.0.0/8", "proxy": "DIRECT"}             IPv4 networks, host names are resolved for these
+#   {"match": "*.eu.example", "proxy": ["eu1:3128", "eu2:3128"]}   proxies are tried in order
+# Everything else goes to `default` ("host:port", a list of them or "DIRECT").
+PATH = "/proxy.pac"
+CONTENT_TYPE = "application/x-ns-proxy-autoconfig"
+# the registered URL carries the ETag, so a changed rule set is a new URL and clients may keep the script meanwhile
+CACHE_CONTROL = "public, max-age=3600"
+
+
+def proxy_result(proxy):
+    """Formats the result of `FindProxyForURL` for a rule target."""
+    proxies = [proxy] if isinstance(proxy, str) else list(proxy)
+    results = ["DIRECT" if item.upper() == "DIRECT" else f"PROXY {item}" for item in proxies]
+    return "; ".join(results)
+
+
+def condition(match):
+    """Translates the `match` of a rule into a PAC condition on the lowercased `host`."""
+    match = match.strip().lower()
+    try:
+        network = ipaddress.ip_network(match, strict=False)
+    except ValueError:
+        network = None
+    if network is not None:
+        if network.version != 4:
+            raise ValueError(f"Only IPv4 networks can be matched in a PAC script: {match}")
+        return f"isInNet(resolved(host), {json.dumps(str(network.network_address))}, {json.dumps(str(network.netmask))})"
+    if match.startswith("*.") and not any(character in match[2:] for character in "*?"):
+        return f"dnsDomainIs(host, {json.dumps(match[1:])})"
+    if "*" in match or "?" in match:
+        return f"shExpMatch(host, {json.dumps(match)})"
+    return f"host == {json.dumps(match)}"
+
+
+def generate(rules, default="DIRECT"):
+    """
+    Generates a PAC script from a rule set, see the module comment.
+
+    Args:
+        rules (list[dict]): The rules, each with "match" and "proxy".
+        default (str or list[str], optional): Where everything else goes. Defaults to "DIRECT".
+
+    Returns:
+        str: The script.
+
+    Raises:
+        ValueError, KeyError: If a rule can not be translated.
+    """
+    lines = [
+        "// generated by Proxy Settings, changes are overwritten",
+        "var ip;",
+        "function resolved(host) {",
+        "    // resolved once per call and only if a network rule is reached",
+        "    if (ip === undefined) ip = /^\\d+\\.\\d+\\.\\d+\\.\\d+$/.test(host) ? host : dnsResolve(host);",
+        "    return ip;",
+        "}",
+        "function FindProxyForURL(url, host) {",
+        "    host = host.toLowerCase();",
+        "    ip = undefined;",
+    ]
+    for rule in rules:
+        lines.append(f"    if ({condition(rule['match'])}) return {json.dumps(proxy_result(rule['proxy']))};")
+    lines.append(f"    return {json.dumps(proxy_result(default or 'DIRECT'))};")
+    lines.append("}")
+    return "\n".join(lines) + "\n"
+
+
+class PacServer:
+    """
+    Serves a PAC script from localhost, so browsers fetch it without touching the network.
+
+    Responses carry a strong `ETag` (derived from the script) and `Cache-Control`, a request with a matching
+    `If-None-Match` is answered with 304 Not Modified. `update` swaps the script without a restart.
+
+    Attributes:
+        host (str): The address to listen on.
+        port (int): The port to listen on, 0 picks a free one.
+        url (str): The URL to register with the system, it changes with the script.
+    """
+
+    def __init__(self, script, host="127.0.0.1", port=8079):
+        self.update(script)
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def not_found(self):
+                if self.path.split("?", 1)[0] == PATH:
+                    return False
+                self.send_response(404)
+                self.send_header("Content-Length", "0")
+                self.end_headers()
+                return True
+
+            def do_GET(self):
+                if self.not_found():
+                    return
+                body, etag = server.body, server.etag
+                if etag in [tag.strip() for tag in self.headers.get("If-None-Match", "").split(",")]:
+                    self.send_response(304)
+                    self.send_header("ETag", etag)
+                    self.send_header("Cache-Control", CACHE_CONTROL)
+                    self.end_headers()
+                    return
+                self.send_response(200)
+                self.send_header("Content-Type", CONTENT_TYPE)
+                self.send_header("Content-Length", str(len(body)))
+                self.send_header("ETag", etag)
+                self.send_header("Cache-Control", CACHE_CONTROL)
+                self.end_headers()
+                self.wfile.write(body)
+
+            def do_HEAD(self):
+                if self.not_found():
+                    return
+                self.send_response(200)
+                self.send_header("Content-Type", CONTENT_TYPE)
+                self.send_header("Content-Length", str(len(server.body)))
+                self.send_header("ETag", server.etag)
+                self.end_headers()
+
+            def log_message(self, format, *args):
+                logger.debug(format % args)
+
+        self.httpd = ThreadingHTTPServer((host, port), Handler)
+        self.httpd.daemon_threads = True
+        self.host, self.port = self.httpd.server_address[:2]
+
+    def update(self, script):
+        """Serves a new script from now on."""
+        body = script.encode()
+        self.body, self.etag = body, f'"{hashlib.sha256(body).hexdigest()[:16]}"'
+
+    @property
+    def url(self):
+        return f"http://{self.host}:{self.port}{PATH}?v={self.etag.strip(chr(34))}"
+
+    def start(self):
+        """Serves on a daemon thread."""
+        threading.Thread(target=self.httpd.serve_forever, daemon=True).start()
+        logger.info(f"Serving the PAC script at {self.url}")
+
+    def stop(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
@@ -0,0 +1,125 @@
+import os
+import sys
+import json
+import time
+import atexit
+import tempfile
+import threading
+import contextlib
+
+# Profiling is switched on with command line flags:
+#   --profile-startup[=<path>]  record wall-clock spans of the startup phases as a Chrome trace
+#                               (open it in chrome://tracing or https://ui.perfetto.dev)
+#   --profile[=<path>]          run the whole session under cProfile and save a pstats dump on exit
+# Without the flags `span` and `mark` cost next to nothing.
+logs_path = os.path.join(os.path.join(os.path.dirname(
+    tempfile.gettempdir()), 'Proxy Settings'), "logs")
+
+events = []
+trace_path = None
+session = None
+session_path = None
+_lock = threading.Lock()
+_origin = time.perf_counter_ns()
+_disabled = contextlib.nullcontext()
+
+
+def _flag(argv, name, default):
+    """Returns the value of `--name` or `--name=<value>`, `default` for the bare flag, None if it is missing."""
+    for arg in argv:
+        if arg == f"--{name}":
+            return default
+        if arg.startswith(f"--{name}="):
+            return arg.split("=", 1)[1]
+    return None
+
+
+def setup(argv=None):
+    """
+    Enables the profilers requested on the command line. Call it before anything else is imported, so that the
+    imports are covered as well.
+
+    Args:
+        argv (list[str], optional): The command line arguments. Defaults to `sys.argv`.
+    """
+    global trace_path, session, session_path
+    argv = sys.argv[1:] if argv is None else argv
+
+    trace_path = _flag(argv, "profile-startup",
+                       os.path.join(logs_path, "startup_trace.json"))
+    if trace_path:
+        atexit.register(save_trace)
+
+    session_path = _flag(argv, "profile", os.path.join(logs_path, "session.pstats"))
+    if session_path:
+        import cProfile
+        session = cProfile.Profile()
+        atexit.register(save_session)
+        session.enable()
+
+
+def _now():
+    return (time.perf_counter_ns() - _origin) // 1000
+
+
+@contextlib.contextmanager
+def _span(name, args):
+    start = _now()
+    try:
+        yield
+    finally:
+        event = {"name": name, "ph": "X", "ts": start, "dur": _now() - start,
+                 "pid": os.getpid(), "tid": threading.get_ident()}
+        if args:
+            event["args"] = args
+        with _lock:
+            events.append(event)
+
+
+def span(name, **args):
+    """
+    Records the wall-clock time of a `with` block as a complete event of the startup trace.
+
+    Args:
+        name (str): The name shown in the timeline.
+        **args: Extra values shown with the event.
+
+    Returns:
+        A context manager, which does nothing unless `--profile-startup` is given.
+    """
+    if trace_path is None:
+        return _disabled
+    return _span(name, args)
+
+
+def mark(name):
+    """Records a point in time, e.g. when the window became interactive."""
+    if trace_path is None:
+        return
+    with _lock:
+        events.append({"name": name, "ph": "i", "s": "g", "ts": _now(),
+                       "pid": os.getpid(), "tid": threading.get_ident()})
+
+
+def save_trace():
+    """Writes the recorded spans in the Chrome trace event format."""
+    if trace_path is None:
+        return
+    with _lock:
+        trace = {"traceEvents": list(events), "displayTimeUnit": "ms"}
+    thread_names = {thread.ident: thread.name for thread in threading.enumerate()}
+    for tid in {event["tid"] for event in trace["traceEvents"]}:
+        trace["traceEvents"].append({"name": "thread_name", "ph": "M", "pid": os.getpid(), "tid": tid,
+                                     "args": {"name": thread_names.get(tid, str(tid))}})
+    os.makedirs(os.path.dirname(os.path.abspath(trace_path)), exist_ok=True)
+    with open(trace_path, "w") as outfile:
+        json.dump(trace, outfile)
+
+
+def save_session():
+    """Stops the session profiler and writes its statistics, load them with `pstats.Stats(path)`."""
+    if session is None:
+        return
+    session.disable()
+    os.makedirs(os.path.dirname(os.path.abspath(session_path)), exist_ok=True)
+    session.dump_stats(session_path)
@@ -0,0 +1,131 @@
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Proxy profiles are switched by the Wi-Fi network the computer is connected to. In the settings:
+#   "proxy_profiles": {"office": {"address": "10.0.0.1:8080", "enabled": true, "bypass": ["*.corp.example"]},
+#                      "home": {"enabled": false}}
+#   "network_rules": [{"ssid": "CorpWifi", "profile": "office"},
+#                     {"bssid": "00:11:22", "profile": "office"}]     BSSID prefixes, one to six octets
+#   "default_profile": "home"                                         for other networks, "" to leave them alone
+# A profile only changes what it names. Rules for a BSSID prefix win over rules for an SSID, longer prefixes over
+# shorter ones.
+
+
+def normalize_bssid(bssid):
+    """Returns the octets of a BSSID (or a prefix of one) as lowercase two-digit hex, separated by colons."""
+    octets = bssid.strip().lower().replace("-", ":").split(":")
+    return ":".join(octet.zfill(2) for octet in octets if octet)
+
+
+class ProfileTable:
+    """
+    Finds the profile of a network with dictionary lookups: one per BSSID prefix length (at most six) and one for
+    the SSID, independent of the number of rules.
+
+    Attributes:
+        profiles (dict): The profiles by name.
+        default (str): The profile for networks without a rule, or None.
+    """
+
+    def __init__(self, profiles, rules, default=None):
+        self.profiles = profiles
+        self.default = default or None
+        self.by_ssid = {}
+        self.by_bssid = {}
+        for rule in rules:
+            if rule.get("profile") not in profiles:
+                logger.warning(f"Ignoring the rule {rule}, there is no such profile.")
+            elif rule.get("bssid"):
+                self.by_bssid[normalize_bssid(rule["bssid"])] = rule["profile"]
+            elif rule.get("ssid"):
+                self.by_ssid[rule["ssid"]] = rule["profile"]
+
+    @classmethod
+    def from_settings(cls, settings_data):
+        return cls(settings_data["proxy_profiles"], settings_data["network_rules"], settings_data["default_profile"])
+
+    def lookup(self, ssid, bssid=None):
+        """
+        Returns:
+            str: The name of the profile for the network, or None if it has none.
+        """
+        if bssid:
+            octets = normalize_bssid(bssid).split(":")
+            for length in range(len(octets), 0, -1):
+                name = self.by_bssid.get(":".join(octets[:length]))
+                if name:
+                    return name
+        name = self.by_ssid.get(ssid) if ssid else None
+        return name or (self.default if self.default in self.profiles else None)
+
+
+def diff(profile, state):
+    """
+    Compares a profile with the current proxy state.
+
+    Args:
+        profile (dict): The profile, with any of "address", "enabled" and "bypass".
+        state (dict): The current "address", "enabled" and "bypass" (None where unknown).
+
+    Returns:
+        dict: The values of the profile that differ from the state, in the order they should be applied: the
+        address and bypass list before the proxy is switched on.
+    """
+    changes = {}
+    for key in ("address", "bypass", "enabled"):
+        if key in profile and profile[key] != state.get(key):
+            changes[key] = profile[key]
+    return changes
+
+
+class ProfileSwitcher:
+    """
+    Applies the profile of the connected network whenever the network changes, it does not poll itself: it is fed by
+    the connection changes the WLAN service announces (see `wifi.ConnectionWatcher`) and by connecting in the app.
+    Every source reads the network with `wifi.get_connection`, so the same network always has the same key.
+
+    The profile is applied again whenever the network changes, also if the new network maps to the same profile, so
+    reconnecting restores a profile after a manual change. A network whose profile could not be applied is not
+    remembered, the next event for it tries again.
+
+    Attributes:
+        table (ProfileTable): The compiled rules.
+        apply (callable): Called with the changes of `diff` to apply them as one batch, returns whether that worked.
+        state (callable): Returns the current proxy state, see `diff`.
+        network (tuple): The SSID and normalized BSSID of the network whose profile is applied, or None.
+        active (str): The name of the profile that is applied, or None.
+    """
+
+    def __init__(self, table, apply, state):
+        self.table = table
+        self.apply = apply
+        self.state = state
+        self.network = None
+        self.active = None
+
+    def network_changed(self, ssid, bssid=None):
+        """
+        Switches to the profile of a network, does nothing if the network did not change.
+
+        Returns:
+            dict: The changes that were applied, empty if there were none.
+        """
+        network = (ssid or None, normalize_bssid(bssid) if bssid else None)
+        if network == self.network:
+            return {}
+        name = self.table.lookup(ssid, bssid)
+        changes = diff(self.table.profiles[name], self.state()) if name is not None else {}
+        if changes:
+            logger.info(f"Connected to {ssid or 'no network'}, switching to the proxy profile {name}.")
+            if not self.apply(changes):
+                logger.warning(f"The proxy profile {name} could not be applied.")
+                return {}
+        self.network = network
+        self.active = name
+        return changes
+
+    def reset(self):
+        """Forgets the network, the next event applies its profile again. For changes that failed after `apply`."""
+        self.network = None
+        self.active = None
@@ -70,6 +70,9 @@ def change_address(new_address):
 
     Args:
         new_address (str): The new proxy server address in the format "ip:port".
+
+    Returns:
+        True if the address was changed, False otherwise.
     """
     try:
         registry_key = winreg.OpenKey(
@@ -83,8 +86,10 @@ def change_address(new_address):
         winreg.CloseKey(registry_key)
 
         logger.info(f"Changed proxy address to {new_address}")
+        return True
     except Exception as e:
         logger.error(f"Failed to change proxy address: {e}")
+        return False
 
 
 def fill_in_ip():
@@ -226,3 +231,74 @@ def server_check():
         logger.error(
             f'An unexpected error occurred while checking the ProxyServer registry key: {e}')
         return "Error"
+
+
+def set_autoconfig_url(url):
+    """
+    Sets the address of the proxy auto-config (PAC) script in the Windows Registry. Browsers then evaluate the script
+    for every request instead of using `ProxyServer`.
+
+    Args:
+        url (str): The URL of the PAC script, an empty string removes it.
+
+    Returns:
+        True if the setting was changed, False otherwise.
+    """
+    try:
+        registry_key = winreg.OpenKey(
+            winreg.HKEY_CURRENT_USER,
+            r"Software\Microsoft\Windows\CurrentVersion\Internet Settings",
+            0, winreg.KEY_WRITE
+        )
+
+        if url:
+            winreg.SetValueEx(registry_key, "AutoConfigURL", 0, winreg.REG_SZ, url)
+            logger.info(f"Set the PAC script to {url}")
+        else:
+            try:
+                winreg.DeleteValue(registry_key, "AutoConfigURL")
+            except FileNotFoundError:
+                pass
+            logger.info("Removed the PAC script")
+        winreg.CloseKey(registry_key)
+        return True
+    except PermissionError as e:
+        logger.error(
+            f"Insufficient permissions to change the registry. Please run this program as an administrator. Error: {e}")
+        return False
+    except Exception as e:
+        logger.error(f'An unexpected error occurred: {e}')
+        return False
+
+
+def set_bypass(entries):
+    """
+    Writes the bypass list to the ProxyOverride value of the Windows Registry in a single write.
+
+    Args:
+        entries (list[str]): The normalized entries, see `modules.bypass`. Networks are translated into wildcards.
+
+    Returns:
+        True if the list was written, False otherwise.
+    """
+    from modules import bypass
+    try:
+        registry_key = winreg.OpenKey(
+            winreg.HKEY_CURRENT_USER,
+            r"Software\Microsoft\Windows\CurrentVersion\Internet Settings",
+            0, winreg.KEY_WRITE
+        )
+
+        value = ";".join(bypass.windows_entries(entries))
+        winreg.SetValueEx(registry_key, "ProxyOverride", 0, winreg.REG_SZ, value)
+        winreg.CloseKey(registry_key)
+
+        logger.info(f"Set the bypass list ({len(entries)} entries, {len(value)} characters)")
+        return True
+    except PermissionError as e:
+        logger.error(
+            f"Insufficient permissions to change the registry. Please run this program as an administrator. Error: {e}")
+        return False
+    except Exception as e:
+        logger.error(f'An unexpected error occurred: {e}')
+        return False
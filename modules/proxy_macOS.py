@@ -64,6 +64,9 @@ def change_address(new_address):
 
     Args:
         new_address (str): The new proxy server address in the format "ip:port".
+
+    Returns:
+        True if the address was changed, False otherwise.
     """
     try:
         proxy_status = status_check()
@@ -83,10 +86,12 @@ def change_address(new_address):
             deactivate()
 
         logger.info(f"Changed https proxy address to {new_address}")
+        return True
     except subprocess.CalledProcessError as e:
         logger.error(f"Failed to change proxy address: {e}")
     except Exception as e:
         logger.error(f"An unexpected error occurred: {e}")
+    return False
 
 
 def fill_in_ip():
@@ -271,3 +276,58 @@ def server_check():
         logger.error(f"An unexpected error occurred: {e}")
 
     return "0.0.0.0:0"
+
+
+def set_autoconfig_url(url):
+    """
+    Sets the address of the proxy auto-config (PAC) script on macOS and turns automatic proxy configuration on.
+
+    Args:
+        url (str): The URL of the PAC script, an empty string turns automatic proxy configuration off.
+
+    Returns:
+        True if the setting was changed, False otherwise.
+    """
+    try:
+        if url:
+            subprocess.check_call([
+                "networksetup", "-setautoproxyurl", "Wi-Fi", url
+            ])
+            logger.info(f"Set the PAC script to {url}")
+        else:
+            subprocess.check_call([
+                "networksetup", "-setautoproxystate", "Wi-Fi", "off"
+            ])
+            logger.info("Turned the PAC script off")
+        return True
+    except subprocess.CalledProcessError as e:
+        logger.error(f"Failed to set the PAC script: {e}")
+    except Exception as e:
+        logger.error(f"An unexpected error occurred: {e}")
+    return False
+
+
+def set_bypass(entries):
+    """
+    Sets the bypass list of the Wi-Fi service with a single `networksetup` call.
+
+    Args:
+        entries (list[str]): The normalized entries, see `modules.bypass`.
+
+    Returns:
+        True if the list was set, False otherwise.
+    """
+    from modules import bypass
+    try:
+        # "Empty" clears the list
+        domains = bypass.macos_entries(entries) or ["Empty"]
+        subprocess.check_call([
+            "networksetup", "-setproxybypassdomains", "Wi-Fi", *domains
+        ])
+        logger.info(f"Set the bypass list ({len(entries)} entries)")
+        return True
+    except subprocess.CalledProcessError as e:
+        logger.error(f"Failed to set the bypass list: {e}")
+    except Exception as e:
+        logger.error(f"An unexpected error occurred: {e}")
+    return False
@@ -0,0 +1,151 @@
+import os
+import json
+import time
+import logging
+import tempfile
+from urllib.parse import urljoin
+from modules import settings
+from modules.downloader import parse_checksums, session
+
+logger = logging.getLogger(__name__)
+
+RELEASES_URL = "https://api.github.com/repos/infinitel8p/proxy-settings/releases"
+
+# cache of the latest release next to the downloaded updates
+cache_path = os.path.join(os.path.join(os.path.dirname(
+    tempfile.gettempdir()), 'Proxy Settings'), "Updates", "release_cache.json")
+
+
+def load_cache():
+    """
+    Loads the cached release metadata.
+
+    Returns:
+        dict: The cache with the keys "url", "etag", "last_modified", "release", "rate_limit_remaining" and
+        "rate_limit_reset", or an empty dict if there is no usable cache.
+    """
+    try:
+        with open(cache_path, "r") as infile:
+            return json.load(infile)
+    except (OSError, ValueError):
+        return {}
+
+
+def save_cache(cache):
+    """Atomically writes the release metadata cache."""
+    os.makedirs(os.path.dirname(cache_path), exist_ok=True)
+    temp_path = cache_path + ".tmp"
+    with open(temp_path, "w") as outfile:
+        json.dump(cache, outfile)
+    os.replace(temp_path, cache_path)
+
+
+def source_url():
+    """
+    Returns the configured update source.
+
+    A source is a releases endpoint like the one of the GitHub API: `<source>/latest` answers with the JSON of the
+    latest release. LAN mirrors and shares (`http://...`, `file://...`) can serve a static file named `latest`, the
+    `browser_download_url` of their assets may be relative to the source.
+
+    Returns:
+        str: The `update_source` setting, or `RELEASES_URL` if none is configured.
+    """
+    return (settings.load_settings()["update_source"] or RELEASES_URL).rstrip("/")
+
+
+def fetch_latest_release(url=None, timeout=(5, 30)):
+    """
+    Retrieves the metadata of the latest release, revalidating the on-disk cache instead of downloading it again.
+
+    Only the latest release is requested. The ETag and Last-Modified values of the last response are sent back as
+    `If-None-Match`/`If-Modified-Since`, so that unchanged metadata comes back as an empty 304. While the
+    `X-RateLimit-*` headers say the rate limit is used up, the cached release is returned without a request.
+
+    Args:
+        url (str, optional): The releases endpoint. Defaults to the configured `source_url`.
+        timeout (tuple, optional): Connect and read timeout in seconds. Defaults to (5, 30).
+
+    Returns:
+        dict: The release as returned by the GitHub API, including its "assets".
+
+    Raises:
+        requests.exceptions.RequestException: If the request fails and nothing is cached.
+    """
+    url = url or source_url()
+    cache = load_cache()
+    if cache.get("url") != url:
+        cache = {"url": url}
+    cached_release = cache.get("release")
+
+    if cached_release and cache.get("rate_limit_remaining") == 0 and cache.get("rate_limit_reset", 0) > time.time():
+        logger.info("GitHub rate limit reached, using cached release information.")
+        return cached_release
+
+    headers = {"Accept": "application/vnd.github+json"}
+    if cached_release and cache.get("etag"):
+        headers["If-None-Match"] = cache["etag"]
+    if cached_release and cache.get("last_modified"):
+        headers["If-Modified-Since"] = cache["last_modified"]
+
+    response = session.get(f"{url}/latest", headers=headers, timeout=timeout)
+
+    if "X-RateLimit-Remaining" in response.headers:
+        cache["rate_limit_remaining"] = int(response.headers["X-RateLimit-Remaining"])
+        cache["rate_limit_reset"] = int(response.headers.get("X-RateLimit-Reset", 0))
+
+    if response.status_code == 304:
+        save_cache(cache)
+        return cached_release
+    if response.status_code in (403, 429) and cached_release:
+        logger.warning(
+            f"Release information request was refused ({response.status_code}), using cached release information.")
+        save_cache(cache)
+        return cached_release
+
+    response.raise_for_status()
+    release = response.json()
+    for asset in release.get("assets", []):
+        asset["browser_download_url"] = urljoin(
+            f"{url}/", asset.get("browser_download_url", asset["name"]))
+    cache["release"] = release
+    cache["etag"] = response.headers.get("ETag")
+    cache["last_modified"] = response.headers.get("Last-Modified")
+    save_cache(cache)
+    return cache["release"]
+
+
+def find_asset(release, os_name):
+    """
+    Finds the full release archive for an operating system.
+
+    Args:
+        release (dict): The release as returned by `fetch_latest_release`.
+        os_name (str): The name of the operating system as returned by `platform.system()`.
+
+    Returns:
+        dict: The asset whose name contains `os_name`, or None if the release has none.
+    """
+    for asset in release["assets"]:
+        if os_name in asset["name"] and not asset["name"].endswith(".delta"):
+            return asset
+    return None
+
+
+def fetch_checksums(release, timeout=(5, 30)):
+    """
+    Downloads the `SHA256SUMS` asset of a release.
+
+    Args:
+        release (dict): The release as returned by `fetch_latest_release`.
+        timeout (tuple, optional): Connect and read timeout in seconds. Defaults to (5, 30).
+
+    Returns:
+        dict: The SHA-256 of every listed asset by name, empty if the release publishes no checksums.
+    """
+    for asset in release["assets"]:
+        if asset["name"] == "SHA256SUMS":
+            response = session.get(asset["browser_download_url"], timeout=timeout)
+            response.raise_for_status()
+            return parse_checksums(response.text)
+    return {}
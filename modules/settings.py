@@ -0,0 +1,78 @@
+import os
+import json
+import tempfile
+import threading
+
+# settings.json lives in the log folder, see SettingsUi
+settings_path = os.path.join(os.path.join(os.path.join(os.path.dirname(
+    tempfile.gettempdir()), 'Proxy Settings'), "logs"), "settings.json")
+
+defaults = {
+    "log_path": "",
+    "update_check_interval": 24,  # hours
+    "last_update_check": 0,
+    "background_updates": False,
+    "background_rate_limit": 256,  # KiB/s
+    # releases endpoint with the GitHub API shape: https://, an http:// LAN mirror or a file:// share, empty for GitHub
+    "update_source": "",
+    # upstream proxies of the local forwarding proxy (`cli.py forward`) as "host:port", in the order of preference
+    "upstream_proxies": [],
+    "forwarder_port": 3128,
+    # regional proxies as "host:port", `cli.py probe` measures them and can apply the fastest
+    "proxy_candidates": [],
+    "health_interval": 15,  # seconds between two health probes of the enabled proxy
+    "auto_disable_after": 0,  # failed health probes in a row after which the proxy is turned off, 0 for never
+    # per-destination routing served as a PAC script by `cli.py pac`, see `modules.pac` for the rule format
+    "pac_rules": [],
+    "pac_default": "DIRECT",
+    "pac_port": 8079,
+    # destinations that skip the proxy, managed with `cli.py bypass`, see `modules.bypass` for the entries
+    "bypass_list": [],
+    # proxy profiles switched by the connected Wi-Fi network, see `modules.profiles`
+    "proxy_profiles": {},
+    "network_rules": [],
+    "default_profile": "",
+}
+
+
+# writers run on the Tk thread and on worker threads, each read-modify-write holds the lock
+write_lock = threading.Lock()
+
+
+def load_settings():
+    """
+    Reads the `settings.json` file.
+
+    Returns:
+        dict: The stored settings, with the defaults filled in for missing keys.
+    """
+    settings_data = dict(defaults)
+    try:
+        with open(settings_path, "r") as infile:
+            settings_data.update(json.load(infile))
+    except (OSError, ValueError):
+        pass
+    return settings_data
+
+
+def update_settings(**values):
+    """
+    Writes the given values into the `settings.json` file, keeping all other keys. The file is replaced atomically,
+    so an interrupted write never leaves it truncated.
+
+    Args:
+        **values: The settings to change.
+    """
+    with write_lock:
+        try:
+            with open(settings_path, "r") as infile:
+                settings_data = json.load(infile)
+        except (OSError, ValueError):
+            settings_data = {}
+        settings_data.update(values)
+
+        os.makedirs(os.path.dirname(settings_path), exist_ok=True)
+        temp_path = settings_path + ".tmp"
+        with open(temp_path, "w") as outfile:
+            json.dump(settings_data, outfile)
+        os.replace(temp_path, settings_path)
@@ -0,0 +1,165 @@
+import os
+import sys
+import json
+import time
+import shutil
+
+# Installs that use slots look like this, with the launcher as the entry point:
+#   <install dir>/Proxy Settings Launcher(.exe)
+#   <install dir>/slots/slots.json            <- pointer to the current and previous slot
+#   <install dir>/slots/<version>/Proxy Settings(.exe|.app)
+# Only the standard library is used here, the launcher imports this module as well.
+STATE_FILE = "slots.json"
+# seconds a freshly installed version has to confirm that it started
+HEALTH_TIMEOUT = 60
+
+
+def find_root(path=None):
+    """
+    Finds the slots directory the running app has been started from.
+
+    Args:
+        path (str, optional): The executable to start from. Defaults to `sys.executable`.
+
+    Returns:
+        str: The slots directory, or None if the app does not run from an install slot.
+    """
+    path = os.path.abspath(path or sys.executable)
+    while True:
+        parent = os.path.dirname(path)
+        if parent == path:
+            return None
+        if os.path.basename(parent) == "slots" and os.path.isfile(os.path.join(parent, STATE_FILE)):
+            return parent
+        path = parent
+
+
+def load_state(root):
+    """
+    Reads the slot pointer.
+
+    Args:
+        root (str): The slots directory.
+
+    Returns:
+        dict: The keys "current" and "previous" (slot names or None), "pending" (the current slot still has to pass
+        its health check), "attempts" (launches of the pending slot so far) and "launcher" (the command that starts
+        the launcher).
+    """
+    state = {"current": None, "previous": None,
+             "pending": False, "attempts": 0, "launcher": None}
+    try:
+        with open(os.path.join(root, STATE_FILE), "r") as infile:
+            state.update(json.load(infile))
+    except (OSError, ValueError):
+        pass
+    return state
+
+
+def save_state(root, state):
+    """Atomically replaces the slot pointer, so that a crash never leaves it half written."""
+    os.makedirs(root, exist_ok=True)
+    temp_path = os.path.join(root, STATE_FILE + ".tmp")
+    with open(temp_path, "w") as outfile:
+        json.dump(state, outfile)
+        outfile.flush()
+        os.fsync(outfile.fileno())
+    os.replace(temp_path, os.path.join(root, STATE_FILE))
+
+
+def slot_path(root, slot):
+    """Returns the directory of a slot."""
+    return os.path.join(root, slot)
+
+
+def executable(root, slot, name):
+    """
+    Finds the app inside a slot.
+
+    Args:
+        root (str): The slots directory.
+        slot (str): The slot name.
+        name (str): The name of the application.
+
+    Returns:
+        str: The `.exe`, `.app` bundle or plain executable of the slot, or None if the slot has none.
+    """
+    for candidate in (f"{name}.exe", f"{name}.app", name):
+        path = os.path.join(slot_path(root, slot), candidate)
+        if os.path.exists(path):
+            return path
+    return None
+
+
+def install(root, slot, source_path):
+    """
+    Moves an extracted release into its own slot, next to the installed ones.
+
+    Args:
+        root (str): The slots directory.
+        slot (str): The slot name, usually the release tag.
+        source_path (str): The directory with the extracted release.
+
+    Raises:
+        ValueError: If `slot` is the slot that is currently in use.
+    """
+    if slot == load_state(root)["current"]:
+        raise ValueError(f"Slot {slot} is in use.")
+    destination = slot_path(root, slot)
+    shutil.rmtree(destination, ignore_errors=True)
+    shutil.move(source_path, destination)
+
+
+def switch(root, slot):
+    """
+    Points the launcher at `slot` and keeps the current slot as the rollback target. The new slot is pending until
+    it calls `mark_healthy`, older slots are removed.
+
+    Args:
+        root (str): The slots directory.
+        slot (str): The slot to switch to.
+    """
+    state = load_state(root)
+    if state["current"] != slot:
+        state["previous"] = state["current"]
+    state.update(current=slot, pending=True,
+                 attempts=0, switched=time.time())
+    save_state(root, state)
+    prune(root, state)
+
+
+def prune(root, state):
+    """Removes every slot except the current and the previous one."""
+    keep = {state["current"], state["previous"]}
+    for entry in os.listdir(root):
+        path = os.path.join(root, entry)
+        if entry not in keep and os.path.isdir(path):
+            # a slot that is still running can not be removed on Windows, it goes on the next switch
+            shutil.rmtree(path, ignore_errors=True)
+
+
+def mark_healthy(root):
+    """Confirms that the current slot started, which ends its health check."""
+    state = load_state(root)
+    if state["pending"]:
+        state.update(pending=False, attempts=0)
+        save_state(root, state)
+
+
+def rollback(root):
+    """
+    Switches back to the previous slot. The slot that is rolled back from is kept as the new previous slot.
+
+    Args:
+        root (str): The slots directory.
+
+    Returns:
+        str: The slot that is current now, or None if there is no slot to roll back to.
+    """
+    state = load_state(root)
+    if not state["previous"] or not os.path.isdir(slot_path(root, state["previous"])):
+        return None
+    state.update(current=state["previous"], previous=state["current"],
+                 pending=False, attempts=0, switched=time.time())
+    save_state(root, state)
+    return state["current"]
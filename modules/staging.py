@@ -0,0 +1,143 @@
+import os
+import json
+import shutil
+import logging
+import threading
+from packaging.version import Version
+from modules import releases, updater
+from modules.downloader import Downloader, lower_thread_priority
+
+logger = logging.getLogger(__name__)
+
+# releases that are downloaded, verified and extracted in the background wait here until they are installed
+staged_path = os.path.join(updater.updates_path, "staged")
+manifest_path = os.path.join(staged_path, "staged.json")
+
+
+def load_manifest():
+    """
+    Reads the manifest of the staged release.
+
+    Returns:
+        dict: The manifest with the keys "version", "path" and "sha256", or None if no complete release is staged.
+    """
+    try:
+        with open(manifest_path, "r") as infile:
+            manifest = json.load(infile)
+        if os.path.isdir(manifest["path"]):
+            return manifest
+    except (OSError, ValueError, KeyError):
+        pass
+    return None
+
+
+def staged_update(current_version):
+    """
+    Looks for a staged release that is newer than the running version.
+
+    Args:
+        current_version (str): The version of the running app.
+
+    Returns:
+        dict: The manifest of the staged release, or None if there is nothing newer staged.
+    """
+    manifest = load_manifest()
+    if manifest and Version(manifest["version"].replace("v", "")) > Version(str(current_version).replace("v", "")):
+        return manifest
+    return None
+
+
+def apply_staged(os_name, name, manifest, relaunch):
+    """
+    Installs a staged release, see `updater.install`.
+
+    Args:
+        os_name (str): The name of the operating system as returned by `platform.system()`.
+        name (str): The name of the application.
+        manifest (dict): The manifest of the staged release.
+        relaunch (bool): Whether the helper starts the new version afterwards.
+
+    Returns:
+        bool: True if the release has been installed or handed to the update helper, False if that was not possible.
+    """
+    logger.info(f"Installing staged update {manifest['version']}...")
+    try:
+        if not updater.install(os_name, staged_path, manifest["path"], name, manifest["version"], relaunch=relaunch):
+            return False
+    except ValueError as e:
+        # the staged version is the one running from its slot
+        logger.error(f"Could not install staged update {manifest['version']}: {e}")
+        return False
+    # the helper consumes the extracted release, do not offer it again
+    os.remove(manifest_path)
+    return True
+
+
+class Prestager(threading.Thread):
+    """
+    Downloads, verifies and extracts a release into the staging directory in the background.
+
+    The download runs at a lowered thread priority and with a bandwidth cap so that it does not get in the way of
+    the user. Once the release is extracted, a manifest is written and `staged_update` will report it.
+
+    Attributes:
+        release (dict): The release to stage as returned by `releases.fetch_latest_release`.
+        os_name (str): The name of the operating system as returned by `platform.system()`.
+        rate_limit (int): Maximum average download speed in bytes per second.
+    """
+
+    def __init__(self, release, os_name, rate_limit=256 * 1024):
+        super().__init__(daemon=True)
+        self.release = release
+        self.os_name = os_name
+        self.rate_limit = rate_limit
+
+    def run(self):
+        lower_thread_priority()
+        try:
+            self.stage()
+        except Exception as e:
+            logger.error(f"Could not stage update {self.release.get('tag_name')}: {e}")
+
+    def stage(self):
+        """Performs the download, verification and extraction of the release."""
+        version = self.release["tag_name"]
+        manifest = load_manifest()
+        if manifest and manifest["version"] == version:
+            return
+
+        asset = releases.find_asset(self.release, self.os_name)
+        if asset is None:
+            logger.warning(f"No download for {self.os_name} in release {version}.")
+            return
+        checksums = releases.fetch_checksums(self.release)
+
+        version_path = os.path.join(staged_path, version)
+        os.makedirs(version_path, exist_ok=True)
+        archive_path = os.path.join(version_path, asset["name"])
+        logger.info(f"Staging update {version} in the background...")
+
+        # the archive is extracted while it arrives, the directory only appears once the download is verified
+        files_path = os.path.join(version_path, "files")
+        downloader = Downloader(asset["browser_download_url"], archive_path, sha256=checksums.get(asset["name"]),
+                                rate_limit=self.rate_limit, low_priority=True, segments=1, extract_to=files_path)
+        downloader.run()
+        while True:
+            event = downloader.events.get()
+            if event[0] == "error":
+                return
+            if event[0] == "done":
+                digest = event[2]
+                break
+        os.remove(archive_path)
+
+        # drop older staged releases
+        for entry in os.listdir(staged_path):
+            if entry != version and os.path.isdir(os.path.join(staged_path, entry)):
+                shutil.rmtree(os.path.join(staged_path, entry), ignore_errors=True)
+
+        temp_manifest = manifest_path + ".tmp"
+        with open(temp_manifest, "w") as outfile:
+            json.dump({"version": version, "path": files_path, "sha256": digest}, outfile)
+        os.replace(temp_manifest, manifest_path)
+        logger.info(f"Update {version} is ready and will be installed when the app is closed.")
@@ -0,0 +1,77 @@
+import queue
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from modules import profiler
+
+logger = logging.getLogger(__name__)
+
+# milliseconds between two looks at the finished probes while some are still running
+POLL_INTERVAL = 20
+
+
+class StartupProbes:
+    """
+    Runs the independent startup probes (proxy state, first Wi-Fi scan, update check) concurrently on a thread pool,
+    so that the window shows right away and startup takes as long as the slowest probe instead of the sum of all.
+
+    Each probe hands its result to a callback on the Tk thread as soon as it is ready, which replaces the placeholder
+    of its section. `submit` and the callbacks run on the Tk thread, only the probe functions run on the pool.
+
+    Attributes:
+        widget (customtkinter.CTk): Any widget, used to schedule the polling on the Tk thread.
+        executor (ThreadPoolExecutor): The pool the probes run on.
+    """
+
+    def __init__(self, widget, workers=6):
+        self.widget = widget
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="probe")
+        self.results = queue.Queue()
+        self.pending = 0
+
+    def submit(self, name, function, callback=None, default=None):
+        """
+        Starts a probe.
+
+        Args:
+            name (str): The name used in logs and the startup trace.
+            function (callable): Runs on the pool and returns the result.
+            callback (callable, optional): Called with the result on the Tk thread. Defaults to None.
+            default (optional): Passed to `callback` instead of a result if `function` raised. Defaults to None.
+        """
+        self.pending += 1
+        if self.pending == 1:
+            self.widget.after(POLL_INTERVAL, self.poll)
+        self.executor.submit(self.run, name, function, callback, default)
+
+    def run(self, name, function, callback, default):
+        with profiler.span(f"probe: {name}"):
+            try:
+                result = function()
+            except Exception as e:
+                logger.error(f"{name} failed: {e}")
+                result = default
+        self.results.put((name, callback, result))
+
+    def poll(self):
+        """Hands the results of finished probes to their callbacks without blocking the Tk thread."""
+        finished = []
+        try:
+            while True:
+                finished.append(self.results.get_nowait())
+        except queue.Empty:
+            pass
+        self.pending -= len(finished)
+        # scheduled before the callbacks run, a callback that opens a modal dialog must not hold back the others
+        if self.pending:
+            self.widget.after(POLL_INTERVAL, self.poll)
+        for name, callback, result in finished:
+            if callback is None:
+                continue
+            try:
+                callback(result)
+            except Exception as e:
+                logger.error(f"Showing the result of {name} failed: {e}")
+
+    def shutdown(self):
+        """Drops the probes that have not started yet."""
+        self.executor.shutdown(wait=False, cancel_futures=True)
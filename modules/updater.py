@@ -0,0 +1,375 @@
+import os
+import sys
+import json
+import time
+import shlex
+import shutil
+import logging
+import tempfile
+import subprocess
+from modules import slots
+from modules.extract import extract_archive
+
+logger = logging.getLogger(__name__)
+
+# the update helpers report their progress here, the next launch of the app picks it up
+updates_path = os.path.join(os.path.join(os.path.dirname(
+    tempfile.gettempdir()), 'Proxy Settings'), "Updates")
+status_path = os.path.join(updates_path, "update_status.jsonl")
+
+
+def _ps_quote(value):
+    """Quotes a string for PowerShell."""
+    return "'" + str(value).replace("'", "''") + "'"
+
+
+def write_bash_updater(script_path, pid, archive_path, target_path, status_file=status_path, relaunch=True):
+    """
+    Writes the update helper used on macOS (and any other system with bash).
+
+    The helper waits for the process `pid` to exit (`caffeinate -w` on macOS, `tail --pid` on Linux, otherwise a short
+    `kill -0` loop), extracts the archive next to the target, swaps the new version in with a rename, relaunches it
+    and reports every step as a JSON line to `status_file`. If `archive_path` is a directory the release has already
+    been extracted there (see `modules.staging`) and is moved into place from it.
+
+    Args:
+        script_path (str): Where to write the script.
+        pid (int): Process id of the running app that has to exit before its files are replaced.
+        archive_path (str): The downloaded release archive, or a directory with the extracted release.
+        target_path (str): The installed executable or `.app` bundle to replace. The archive has to contain an entry
+            with the same name at its root.
+        status_file (str, optional): The file status lines are appended to. Defaults to `status_path`.
+        relaunch (bool, optional): Whether to start the new version once it is installed. Defaults to True.
+
+    Returns:
+        list[str]: The command that runs the helper.
+    """
+    target_dir, target_name = os.path.split(target_path)
+    with open(script_path, "w", newline="\n") as outfile:
+        outfile.write(f"""#!/bin/bash
+pid={int(pid)}
+archive={shlex.quote(archive_path)}
+target={shlex.quote(target_path)}
+staging={shlex.quote(os.path.join(target_dir, f".{target_name}.staging"))}
+backup={shlex.quote(os.path.join(target_dir, f".{target_name}.old"))}
+status_file={shlex.quote(status_file)}
+relaunch={1 if relaunch else 0}
+
+report() {{
+    local message
+    # paths and errors may contain quotes and backslashes, which have to be escaped for JSON
+    message=$(printf '%s' "$3" | tr '\\n\\r\\t' '   ' | sed 's/\\\\/\\\\\\\\/g; s/"/\\\\"/g')
+    printf '{{"step": "%s", "ok": %s, "message": "%s", "time": %s}}\\n' "$1" "$2" "$message" "$(date +%s)" >> "$status_file"
+}}
+fail() {{
+    report "$1" false "$2"
+    rm -rf "$staging"
+    exit 1
+}}
+
+# wait for the app to exit
+if command -v caffeinate >/dev/null 2>&1; then
+    caffeinate -w "$pid" >/dev/null 2>&1
+else
+    # tail checks the process once per second unless told otherwise
+    tail -s 0.1 --pid="$pid" -f /dev/null >/dev/null 2>&1
+fi
+while kill -0 "$pid" 2>/dev/null; do sleep 0.1; done
+report exited true "Process $pid exited"
+
+if [ -d "$archive" ]; then
+    # already extracted while the app was running
+    staging="$archive"
+else
+    rm -rf "$staging"
+    mkdir -p "$staging" || fail extract "Could not create $staging"
+    unzip -q -o "$archive" -d "$staging" || fail extract "Could not extract $archive"
+fi
+[ -e "$staging/{target_name}" ] || fail extract "{target_name} is missing from the archive"
+report extract true "Extracted $archive"
+
+if [ -d "$target" ]; then
+    # directories can not be replaced in one rename, keep the old one until the new one is in place
+    rm -rf "$backup"
+    mv "$target" "$backup" || fail swap "Could not move $target aside"
+    if ! mv "$staging/{target_name}" "$target"; then
+        mv "$backup" "$target"
+        fail swap "Could not move the new version into place"
+    fi
+    rm -rf "$backup"
+else
+    mv -f "$staging/{target_name}" "$target" || fail swap "Could not move the new version into place"
+fi
+rm -rf "$staging"
+report swap true "Installed $target"
+
+if [ "$relaunch" = 1 ]; then
+    if [[ "$target" == *.app ]]; then
+        open "$target" || fail relaunch "Could not launch $target"
+    else
+        nohup "$target" >/dev/null 2>&1 &
+    fi
+    report relaunch true "Launched $target"
+fi
+report done true "Update finished"
+""")
+    os.chmod(script_path, 0o755)
+    return ["/bin/bash", script_path]
+
+
+def write_powershell_updater(script_path, pid, archive_path, target_path, status_file=status_path, relaunch=True):
+    """
+    Writes the update helper used on Windows. Works like `write_bash_updater`, waiting with `Wait-Process`.
+
+    Args:
+        script_path (str): Where to write the script.
+        pid (int): Process id of the running app that has to exit before its files are replaced.
+        archive_path (str): The downloaded release archive, or a directory with the extracted release.
+        target_path (str): The installed executable to replace. The archive has to contain an entry with the same name
+            at its root.
+        status_file (str, optional): The file status lines are appended to. Defaults to `status_path`.
+        relaunch (bool, optional): Whether to start the new version once it is installed. Defaults to True.
+
+    Returns:
+        list[str]: The command that runs the helper.
+    """
+    target_dir, target_name = os.path.split(target_path)
+    with open(script_path, "w") as outfile:
+        outfile.write(f"""$appPid = {int(pid)}
+$archive = {_ps_quote(archive_path)}
+$target = {_ps_quote(target_path)}
+$staging = {_ps_quote(os.path.join(target_dir, f".{target_name}.staging"))}
+$backup = {_ps_quote(os.path.join(target_dir, f".{target_name}.old"))}
+$statusFile = {_ps_quote(status_file)}
+$relaunch = ${"true" if relaunch else "false"}
+
+function Report($step, $ok, $message) {{
+    $line = @{{ step = $step; ok = $ok; message = $message; time = [DateTimeOffset]::UtcNow.ToUnixTimeSeconds() }} | ConvertTo-Json -Compress
+    Add-Content -Path $statusFile -Value $line
+}}
+function Fail($step, $message) {{
+    Report $step $false $message
+    Remove-Item -Recurse -Force $staging -ErrorAction SilentlyContinue
+    exit 1
+}}
+
+# wait for the app to exit
+Wait-Process -Id $appPid -ErrorAction SilentlyContinue
+Report "exited" $true "Process $appPid exited"
+
+if (Test-Path -PathType Container $archive) {{
+    # already extracted while the app was running
+    $staging = $archive
+}}
+else {{
+    Remove-Item -Recurse -Force $staging -ErrorAction SilentlyContinue
+    try {{ Expand-Archive -Path $archive -DestinationPath $staging -Force -ErrorAction Stop }}
+    catch {{ Fail "extract" "Could not extract ${{archive}}: $_" }}
+}}
+if (-not (Test-Path (Join-Path $staging {_ps_quote(target_name)}))) {{ Fail "extract" "{target_name} is missing from the archive" }}
+Report "extract" $true "Extracted $archive"
+
+try {{
+    Remove-Item -Force $backup -ErrorAction SilentlyContinue
+    if (Test-Path $target) {{ Move-Item -Path $target -Destination $backup -ErrorAction Stop }}
+    try {{ Move-Item -Path (Join-Path $staging {_ps_quote(target_name)}) -Destination $target -ErrorAction Stop }}
+    catch {{
+        if (Test-Path $backup) {{ Move-Item -Path $backup -Destination $target }}
+        throw
+    }}
+    Remove-Item -Force $backup -ErrorAction SilentlyContinue
+}}
+catch {{ Fail "swap" "Could not move the new version into place: $_" }}
+Remove-Item -Recurse -Force $staging -ErrorAction SilentlyContinue
+Report "swap" $true "Installed $target"
+
+if ($relaunch) {{
+    try {{ Start-Process -FilePath $target -ErrorAction Stop }}
+    catch {{ Fail "relaunch" "Could not launch ${{target}}: $_" }}
+    Report "relaunch" $true "Launched $target"
+}}
+Report "done" $true "Update finished"
+""")
+    return ["powershell", "-NoProfile", "-ExecutionPolicy", "Bypass", "-WindowStyle", "Hidden", "-File", script_path]
+
+
+def installed_target(os_name, name):
+    """
+    Determines the installed artifact that an update replaces.
+
+    Args:
+        os_name (str): The name of the operating system as returned by `platform.system()`.
+        name (str): The name of the application.
+
+    Returns:
+        str: The running executable on Windows, the `.app` bundle it belongs to on macOS.
+    """
+    if os_name == "Darwin":
+        return os.path.join(os.path.dirname(os.path.dirname(os.path.dirname(
+            os.path.dirname(sys.executable)))), f"{name}.app")
+    return sys.executable
+
+
+def prepare(os_name, work_dir, source_path, name, relaunch=True):
+    """
+    Writes the update helper for the current operating system.
+
+    Args:
+        os_name (str): The name of the operating system as returned by `platform.system()`.
+        work_dir (str): The directory the helper script is written to.
+        source_path (str): The release archive, or a directory with the extracted release.
+        name (str): The name of the application.
+        relaunch (bool, optional): Whether the helper starts the new version. Defaults to True.
+
+    Returns:
+        list[str]: The command that runs the helper, or None if the operating system is not supported.
+    """
+    # start with a clean status file, the next launch reports what the helper did
+    if os.path.exists(status_path):
+        os.remove(status_path)
+
+    target_path = installed_target(os_name, name)
+    if os_name == "Windows":
+        return write_powershell_updater(os.path.join(work_dir, "updater.ps1"), os.getpid(), source_path,
+                                        target_path, relaunch=relaunch)
+    if os_name == "Darwin":
+        return write_bash_updater(os.path.join(work_dir, "updater.sh"), os.getpid(), source_path,
+                                  target_path, relaunch=relaunch)
+    return None
+
+
+def install_slot(root, source_path, version, relaunch=True):
+    """
+    Installs a release into a new install slot next to the running one and points the launcher at it.
+
+    Nothing that is installed is touched: the running version stays in its slot as the rollback target, and the
+    launcher reverts to it if the new version does not confirm its start (see `modules.slots`).
+
+    Args:
+        root (str): The slots directory.
+        source_path (str): The release archive, or a directory with the extracted release.
+        version (str): The release tag, used as the slot name.
+        relaunch (bool, optional): Whether to start the new version through the launcher. Defaults to True.
+
+    Raises:
+        ValueError: If `version` is the slot that is currently in use.
+    """
+    if os.path.exists(status_path):
+        os.remove(status_path)
+
+    if not os.path.isdir(source_path):
+        # extract next to the slots, so that moving it into its slot is a rename
+        extracted = slots.slot_path(root, f".{version}.tmp")
+        shutil.rmtree(extracted, ignore_errors=True)
+        extract_archive(source_path, extracted)
+        source_path = extracted
+    slots.install(root, version, source_path)
+    slots.switch(root, version)
+    write_status("swap", True, f"Installed {version} into its slot")
+
+    launcher = slots.load_state(root)["launcher"]
+    if relaunch and launcher:
+        launch(launcher)
+        write_status("relaunch", True, f"Launched {version}")
+    write_status("done", True, "Update finished")
+
+
+def install(os_name, work_dir, source_path, name, version, relaunch=True):
+    """
+    Installs a downloaded release. Apps started from an install slot get a new slot, all others hand the release
+    to the update helper, which swaps it in once this process has exited.
+
+    Args:
+        os_name (str): The name of the operating system as returned by `platform.system()`.
+        work_dir (str): The directory the helper script is written to.
+        source_path (str): The release archive, or a directory with the extracted release.
+        name (str): The name of the application.
+        version (str): The release tag.
+        relaunch (bool, optional): Whether to start the new version. Defaults to True.
+
+    Returns:
+        bool: True if the release has been installed or the helper has been launched, False if the operating system
+        is not supported.
+
+    Raises:
+        ValueError: If the release would replace the install slot that is running, see `install_slot`.
+    """
+    root = slots.find_root()
+    if root:
+        install_slot(root, source_path, version, relaunch=relaunch)
+        return True
+
+    command = prepare(os_name, work_dir, source_path, name, relaunch=relaunch)
+    if command is None:
+        return False
+    launch(command)
+    return True
+
+
+def launch(command):
+    """
+    Starts an update helper detached from the app, so that it outlives it.
+
+    Args:
+        command (list[str]): The command returned by one of the `write_*_updater` functions.
+
+    Returns:
+        subprocess.Popen: The started helper process.
+    """
+    if os.name == "nt":
+        return subprocess.Popen(command, creationflags=subprocess.CREATE_NEW_PROCESS_GROUP | subprocess.DETACHED_PROCESS)
+    return subprocess.Popen(command, start_new_session=True, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+
+
+def write_status(step, ok, message, status_file=status_path):
+    """
+    Appends a status line in the format of the update helpers.
+
+    Args:
+        step (str): The update step.
+        ok (bool): Whether the step succeeded.
+        message (str): What happened.
+        status_file (str, optional): The status file. Defaults to `status_path`.
+    """
+    os.makedirs(os.path.dirname(status_file), exist_ok=True)
+    with open(status_file, "a") as outfile:
+        outfile.write(json.dumps({"step": step, "ok": ok, "message": message, "time": int(time.time())}) + "\n")
+
+
+def read_status(status_file=status_path):
+    """
+    Reads the status lines reported by the last update helper.
+
+    Args:
+        status_file (str, optional): The status file. Defaults to `status_path`.
+
+    Returns:
+        list[dict]: One dict per reported step with the keys "step", "ok", "message" and "time".
+    """
+    entries = []
+    try:
+        with open(status_file, "r", encoding="utf-8-sig") as infile:
+            for line in infile:
+                if line.strip():
+                    try:
+                        entries.append(json.loads(line))
+                    except ValueError:
+                        pass
+    except OSError:
+        pass
+    return entries
+
+
+def report_status(status_file=status_path):
+    """Logs the outcome of the last update, if there was one, and clears the status file."""
+    entries = read_status(status_file)
+    if not entries:
+        return
+    for entry in entries:
+        if not entry.get("ok"):
+            logger.error(
+                f"Update failed during {entry.get('step')}: {entry.get('message')}")
+            break
+    else:
+        logger.info(f"Update finished: {entries[-1].get('message')}")
+    os.remove(status_file)
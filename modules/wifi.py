@@ -2,6 +2,7 @@ import os
 import re
 import time
 import logging
+import threading
 import subprocess
 import customtkinter
 from pywifi import PyWiFi, const, Profile
@@ -17,29 +18,100 @@ startupinfo.wShowWindow = subprocess.SW_HIDE
 encoding = 'cp850'
 
 
-def get_connected_ssid():
+def get_connection():
     """
-    Retrieves the SSID of the currently connected WiFi network.
+    Retrieves the SSID and BSSID of the currently connected WiFi network.
 
     This function uses the `netsh wlan show interfaces` command to obtain details about the current wireless
-    network connection. It parses the command output to extract the SSID of the network the device is currently
-    connected to. If no SSID is found (indicating no current connection), the function returns None.
+    network connection and parses the SSID and BSSID from its output.
 
     Returns:
-        str: The SSID of the currently connected WiFi network, or None if the device is not connected to any network.
+        tuple: The SSID and the BSSID of the connected network, None for each that could not be found.
     """
 
     command = ["netsh", "wlan", "show", "interfaces"]
+    ssid = bssid = None
     try:
         result = subprocess.run(command, check=True, text=True,
                                 stdout=subprocess.PIPE, stderr=subprocess.STDOUT, encoding=encoding, startupinfo=startupinfo)
 
         for line in result.stdout.split('\n'):
-            if "SSID" in line and "BSSID" not in line:
-                return re.findall(r':\s*(.*)', line)[0].strip()
+            if "BSSID" in line and bssid is None:
+                bssid = re.findall(r':\s*(.*)', line)[0].strip()
+            elif "SSID" in line and ssid is None:
+                ssid = re.findall(r':\s*(.*)', line)[0].strip()
     except subprocess.CalledProcessError as e:
         logger.error(f"Failed to get connected SSID: {e.output}")
-    return None
+    return ssid, bssid
+
+
+def get_connected_ssid():
+    """
+    Retrieves the SSID of the currently connected WiFi network.
+
+    This function uses the `netsh wlan show interfaces` command to obtain details about the current wireless
+    network connection. It parses the command output to extract the SSID of the network the device is currently
+    connected to. If no SSID is found (indicating no current connection), the function returns None.
+
+    Returns:
+        str: The SSID of the currently connected WiFi network, or None if the device is not connected to any network.
+    """
+
+    return get_connection()[0]
+
+
+class ConnectionWatcher:
+    """
+    Reports every connect and disconnect of the Wi-Fi adapter as the WLAN service announces it
+    (`WlanRegisterNotification`), so connection changes are seen right away without polling.
+
+    The callback is called with the result of `get_connection` on a short-lived worker thread, the notification
+    thread of the WLAN service is not held up by `netsh`.
+
+    Attributes:
+        callback (callable): Called with the SSID and BSSID of the connected network (None for both if there is none).
+    """
+
+    # WLAN_NOTIFICATION_SOURCE_ACM and the connection codes of the auto configuration module
+    SOURCE_ACM = 0x08
+    CONNECTION_COMPLETE = 10
+    DISCONNECTED = 21
+
+    def __init__(self, callback):
+        """
+        Raises:
+            OSError: If the notifications can not be registered, e.g. because the WLAN service is not running.
+        """
+        import ctypes
+        from ctypes import wintypes
+
+        class NotificationData(ctypes.Structure):
+            _fields_ = [("source", wintypes.DWORD), ("code", wintypes.DWORD), ("interface", ctypes.c_byte * 16),
+                        ("size", wintypes.DWORD), ("data", ctypes.c_void_p)]
+
+        self.callback = callback
+        self.wlanapi = ctypes.windll.wlanapi
+        self.handle = wintypes.HANDLE()
+        negotiated = wintypes.DWORD()
+        result = self.wlanapi.WlanOpenHandle(2, None, ctypes.byref(negotiated), ctypes.byref(self.handle))
+        if result:
+            raise OSError(result, "WlanOpenHandle failed")
+        # the function object has to stay alive as long as it is registered
+        self.function = ctypes.WINFUNCTYPE(None, ctypes.POINTER(NotificationData), ctypes.c_void_p)(self.notified)
+        result = self.wlanapi.WlanRegisterNotification(
+            self.handle, self.SOURCE_ACM, True, self.function, None, None, None)
+        if result:
+            self.wlanapi.WlanCloseHandle(self.handle, None)
+            raise OSError(result, "WlanRegisterNotification failed")
+
+    def notified(self, data, context):
+        if data.contents.code in (self.CONNECTION_COMPLETE, self.DISCONNECTED):
+            threading.Thread(target=lambda: self.callback(*get_connection()), daemon=True).start()
+
+    def close(self):
+        """Stops the notifications."""
+        self.wlanapi.WlanRegisterNotification(self.handle, 0, True, None, None, None, None)
+        self.wlanapi.WlanCloseHandle(self.handle, None)
 
 
 def scan_wifi_networks():
@@ -51,9 +123,10 @@ def scan_wifi_networks():
     by signal strength in descending order.
 
     Returns:
-        A list of dictionaries, where each dictionary represents a WiFi network with keys 'ssid', 'signal', and 'auth'.
-        'signal' is an integer representing the signal strength percentage, 'ssid' is the name of the network,
-        and 'auth' is the authentication type. If 'auth' or 'ssid' could not be determined, they are set to 'Unknown'.
+        A list of dictionaries, where each dictionary represents a WiFi network with keys 'ssid', 'signal', 'auth',
+        'connected' and 'bssid'. 'signal' is an integer representing the signal strength percentage, 'ssid' is the name
+        of the network, and 'auth' is the authentication type. If 'auth' or 'ssid' could not be determined, they are set
+        to 'Unknown'. 'bssid' is the access point the device is connected to, None for other networks.
     """
 
     # Run the "netsh" command to list the available Wi-Fi networks
@@ -63,7 +136,7 @@ def scan_wifi_networks():
     # Parse the output to extract the SSIDs, signal strengths, and authentication types of the available networks
     networks = []
     current_network = {}
-    connected_ssid = get_connected_ssid()
+    connected_ssid, connected_bssid = get_connection()
 
     for line in result.stdout.split('\n'):
         line = line.strip()
@@ -77,6 +150,7 @@ def scan_wifi_networks():
             signal = int(re.findall(r':\s*(.*)%', line)[0])
             current_network['signal'] = signal
             current_network['connected'] = (ssid == connected_ssid)
+            current_network['bssid'] = connected_bssid if ssid == connected_ssid else None
             networks.append(current_network.copy())
             current_network.clear()
 
@@ -238,8 +312,7 @@ def is_already_connected(ssid):
         True if the device is currently connected to the network specified by the SSID, False otherwise.
     """
 
-    connected_ssid = get_connected_ssid()
-    return connected_ssid == ssid
+    return get_connection()[0] == ssid
 
 
 def wait_for_connection(iface, timeout=10):
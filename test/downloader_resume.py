@@ -0,0 +1,87 @@
+import os
+import sys
+import queue
+import shutil
+import hashlib
+import tempfile
+import threading
+import http.server
+
+# Checks that an interrupted download resumes from its `.part` journal: a stand-in server drops the connection in
+# the middle of the first transfer, the downloader has to continue with a Range request from where the journal says
+# it stopped and end up with the complete, verified file. Run from the repository root: python test/downloader_resume.py
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from modules.downloader import Downloader  # noqa: E402
+
+payload = os.urandom(3 * 1024 * 1024)
+drop_after = 1024 * 1024
+etag = '"release-1"'
+requests_seen = []
+
+
+class Release(http.server.BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def do_GET(self):
+        requested = self.headers.get("Range")
+        requests_seen.append(requested)
+        start = int(requested[len("bytes="):].split("-")[0]) if requested else 0
+        body = payload[start:]
+        self.send_response(206 if requested else 200)
+        self.send_header("Content-Length", str(len(body)))
+        self.send_header("Accept-Ranges", "bytes")
+        self.send_header("ETag", etag)
+        if requested:
+            self.send_header("Content-Range", f"bytes {start}-{len(payload) - 1}/{len(payload)}")
+        self.end_headers()
+        if len(requests_seen) == 1:
+            # the first transfer breaks off in the middle of the body
+            self.wfile.write(body[:drop_after])
+            self.wfile.flush()
+            self.close_connection = True
+            return
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+server = http.server.ThreadingHTTPServer(("127.0.0.1", 0), Release)
+threading.Thread(target=server.serve_forever, daemon=True).start()
+directory = tempfile.mkdtemp()
+failures = []
+try:
+    path = os.path.join(directory, "release.zip")
+    events = queue.Queue()
+    downloader = Downloader(f"http://127.0.0.1:{server.server_address[1]}/release.zip", path, events=events,
+                            retries=2, cache=False, sha256=hashlib.sha256(payload).hexdigest())
+    downloader.start()
+    downloader.join(30)
+
+    outcome = None
+    while True:
+        try:
+            event = events.get_nowait()
+        except queue.Empty:
+            break
+        if event[0] != "progress":
+            outcome = event
+    if outcome is None or outcome[0] != "done":
+        failures.append(f"finishing the download ({outcome})")
+    elif open(path, "rb").read() != payload:
+        failures.append("the content of the resumed download")
+    if len(requests_seen) != 2 or not requests_seen[1] or requests_seen[1] == "bytes=0-":
+        failures.append(f"resuming with a Range request ({requests_seen})")
+    else:
+        print(f"Resumed with {requests_seen[1]} after the connection was dropped at {drop_after} bytes")
+    if os.path.exists(path + ".part.json"):
+        failures.append("removing the journal")
+finally:
+    server.shutdown()
+    shutil.rmtree(directory, ignore_errors=True)
+
+if failures:
+    print(f"Failed: {', '.join(failures)}")
+    sys.exit(1)
+print("Interrupted downloads resume from the journal.")
@@ -0,0 +1,147 @@
+import os
+import sys
+import time
+import socket
+import asyncio
+import threading
+import socketserver
+import http.server
+import urllib.request
+
+# End to end check of the local forwarding proxy against stand-ins on localhost: an origin server and two upstream
+# proxies. Checks forwarding, connection reuse, CONNECT tunnels and the failover to the backup when the primary goes
+# down. Run from the repository root: python test/forwarder.py
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from modules.forwarder import Forwarder  # noqa: E402
+
+
+class Origin(http.server.BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def do_GET(self):
+        body = f"hello {self.path}".encode()
+        self.send_response(200)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+class UpstreamProxy(socketserver.BaseRequestHandler):
+    """A minimal keep-alive proxy that answers absolute-form GET requests and tunnels CONNECT requests."""
+
+    def handle(self):
+        self.server.connections.append(self.request)
+        infile = self.request.makefile("rb")
+        while True:
+            line = infile.readline()
+            if not line:
+                return
+            while infile.readline() not in (b"\r\n", b""):
+                pass
+            method, target, _ = line.decode().split()
+            if method == "CONNECT":
+                host, port = target.split(":")
+                origin = socket.create_connection((host, int(port)))
+                self.request.sendall(b"HTTP/1.1 200 Connection established\r\n\r\n")
+                threading.Thread(target=pipe, args=(origin, self.request), daemon=True).start()
+                pipe(self.request, origin)
+                return
+            body = urllib.request.urlopen(target).read()
+            self.request.sendall(f"HTTP/1.1 200 OK\r\nX-Upstream: {self.server.name}\r\n"
+                                 f"Content-Length: {len(body)}\r\n\r\n".encode() + body)
+
+
+def pipe(source, destination):
+    try:
+        while data := source.recv(65536):
+            destination.sendall(data)
+        destination.shutdown(socket.SHUT_WR)
+    except OSError:
+        pass
+
+
+class Server(socketserver.ThreadingTCPServer):
+    daemon_threads = True
+    # the primary is restarted on its old port
+    allow_reuse_address = True
+
+
+def start_upstream(name, port=0):
+    server = Server(("127.0.0.1", port), UpstreamProxy)
+    server.name = name
+    server.connections = []
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def stop_upstream(server):
+    server.shutdown()
+    server.server_close()
+    for connection in server.connections:
+        try:
+            connection.shutdown(socket.SHUT_RDWR)
+        except OSError:
+            pass
+
+
+origin = http.server.ThreadingHTTPServer(("127.0.0.1", 0), Origin)
+threading.Thread(target=origin.serve_forever, daemon=True).start()
+origin_url = f"http://127.0.0.1:{origin.server_address[1]}"
+primary = start_upstream("primary")
+backup = start_upstream("backup")
+
+
+def get(proxy_address, path):
+    opener = urllib.request.build_opener(urllib.request.ProxyHandler({"http": f"http://{proxy_address}"}))
+    with opener.open(origin_url + path) as response:
+        return response.headers["X-Upstream"], response.read()
+
+
+def tunnel(proxy_address):
+    with socket.create_connection(proxy_address) as connection:
+        connection.sendall(f"CONNECT 127.0.0.1:{origin.server_address[1]} HTTP/1.1\r\n\r\n".encode())
+        infile = connection.makefile("rb")
+        status = infile.readline()
+        infile.readline()
+        connection.sendall(b"GET /tunnel HTTP/1.1\r\nHost: origin\r\nConnection: close\r\n\r\n")
+        return status.split()[1], infile.read().endswith(b"hello /tunnel")
+
+
+async def main():
+    forwarder = Forwarder([f"127.0.0.1:{primary.server_address[1]}", f"127.0.0.1:{backup.server_address[1]}"],
+                          port=0)
+    await forwarder.start()
+    address = "%s:%d" % forwarder.address
+    failures = []
+
+    for index in range(5):
+        if await asyncio.to_thread(get, address, f"/{index}") != ("primary", f"hello /{index}".encode()):
+            failures.append("forwarding through the primary")
+    if len(primary.connections) != 1:
+        failures.append(f"connection reuse ({len(primary.connections)} connections for 5 requests)")
+    if await asyncio.to_thread(tunnel, forwarder.address) != (b"200", True):
+        failures.append("CONNECT tunnel")
+
+    stop_upstream(primary)
+    start = time.perf_counter()
+    if (await asyncio.to_thread(get, address, "/failover"))[0] != "backup":
+        failures.append("failover to the backup")
+    print(f"Failover took {(time.perf_counter() - start) * 1000:.1f} ms")
+
+    start_upstream("primary", forwarder.upstreams[0].port)
+    await asyncio.sleep(2.5)
+    if (await asyncio.to_thread(get, address, "/recovered"))[0] != "primary":
+        failures.append("returning to the primary")
+    await forwarder.stop()
+    return failures
+
+
+failures = asyncio.run(main())
+if failures:
+    print(f"Failed: {', '.join(failures)}")
+    sys.exit(1)
+print("Forwarding, connection reuse, tunnels and failover work.")
@@ -0,0 +1,43 @@
+import subprocess
+import sys
+import os
+
+# Measures what importing main.pyw costs with `python -X importtime` and checks that the modules which are only
+# needed for updates are not part of the startup imports. Run from the repository root: python test/import_time.py
+
+root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+deferred = ["requests", "packaging", "modules.UpdateUi", "modules.SettingsUi", "modules.WifiUi",
+            "modules.releases", "modules.downloader", "modules.staging", "modules.wifi"]
+
+# run_path with another run_name executes the imports of main.pyw without opening the window
+result = subprocess.run(
+    [sys.executable, "-X", "importtime", "-c",
+     "import runpy; runpy.run_path('main.pyw', run_name='import_time')"],
+    cwd=root, capture_output=True, text=True)
+
+imports = []
+for line in result.stderr.splitlines():
+    # import time: self [us] | cumulative | imported package
+    if not line.startswith("import time:") or "imported package" in line:
+        continue
+    _, cumulative, name = line[len("import time:"):].split("|")
+    # nested imports are indented by two spaces per level
+    imports.append((int(cumulative), name[1:].rstrip()))
+
+if result.returncode != 0:
+    print(result.stderr.splitlines()[-1])
+    sys.exit(1)
+
+# top level imports are the ones without indentation
+top_level = sorted(((cumulative, name.strip()) for cumulative, name in imports
+                    if not name.startswith(" ")), reverse=True)
+print(f"Total import time: {sum(c for c, _ in top_level) / 1000:.1f} ms")
+for cumulative, name in top_level[:15]:
+    print(f"{cumulative / 1000:8.1f} ms  {name}")
+
+imported = {name.strip() for _, name in imports}
+eager = [name for name in deferred if name in imported]
+if eager:
+    print(f"Imported at startup although they are deferred: {', '.join(eager)}")
+    sys.exit(1)
+print("Update and tab modules are deferred.")
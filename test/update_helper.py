@@ -0,0 +1,73 @@
+import os
+import sys
+import time
+import shutil
+import zipfile
+import tempfile
+import threading
+import subprocess
+
+# Runs the bash update helper against a dummy target: it has to wait for a stand-in process to exit, swap the new
+# version in and report every step as a JSON line, also when the paths contain quotes and backslashes. A second run
+# with an archive that lacks the target has to report the failure. Needs bash, tail and unzip.
+# Run from the repository root: python test/update_helper.py
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from modules import updater  # noqa: E402
+
+
+def run_helper(directory, archive_path, target_path):
+    """Runs the helper for a process that lives for a second, returns the status lines and the seconds it waited."""
+    status_file = os.path.join(directory, "status.jsonl")
+    script_path = os.path.join(directory, "update.sh")
+    app = subprocess.Popen(["sleep", "1"])
+    # reap the stand-in as soon as it exits, a zombie would still count as running
+    threading.Thread(target=app.wait, daemon=True).start()
+    updater.write_bash_updater(script_path, app.pid, archive_path, target_path, status_file, relaunch=False)
+    start = time.perf_counter()
+    subprocess.run(["bash", script_path], check=False)
+    return updater.read_status(status_file), time.perf_counter() - start
+
+
+def make_archive(path, entries):
+    with zipfile.ZipFile(path, "w") as archive:
+        for name, content in entries.items():
+            archive.writestr(name, content)
+
+
+root = tempfile.mkdtemp()
+failures = []
+try:
+    directory = os.path.join(root, 'we"ird\\path')
+    os.makedirs(directory)
+    target_path = os.path.join(directory, "app")
+    with open(target_path, "w") as outfile:
+        outfile.write("old")
+
+    archive_path = os.path.join(directory, "release.zip")
+    make_archive(archive_path, {"app": "new"})
+    entries, waited = run_helper(directory, archive_path, target_path)
+    print(f"The helper finished {waited:.2f} s after the stand-in was started")
+    if [entry["step"] for entry in entries] != ["exited", "extract", "swap", "done"]:
+        failures.append(f"status lines of the update ({entries})")
+    elif not all(entry["ok"] for entry in entries) or archive_path not in entries[1]["message"]:
+        failures.append(f"status of the update ({entries})")
+    with open(target_path) as infile:
+        if infile.read() != "new":
+            failures.append("swapping the target")
+    if waited > 2:
+        failures.append(f"waiting for the process to exit ({waited:.2f} s)")
+
+    broken_path = os.path.join(directory, "broken.zip")
+    make_archive(broken_path, {"other": "new"})
+    os.remove(os.path.join(directory, "status.jsonl"))
+    entries, _ = run_helper(directory, broken_path, target_path)
+    if [(entry["step"], entry["ok"]) for entry in entries] != [("exited", True), ("extract", False)]:
+        failures.append(f"reporting a failed update ({entries})")
+finally:
+    shutil.rmtree(root, ignore_errors=True)
+
+if failures:
+    print(f"Failed: {', '.join(failures)}")
+    sys.exit(1)
+print("The update helper waits, swaps and reports every step.")